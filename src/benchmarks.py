@@ -0,0 +1,322 @@
+# -----------------------------------------------------------
+# Benchmarks of sampler throughput, prior cost, semantic deduplication,
+# data loading, end-to-end training and startup of the headless training
+# path. Results are appended to a history file (one JSON record per run),
+# and a run can be compared against an earlier one to flag regressions.
+#
+# Usage: python benchmarks.py [-label NAME] [-quick] [-startup_budget SECONDS]
+#        python benchmarks.py -compare BASELINE_LABEL [-candidate LABEL]
+# -----------------------------------------------------------
+
+# Python Imports
+import os
+import sys
+import argparse
+import json
+import time
+import random
+import shutil
+import platform
+import subprocess
+import tempfile
+
+# Personal Code
+import data_handling
+import grammars
+import hypotheses
+import run_experiment
+import synthetic_data
+
+# LOTLib
+from LOTlib3.Samplers.MetropolisHastings import MetropolisHastingsSampler
+
+# Other
+import numpy as np
+
+# Metrics where larger values are better (for all others, e.g. times, smaller is better)
+HIGHER_IS_BETTER = ('samples_per_s', 'contexts_per_s')
+
+def parse_args():
+    """
+    Parse all command line arguments
+
+    Parameters:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The list of arguments passed in
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-history",type=str, help = "Path of the benchmark history (one JSON record per run)", default ="./../benchmarks/history.jsonl")
+    parser.add_argument("-label",type=str, help = "Name of this run in the history (e.g. a branch or change name)", default=None)
+    parser.add_argument("-seed",type=int, help = "Random seed (fixed, so runs are comparable)", default=0)
+    parser.add_argument("-quick",action="store_true", help = "Smaller benchmarks (for a quick check, not comparable with full runs)")
+    parser.add_argument("-compare",type=str, help = "Instead of running benchmarks, compare a run against the run with this label", default=None)
+    parser.add_argument("-candidate",type=str, help = "Label of the run compared against the baseline (the latest run if not given)", default=None)
+    parser.add_argument("-threshold",type=float, help = "Relative change counted as a regression (0.1 = 10%% worse)", default=0.1)
+    parser.add_argument("-startup_budget",type=float, help = "Maximum startup time in seconds of the headless training path (imports, data and context space), the run fails if it is exceeded", default=5.0)
+    args = parser.parse_args()
+    return args
+
+def reseed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+def clear_caches():
+    # Start each benchmark with empty in-process caches
+    capacity = hypotheses.prior_components.capacity
+    hypotheses.resize_caches(0)
+    hypotheses.resize_caches(capacity)
+
+def random_data(all_contexts, n, seed):
+    """
+    Random contexts from all_contexts with random labels.
+
+    Returns:
+        - data (list): A list of n FunctionData objects
+    """
+    rng = np.random.RandomState(seed)
+    index = rng.randint(0, len(all_contexts), n)
+    return data_handling.make_contexts(all_contexts.counts[index], (rng.random_sample(n) < 0.5).tolist(), 0.99)
+
+def bench_mh_throughput(grammar, all_contexts, lam_1, lam_2, steps, seed):
+    """
+    MH samples per second on 32 contexts, from a fresh hypothesis with empty caches.
+    """
+    clear_caches()
+    reseed(seed)
+    data = random_data(all_contexts, 32, seed)
+    h0 = hypotheses.create_hypothesis("A", grammar, lam_1, lam_2, all_contexts)
+    start = time.perf_counter()
+    n = 0
+    for h in MetropolisHastingsSampler(h0, data, steps=steps):
+        n += 1
+    seconds = time.perf_counter() - start
+    return {'samples_per_s': n / seconds, 'seconds': seconds}
+
+def bench_prior(grammar, all_contexts, n, seed):
+    """
+    Latency of compute_prior (with degrees, so nothing is skipped) on hypotheses generated from the grammar,
+    uncached (first call per expression) and cached (a second hypothesis with the same expression).
+    """
+    clear_caches()
+    reseed(seed)
+    h0 = hypotheses.create_hypothesis("A", grammar, 1.0, 1.0, all_contexts)
+    values = [grammar.generate() for _ in range(n)]
+
+    hs = [h0.__copy__(value=v) for v in values]
+    start = time.perf_counter()
+    for h in hs:
+        h.compute_prior()
+    uncached = (time.perf_counter() - start) / n
+
+    hs = [h0.__copy__(value=v) for v in values]
+    start = time.perf_counter()
+    for h in hs:
+        h.compute_prior()
+    cached = (time.perf_counter() - start) / n
+    return {'uncached_s': uncached, 'cached_s': cached}
+
+def bench_semantic_dedup(grammar, all_contexts, sizes, seed):
+    """
+    Cost of adding hypotheses to fixed spaces of growing size: by signature (as mcmc does) and by
+    pairwise semantic_equiv against every hypothesis in the space.
+    """
+    clear_caches()
+    reseed(seed)
+    h0 = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+    results = {}
+    for size in sizes:
+        hs = [h0.__copy__(value=grammar.generate()) for _ in range(size)]
+        for h in hs:
+            h.signature()
+
+        start = time.perf_counter()
+        space = {}
+        for h in hs:
+            sig = h.signature()
+            if sig not in space:
+                space[sig] = h
+        results['signature_' + str(size) + '_s'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pairwise = []
+        for h in hs:
+            if not any(h.semantic_equiv(other) for other in pairwise):
+                pairwise.append(h)
+        results['pairwise_' + str(size) + '_s'] = time.perf_counter() - start
+    return results
+
+def bench_load(participants, contexts, seed):
+    """
+    data_handling.load throughput (contexts per second) on generated participant files.
+    """
+    data_dir = tempfile.mkdtemp()
+    try:
+        synthetic_data.generate("card_gteq(cardinality_(intersection_(A, B)), 3)", participants, contexts, data_dir, seed=seed)
+        start = time.perf_counter()
+        data, n_contexts = data_handling.load(data_dir + "/", 0.99)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(data_dir)
+    return {'contexts_per_s': len(data) / seconds, 'seconds': seconds}
+
+def bench_train(grammar, all_contexts, participants, contexts, steps, seed):
+    """
+    End-to-end run_experiment.train time (one process) on random data, interned in all contexts as run_experiment.run does.
+    """
+    clear_caches()
+    reseed(seed)
+    data = data_handling.intern(random_data(all_contexts, participants * contexts, seed), all_contexts)
+    h0 = hypotheses.create_hypothesis("A", grammar, 1.0, 1.0, all_contexts)
+    out = tempfile.mkdtemp() + "/"
+    os.makedirs(out + "bench/")
+    stdout = sys.stdout
+    try:
+        sys.stdout = open(os.devnull, 'w')
+        start = time.perf_counter()
+        run_experiment.train(data, h0, contexts, out, "bench", steps, seed=seed)
+        seconds = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(out)
+    return {'seconds': seconds}
+
+def bench_startup(participants, contexts, seed):
+    """
+    Startup time of the headless training path in a new process (run_experiment.py -no_plot): imports, and
+    the time from the start of the run until training begins (as recorded in the run's profile).
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+        synthetic_data.generate("card_gteq(cardinality_(intersection_(A, B)), 3)", participants, contexts, tmp + "/data/synthetic", seed=seed)
+        subprocess.run([sys.executable, "run_experiment.py", "-exp_type", "synthetic", "-data_dir", tmp + "/data/", "-out", tmp + "/results/",
+                        "-sample_steps", "1", "-seed", str(seed), "-checkpoint_every", "0", "-no_plot", "-profile"],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL, check=True)
+        exp_id = os.listdir(tmp + "/results/")[0]
+        with open(tmp + "/results/" + exp_id + "/" + exp_id + "_profile.json", 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    finally:
+        shutil.rmtree(tmp)
+    return {'import_s': profile['import_seconds'], 'seconds': profile['import_seconds'] + profile['startup_seconds']}
+
+def run_benchmarks(seed, quick):
+    """
+    Run every benchmark.
+
+    Parameters:
+        - seed (int): Random seed
+        - quick (bool): Run smaller benchmarks
+
+    Returns:
+        - results (dict): Metrics of each benchmark
+    """
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 8)
+    steps = 200 if quick else 2000
+    results = {}
+
+    for lam_1, lam_2 in [(0.0, 0.0), (1.0, 1.0)]:
+        name = "mh_throughput_" + str(lam_1) + "_" + str(lam_2)
+        print("Running", name)
+        results[name] = bench_mh_throughput(grammar, all_contexts, lam_1, lam_2, steps, seed)
+
+    print("Running compute_prior")
+    results['compute_prior'] = bench_prior(grammar, all_contexts, 50 if quick else 500, seed)
+
+    print("Running semantic_dedup")
+    results['semantic_dedup'] = bench_semantic_dedup(grammar, all_contexts, [10, 100] if quick else [10, 100, 1000], seed)
+
+    for participants, contexts in ([(10, 96)] if quick else [(10, 96), (100, 96), (100, 384)]):
+        name = "load_" + str(participants) + "x" + str(contexts)
+        print("Running", name)
+        results[name] = bench_load(participants, contexts, seed)
+
+    for participants, contexts in ([(1, 8)] if quick else [(1, 16), (2, 16), (2, 32)]):
+        name = "train_" + str(participants) + "x" + str(contexts)
+        print("Running", name)
+        results[name] = bench_train(grammar, all_contexts, participants, contexts, 20 if quick else 100, seed)
+
+    print("Running startup")
+    results['startup'] = bench_startup(1 if quick else 10, 96, seed)
+
+    return results
+
+def git_commit():
+    # Commit benchmarked (None if not in a git repository)
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
+
+def find_run(history, label):
+    # Latest run with this label (the latest run if label is None)
+    for record in reversed(history):
+        if label is None or record['label'] == label:
+            return record
+    raise Exception("No benchmark run labeled \'" + str(label) + "\' in the history.")
+
+def compare(baseline, candidate, threshold):
+    """
+    Compare every metric of two benchmark runs.
+
+    Parameters:
+        - baseline (dict): The earlier run's record
+        - candidate (dict): The run checked for regressions
+        - threshold (float): Relative change counted as a regression
+
+    Returns:
+        - regressions (list (str)): Metrics that got worse by more than threshold
+    """
+    if baseline['quick'] != candidate['quick']:
+        print("WARNING: Comparing a quick run with a full run")
+    regressions = []
+    for bench in sorted(candidate['results']):
+        for metric, value in sorted(candidate['results'][bench].items()):
+            old = baseline['results'].get(bench, {}).get(metric)
+            if old is None or old == 0:
+                continue
+            change = (value - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = "REGRESSION" if worse > threshold else ""
+            print(bench + "." + metric + ":", round(old, 6), "->", round(value, 6), "(" + ("%+.1f" % (100 * change)) + "%)", flag)
+            if worse > threshold:
+                regressions.append(bench + "." + metric)
+    return regressions
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    if args.compare is not None:
+        history = read_history(args.history)
+        regressions = compare(find_run(history, args.compare), find_run(history, args.candidate), args.threshold)
+        print(len(regressions), "regressions")
+        sys.exit(1 if len(regressions) > 0 else 0)
+
+    record = {'label': args.label,
+              'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'seed': args.seed,
+              'quick': args.quick,
+              'results': run_benchmarks(args.seed, args.quick)}
+
+    os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+    with open(args.history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+    for bench in sorted(record['results']):
+        print(bench, record['results'][bench])
+
+    # The startup budget is checked on every run (not only against a baseline)
+    startup = record['results']['startup']['seconds']
+    if startup > args.startup_budget:
+        print("Startup took", round(startup, 3), "s, over the budget of", args.startup_budget, "s")
+        sys.exit(1)
@@ -0,0 +1,198 @@
+# -----------------------------------------------------------
+# Caches for values computed per hypothesis expression that are expensive
+# to recompute (prior components, degrees of monotonicity/conservativity).
+# -----------------------------------------------------------
+
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+
+def grammar_hash(grammar):
+    """
+    Hash of a grammar's rules and their probabilities.
+
+    Parameters:
+        - grammar (LOTLib3.Grammar): The grammar
+
+    Returns:
+        - (str): Hex digest identifying the grammar
+    """
+    rules = []
+    for nt in sorted(grammar.rules.keys()):
+        for r in grammar.rules[nt]:
+            rules.append(repr((r.nt, r.name, r.to, r.p)))
+    return hashlib.sha1("\n".join(sorted(rules)).encode("utf-8")).hexdigest()
+
+
+def contexts_hash(all_contexts):
+    """
+    Hash of a context space (the counts of every context).
+
+    Parameters:
+        - all_contexts (data_handling.ContextSpace): The context space
+
+    Returns:
+        - (str): Hex digest identifying the context space
+    """
+    h = hashlib.sha1()
+    h.update(repr((all_contexts.object_types, all_contexts.counts.shape)).encode("utf-8"))
+    h.update(all_contexts.counts.astype("int64").tobytes())
+    return h.hexdigest()
+
+
+class LRUCache(object):
+    """
+    In-process cache holding at most capacity entries, evicting the least recently used
+    entry when full. Counts hits and misses.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Look up a key, marking it as most recently used.
+
+        Returns:
+            - The value stored for key, or default if it is not in the cache
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """
+        Returns:
+            - (dict): Number of hits and misses and the hit rate since this cache was created
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total > 0 else 0.0}
+
+
+class PriorCache(object):
+    """
+    Persistent cache (an SQLite database) of prior components per hypothesis expression:
+    grammar log probability, degree of monotonicity, degree of conservativity and the
+    truth-table signature over all_contexts. Entries are keyed by the expression and by
+    hashes of the grammar and of all_contexts, so one database can be shared by runs with
+    different grammars or context spaces, and by many processes at once (SQLite's
+    write-ahead log allows concurrent readers and writers). When the database holds more
+    than max_entries entries, the least recently used ones are evicted (checked every 100 writes).
+    """
+
+    def __init__(self, path, grammar, all_contexts, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.namespace = grammar_hash(grammar) + "_" + contexts_hash(all_contexts)
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        self.touched = set()  # Expressions hit since the last write (their last use is updated in bulk)
+        self.puts = 0
+
+    def __getstate__(self):
+        # Connections cannot be shared between processes, each opens its own
+        state = dict(self.__dict__)
+        state['connection'] = None
+        state['touched'] = set()
+        return state
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60.0)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS priors ("
+                                    "namespace TEXT, expression TEXT, log_probability REAL, "
+                                    "degree_monotonicity REAL, degree_conservativity REAL, signature BLOB, "
+                                    "last_used REAL, PRIMARY KEY (namespace, expression))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS priors_last_used ON priors (last_used)")
+            self.connection.commit()
+        return self.connection
+
+    def get(self, expression):
+        """
+        Look up the prior components of an expression.
+
+        Parameters:
+            - expression (str): The hypothesis expression, i.e. str(h.value)
+
+        Returns:
+            - entry (dict): log_probability, degree_monotonicity, degree_conservativity (None if never
+            computed) and signature, or None if the expression is not in the cache
+        """
+        row = self.connect().execute("SELECT log_probability, degree_monotonicity, degree_conservativity, signature "
+                                     "FROM priors WHERE namespace = ? AND expression = ?", (self.namespace, expression)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched.add(expression)
+        return {'log_probability': row[0],
+                'degree_monotonicity': row[1],
+                'degree_conservativity': row[2],
+                'signature': bytes(row[3]) if row[3] is not None else None}
+
+    def put(self, expression, entry):
+        """
+        Store the prior components of an expression (see get), evicting the least recently
+        used entries if the cache is over its size cap.
+        """
+        now = time.time()
+        connection = self.connect()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO priors VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (self.namespace, expression, entry['log_probability'], entry['degree_monotonicity'],
+                                entry['degree_conservativity'], entry['signature'], now))
+            self.update_last_used(now)
+
+            # Check the size cap every so often (counting rows is not free)
+            self.puts += 1
+            if self.puts % 100 == 0:
+                n = connection.execute("SELECT COUNT(*) FROM priors").fetchone()[0]
+                if n > self.max_entries:
+                    connection.execute("DELETE FROM priors WHERE rowid IN "
+                                       "(SELECT rowid FROM priors ORDER BY last_used LIMIT ?)", (n - self.max_entries,))
+
+    def update_last_used(self, now):
+        # Mark the entries hit since the last write as used (for eviction)
+        self.connect().executemany("UPDATE priors SET last_used = ? WHERE namespace = ? AND expression = ?",
+                                   [(now, self.namespace, e) for e in self.touched])
+        self.touched = set()
+
+    def stats(self):
+        """
+        Returns:
+            - (dict): Number of hits and misses and the hit rate since this cache was created
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total > 0 else 0.0}
+
+    def close(self):
+        if self.connection is not None:
+            with self.connection:
+                self.update_last_used(time.time())
+            self.connection.close()
+            self.connection = None
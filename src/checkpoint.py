@@ -0,0 +1,143 @@
+# -----------------------------------------------------------
+# Checkpoints of training, so interrupted runs can be resumed: per model,
+# the number of contexts done, the fixed hypothesis space (as expressions
+# with priors and signatures), random states and the chain state.
+# -----------------------------------------------------------
+
+import os
+import json
+import pickle
+import base64
+import random
+
+# Personal Code
+import compiler
+import data_handling
+
+# Other
+import numpy as np
+
+
+class RestoredHypothesis(object):
+    """
+    A hypothesis of a fixed hypothesis space restored from a checkpoint. It has what the fixed
+    space is used for after sampling (prior, signature and likelihoods), with the expression
+    compiled into a vectorized function (see compiler.py).
+    """
+
+    def __init__(self, expression, prior, signature):
+        self.value = expression
+        self.prior = prior
+        self.sig = signature
+        self.f = compiler.compile_value(compiler.parse_expression(expression))
+
+    def compute_prior(self):
+        return self.prior
+
+    def signature(self):
+        return self.sig
+
+    def eval_counts(self, counts, contexts=None):
+        # Truth value in many contexts (as HypothesisA.eval_counts)
+        return self.f(counts[:, 0, :], counts[:, 1, :])
+
+    def likelihood_vector(self, data):
+        """
+        Log likelihood of every datum (as HypothesisA.likelihood_vector).
+        """
+        if len(data) == 0:
+            return np.zeros(0)
+        counts = data_handling.context_counts(data)
+        truth = self.f(counts[:, 0, :], counts[:, 1, :])
+        outputs = np.array([datum.output for datum in data], dtype=bool)
+        alpha = np.array([datum.alpha for datum in data], dtype=float)
+        return np.log(alpha * (truth == outputs) + (1.0 - alpha) / 2.0)
+
+    def __str__(self):
+        return "lambda A, B: " + self.value
+
+    __repr__ = __str__
+
+
+def path(out, exp_id, i):
+    """
+    Path of the checkpoint of model i (counting from 0) of an experiment.
+    """
+    return out + exp_id + "/checkpoints/model_" + str(i + 1) + ".json"
+
+def save(checkpoint_path, state):
+    """
+    Write a checkpoint atomically: it is written to a temporary file which then replaces the
+    checkpoint, so an interruption leaves either the old or the new checkpoint, never a partial one.
+
+    Parameters:
+        - checkpoint_path (str): Path of the checkpoint
+        - state (dict): The state to save (JSON serializable)
+    """
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    tmp = checkpoint_path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, checkpoint_path)
+
+def load(checkpoint_path):
+    """
+    Returns:
+        - state (dict): The checkpoint's state, None if there is no checkpoint
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def run_options(args, seed, ignored=()):
+    """
+    Options a run's checkpoints are written with, which it must be resumed with: all arguments
+    except the ignored ones (that do not change results), and the seed. Read back as from a
+    checkpoint, so options of a run and of its checkpoints compare equal.
+
+    Parameters:
+        - args (argparse.Namespace): The run's arguments
+        - seed (int): The run's random seed
+        - ignored (tuple (str)): Arguments left out
+
+    Returns:
+        - options (dict): The run's options
+    """
+    options = {name: value for name, value in vars(args).items() if name not in ignored}
+    options['seed'] = seed
+    return json.loads(json.dumps(options, sort_keys=True))
+
+def encode_space(fixed_h_space):
+    """
+    Serialize a fixed hypothesis space (hypotheses keyed by signature) as expressions with priors.
+    """
+    return [{'expression': str(h.value), 'prior': h.prior, 'signature': sig.hex()} for sig, h in fixed_h_space.items()]
+
+def decode_space(entries):
+    """
+    Restore a fixed hypothesis space saved with encode_space (as RestoredHypothesis objects).
+    """
+    return {bytes.fromhex(e['signature']): RestoredHypothesis(e['expression'], e['prior'], bytes.fromhex(e['signature'])) for e in entries}
+
+def encode_rng():
+    # State of Python's and NumPy's global random generators
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    version, internal, gauss_next = random.getstate()
+    return {'python': [version, list(internal), gauss_next],
+            'numpy': [name, keys.tolist(), pos, has_gauss, cached_gaussian]}
+
+def restore_rng(state):
+    version, internal, gauss_next = state['python']
+    random.setstate((version, tuple(internal), gauss_next))
+    name, keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+
+def encode_object(obj):
+    # Objects that cannot be written as expressions (e.g. the state of a chain) are pickled
+    return base64.b64encode(pickle.dumps(obj)).decode('ascii')
+
+def decode_object(text):
+    return pickle.loads(base64.b64decode(text.encode('ascii')))
@@ -0,0 +1,192 @@
+# -----------------------------------------------------------
+# Compiles hypotheses built from the grammars in grammars.py into
+# vectorized NumPy functions over many contexts at once.
+# -----------------------------------------------------------
+
+import ast
+import numpy as np
+
+# Vectorized versions of the primitives. Sets are arrays of counts (..., n_types), cardinalities
+# and booleans are arrays with one element per context.
+OPERATIONS = {
+    # Set operations
+    'subset_': lambda x, y: np.all(x <= y, axis=-1),
+    'intersection_': np.minimum,
+    'union_': np.maximum,
+    'setdifference_': lambda x, y: np.maximum(x - y, 0),
+    'cardinality_': lambda x: np.sum(x, axis=-1),
+
+    # Cardinality comparisons (primitives.py)
+    'card_gt': np.greater,
+    'card_gteq': np.greater_equal,
+    'card_lt': np.less,
+    'card_lteq': np.less_equal,
+    'card_eq': np.equal,
+
+    # Basic boolean logic
+    'and_': np.logical_and,
+    'or_': np.logical_or,
+    'not_': np.logical_not,
+}
+
+
+class CompileError(Exception):
+    """
+    Raised when a hypothesis uses a primitive or terminal with no vectorized version.
+    """
+    pass
+
+
+def compile_value(value):
+    """
+    Compile a hypothesis value (a LOTLib3 FunctionNode) into a single NumPy expression.
+
+    Parameters:
+        - value (LOTlib3.FunctionNode): The value of a hypothesis, i.e. h.value
+
+    Returns:
+        - f (function): f(A, B) takes arrays of set A and set B counts of shape (n_contexts, n_types)
+        and returns a boolean array with the truth value of the hypothesis in every context
+
+    Raises:
+        - CompileError: If the value uses a primitive not in OPERATIONS
+    """
+    g = compile_node(value)
+
+    def f(A, B):
+        return np.broadcast_to(np.asarray(g(A, B), dtype=bool), (len(A),))
+
+    return f
+
+
+def compile_node(node):
+    """
+    Recursively compile a node of a hypothesis tree.
+
+    Parameters:
+        - node (LOTlib3.FunctionNode or str): Node to compile
+
+    Returns:
+        - (function): Function of the set A and set B count arrays returning the node's value
+    """
+    name = getattr(node, 'name', node)
+    args = getattr(node, 'args', None)
+
+    # Terminals
+    if not args:
+        if name == 'A':
+            return lambda A, B: A
+        if name == 'B':
+            return lambda A, B: B
+        if name in ('True', 'False'):
+            b = (name == 'True')
+            return lambda A, B: b
+        try:
+            n = int(name)
+        except (TypeError, ValueError):
+            raise CompileError("Cannot compile terminal \'" + str(name) + "\'")
+        return lambda A, B: n
+
+    if name not in OPERATIONS:
+        raise CompileError("Cannot compile primitive \'" + str(name) + "\'")
+    op = OPERATIONS[name]
+    fs = [compile_node(a) for a in args]
+
+    if len(fs) == 1:
+        f = fs[0]
+        return lambda A, B: op(f(A, B))
+    elif len(fs) == 2:
+        f, g = fs
+        return lambda A, B: op(f(A, B), g(A, B))
+    else:
+        raise CompileError("Cannot compile primitive \'" + str(name) + "\' with " + str(len(fs)) + " arguments")
+
+
+def evaluate_value(value, A, B, values):
+    """
+    Evaluate a hypothesis value on arrays of set counts (as compile_value(value)(A, B)), reusing the
+    values of subtrees evaluated before. Proposals regenerate one subtree of a hypothesis and keep the
+    rest, so usually only the nodes on the path from the regenerated subtree to the root are computed.
+
+    Parameters:
+        - value (LOTlib3.FunctionNode): The value of a hypothesis, i.e. h.value
+        - A, B (numpy array (int)): Set A and set B counts of shape (n_contexts, n_types), always the same
+        contexts for the same values cache
+        - values (cache.LRUCache): Value of each subtree on these contexts, keyed by the subtree's expression
+
+    Returns:
+        - truth (numpy array (bool)): The truth value of the hypothesis in every context
+
+    Raises:
+        - CompileError: If the value uses a primitive not in OPERATIONS
+    """
+    v = evaluate_node(value, A, B, values)
+    return np.broadcast_to(np.asarray(v, dtype=bool), (len(A),))
+
+
+def evaluate_node(node, A, B, values):
+    """
+    Recursively evaluate a node of a hypothesis tree (see evaluate_value). A node whose expression
+    (e.g. cardinality_(intersection_(A, B))) is in values is not walked any further.
+
+    Returns:
+        - value: The node's value (set counts, cardinalities or booleans per context, or a constant)
+    """
+    name = getattr(node, 'name', node)
+    args = getattr(node, 'args', None)
+
+    # Terminals are not cached
+    if not args:
+        return compile_node(node)(A, B)
+
+    if name not in OPERATIONS:
+        raise CompileError("Cannot compile primitive \'" + str(name) + "\'")
+    if len(args) > 2:
+        raise CompileError("Cannot compile primitive \'" + str(name) + "\' with " + str(len(args)) + " arguments")
+
+    key = str(node)
+    v = values.get(key)
+    if v is None:
+        v = OPERATIONS[name](*[evaluate_node(a, A, B, values) for a in args])
+        values.put(key, v)
+    return v
+
+
+class Node(object):
+    """
+    A node of a parsed expression, with the name and args of a LOTLib3 FunctionNode (so it can be compiled).
+    """
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __str__(self):
+        return self.name + "(" + ", ".join(str(a) for a in self.args) + ")"
+
+
+def parse_expression(expression):
+    """
+    Parse an expression written with the grammar's primitives, as hypothesis values are printed
+    (i.e. str(h.value)), e.g. card_gteq(cardinality_(intersection_(A, B)), 3).
+
+    Parameters:
+        - expression (str): The expression
+
+    Returns:
+        - (Node or str): The expression's tree (terminals are strings), which compile_value compiles
+    """
+    def convert(e):
+        if isinstance(e, ast.Call) and isinstance(e.func, ast.Name):
+            return Node(e.func.id, [convert(a) for a in e.args])
+        if isinstance(e, ast.Name):
+            return e.id
+        if isinstance(e, ast.Constant):
+            return str(e.value)
+        raise CompileError("Cannot parse \'" + ast.dump(e) + "\' in \'" + expression + "\'")
+
+    try:
+        tree = ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError:
+        raise CompileError("Cannot parse \'" + expression + "\'")
+    return convert(tree)
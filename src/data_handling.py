@@ -6,107 +6,376 @@
 # -----------------------------------------------------------
 import os
 import numpy as np
-from multiset import *
-from itertools import combinations_with_replacement
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import re
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import itertools
+from itertools import combinations
 
 # LOTLib3
 from LOTlib3.DataAndObjects import FunctionData
 
+# Object types (color_shape) a set can contain, one count per type
+OBJECT_TYPES = ['red_3', 'blue_3', 'red_100', 'blue_100']
+
+
+class CountSet(object):
+    """
+    A multiset of objects stored as a vector of counts per object type (see OBJECT_TYPES).
+    The counts are usually a view into a row of a larger context array, so building a
+    context does not allocate per object. Set operations follow multiset semantics:
+        - intersection = elementwise min
+        - union = elementwise max
+        - difference = elementwise subtraction (floored at 0)
+        - subset = elementwise <=
+        - cardinality (len) = sum of counts
+    """
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts):
+        self.counts = counts
+
+    def intersection(self, other):
+        return CountSet(np.minimum(self.counts, other.counts))
+
+    def union(self, other):
+        return CountSet(np.maximum(self.counts, other.counts))
+
+    def difference(self, other):
+        return CountSet(np.maximum(self.counts - other.counts, 0))
+
+    def issubset(self, other):
+        return bool(np.all(self.counts <= other.counts))
+
+    def issuperset(self, other):
+        return bool(np.all(self.counts >= other.counts))
+
+    __and__ = intersection
+    __or__ = union
+    __sub__ = difference
+    __le__ = issubset
+    __ge__ = issuperset
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def __eq__(self, other):
+        if isinstance(other, CountSet):
+            return bool(np.array_equal(self.counts, other.counts))
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.counts.tobytes())
+
+    def __str__(self):
+        return "{" + ", ".join(t for t, c in zip(OBJECT_TYPES, self.counts) for _ in range(c)) + "}"
+
+    def __repr__(self):
+        return "CountSet(" + str(self) + ")"
+
+
+def make_contexts(counts, labels=None, alpha=1.0):
+    """
+    Wrap rows of a context count array as LOTLib FunctionData objects whose inputs are
+    CountSet views (A, B) into the array.
+
+    Parameters:
+        - counts (numpy array (int)): Array of shape (n, 2, len(OBJECT_TYPES)), counts of set A and set B per context
+        - labels (list (bool)): Output label per context (None if unlabeled)
+        - alpha (float): Assumed noisiness of data
+
+    Returns:
+        - contexts (list): A list of FunctionData objects
+    """
+    if labels is None:
+        labels = [None] * len(counts)
+    return [FunctionData(input=[CountSet(row[0]), CountSet(row[1])], output=label, alpha=alpha)
+            for row, label in zip(counts, labels)]
+
+
+def with_alpha(data, alpha):
+    """
+    Copy of loaded data with a different assumed noisiness (the contexts themselves are shared).
+
+    Parameters:
+        - data (list): A list of FunctionData objects
+        - alpha (float): Assumed noisiness of data
+
+    Returns:
+        - (list): A list of FunctionData objects with the same inputs and outputs
+    """
+    return [FunctionData(input=d.input, output=d.output, alpha=alpha) for d in data]
+
+def context_counts(data):
+    """
+    Stack the set A and set B counts of a list of contexts into one array.
+
+    Parameters:
+        - data (list): A list of FunctionData objects with CountSet inputs
+
+    Returns:
+        - counts (numpy array (int)): Array of shape (len(data), 2, len(OBJECT_TYPES))
+    """
+    if len(data) == 0:
+        return np.zeros((0, 2, len(OBJECT_TYPES)), dtype=int)
+    return np.array([(d.input[0].counts, d.input[1].counts) for d in data], dtype=int)
+
+
+class InternedData(list):
+    """
+    A list of FunctionData objects (as returned by load) with each datum interned in a table of
+    contexts (see ContextSpace): its index in the table, label and noisiness are kept as arrays.
+    Data where the same context is seen many times with the same label (e.g. by many humans) can
+    then be scored as distinct (context index, label, alpha) triples weighted by their counts, with
+    truth values gathered from a hypothesis' truth vector over the table (see HypothesisA.compute_likelihood).
+    Slices (e.g. the data seen up to a context) are InternedData as well.
+    """
+
+    def __init__(self, data, contexts, index, labels, alpha):
+        list.__init__(self, data)
+        self.contexts = contexts
+        self.index = index
+        self.labels = labels
+        self.alpha = alpha
+        self.distinct = None # (triples, inverse, counts), computed when first needed
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return InternedData(list.__getitem__(self, key), self.contexts, self.index[key], self.labels[key], self.alpha[key])
+        return list.__getitem__(self, key)
+
+    def __reduce__(self):
+        # Pickle (e.g. to send to worker processes) without the distinct triples
+        return (InternedData, (list(self), self.contexts, self.index, self.labels, self.alpha))
+
+    def triples(self):
+        """
+        Returns:
+            - triples (numpy array (float)): k x 3 array of the distinct (context index, label, alpha) in the data
+            - inverse (numpy array (int)): The triple of each datum
+            - counts (numpy array (int)): Number of data with each triple
+        """
+        if self.distinct is None:
+            keys = np.stack([self.index, self.labels, self.alpha], axis=1).astype(float).reshape(-1, 3)
+            triples, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+            self.distinct = (triples, inverse.reshape(-1), counts)
+        return self.distinct
+
+    def distinct_log_likelihoods(self, truth):
+        # Log likelihood of each distinct triple, given the truth value of a hypothesis in every context of the table
+        triples = self.triples()[0]
+        alpha = triples[:, 2]
+        return np.log(alpha * (truth[triples[:, 0].astype(int)] == triples[:, 1].astype(bool)) + (1.0 - alpha) / 2.0)
+
+    def log_likelihoods(self, truth):
+        """
+        Log likelihood of every datum (as HypothesisA.compute_single_likelihood on each datum).
+
+        Parameters:
+            - truth (numpy array (bool)): Truth value of the hypothesis in every context of the table
+
+        Returns:
+            - ll (numpy array (float)): The log likelihood of each datum
+        """
+        return self.distinct_log_likelihoods(truth)[self.triples()[1]]
+
+    def log_likelihood(self, truth):
+        """
+        Total log likelihood of the data, a sum over distinct triples weighted by their counts.
+        """
+        return float(np.dot(self.triples()[2], self.distinct_log_likelihoods(truth)))
+
+
+def intern(data, contexts):
+    """
+    Intern data in a table of contexts (see InternedData).
+
+    Parameters:
+        - data (list): A list of labeled FunctionData objects with CountSet inputs
+        - contexts (ContextSpace): The table of contexts, e.g. all possible contexts
+
+    Returns:
+        - data (InternedData): The same data interned, or the data unchanged (a list) if some
+        datum is not in the table or is unlabeled
+    """
+    index = contexts.index(context_counts(data))
+    if np.any(index < 0) or any(d.output is None for d in data):
+        return data
+    labels = np.array([d.output for d in data], dtype=bool)
+    alpha = np.array([d.alpha for d in data], dtype=float)
+    return InternedData(data, contexts, index, labels, alpha)
+
+
+class ContextSpace(object):
+    """
+    The set of all possible contexts together with a precomputed partial-order index
+    over them, so that truth in sub/super/conservation models can be read off a single
+    truth vector instead of rescanning all contexts for every context.
+        - counts is an (n, 2, len(object_types)) array of set A and set B counts per context
+        - object_types are the object types counted (OBJECT_TYPES by default)
+        - sub[i, j] is True if context j is a submodel of context i (B_j \subseteq B_i)
+        - super[i, j] is True if context j is a supermodel of context i (B_i \subseteq B_j)
+        - cons[i] is the index of the conservation model <A_i, A_i \cap B_i> of context i (-1 if not a possible context)
+    Iterating, indexing and len() behave like the plain list of contexts.
+    """
+
+    def __init__(self, counts, object_types=None):
+        self.counts = counts
+        self.object_types = OBJECT_TYPES if object_types is None else object_types
+        self.contexts_list = None # FunctionData objects (built when first needed)
+        self.lookup = None # Index of each context by its counts (built when first needed)
+
+        # Submodel/supermodel adjacency (reflexive, as in HypothesisA.sub_q_m and HypothesisA.super_q_m),
+        # one object type at a time so memory stays n x n
+        B = self.B
+        self.sub = np.ones((len(counts), len(counts)), dtype=bool)
+        for t in range(B.shape[1]):
+            self.sub &= B[np.newaxis, :, t] <= B[:, np.newaxis, t]
+        self.super = self.sub.T.copy()
+
+        # Conservation models
+        self.cons = self.index(np.stack([self.A, np.minimum(self.A, B)], axis=1))
+
+    def index(self, counts):
+        """
+        Find contexts in this space.
+
+        Parameters:
+            - counts (numpy array (int)): Array of shape (n, 2, n_types) of set A and set B counts per context
+
+        Returns:
+            - index (numpy array (int)): Index of each context in this space (-1 if it is not in this space)
+        """
+        if self.lookup is None:
+            self.lookup = {row.astype(np.int64).tobytes(): i for i, row in enumerate(self.counts)}
+        return np.array([self.lookup.get(row.astype(np.int64).tobytes(), -1) for row in counts], dtype=int)
+
+    @property
+    def contexts(self):
+        if self.contexts_list is None:
+            self.contexts_list = make_contexts(self.counts)
+        return self.contexts_list
+
+    @property
+    def A(self):
+        return self.counts[:, 0, :]
+
+    @property
+    def B(self):
+        return self.counts[:, 1, :]
+
+    def __iter__(self):
+        return iter(self.contexts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, i):
+        return self.contexts[i]
+
     
-def generate_possible_contexts(colors, shapes, max_num_objects):
+def generate_possible_contexts(colors, shapes, max_num_objects, a_shapes=None, b_colors=None, cache_dir="./../data/"):
     """
-    Generate possible contexts. Outputs to a csv file with the following code
-        - rt = red triangle
-        - bt = blue triangle
-        - rc = red circle
-        - bc = blue circle
-    Outputs to data folder
+    Generate possible contexts: every scene of at most max_num_objects objects of the given colors
+    and shapes, as its set A (objects of the shapes in a_shapes) and set B (objects of the colors in
+    b_colors). Objects in neither set do not change a context, so scenes only contain objects in A or B.
+    With the defaults, A = all triangles and B = all red objects (object types as in OBJECT_TYPES).
+
+    The space is cached in cache_dir (contexts_<key>.npz, keyed by the parameters) and generated only
+    if it is not there, in which case it is also written as a csv file for reading (contexts_<key>.csv).
 
     Parameters:
         - colors (list (str)) List of unique color names as seen in data (i.e. ['red', 'blue'])
         - shapes (list (float)) List of unique shape numbers (i.e. 3.0, 100.0)
         - max_num_objects (int) Maximum number of objects per context
+        - a_shapes (list (float)) Shapes of the objects in set A (the first shape if not given)
+        - b_colors (list (str)) Colors of the objects in set B (the first color if not given)
+        - cache_dir (str) Directory where generated context spaces are stored
 
     Returns:
-        - contexts (list (multiset)) Return all contexts as a list
+        - contexts (ContextSpace) Return all contexts along with their sub/supermodel index
     """
-    contexts = []
+    a_shapes = [shapes[0]] if a_shapes is None else a_shapes
+    b_colors = [colors[0]] if b_colors is None else b_colors
 
-    A_B_possible = [] # List of tuples of format (possible A set, [list of possible B sets corresponding])
+    # Object types (color_shape), with the default colors and shapes these are OBJECT_TYPES
+    object_types = [color + "_" + str(int(shape)) for shape in shapes for color in colors]
+    in_A = np.array([shape in a_shapes for shape in shapes for color in colors])
+    in_B = np.array([color in b_colors for shape in shapes for color in colors])
 
-    # Generate A sets
-    for i in range(0, max_num_objects + 1):
+    key = hashlib.sha1(repr((object_types, in_A.tolist(), in_B.tolist(), max_num_objects)).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(cache_dir, "contexts_" + key)
+    if os.path.exists(path + ".npz"):
+        f = np.load(path + ".npz")
+        return ContextSpace(f['counts'], [str(t) for t in f['object_types']])
 
-        c = list(combinations_with_replacement(colors, i)) # Generate all possible combos of length i and colors
-        
-        for j in range(0, len(c)): # List of tuples
-            curr_A_set = Multiset() # Construct a possible A set from current tuple
-            curr_tuple = c[j]
+    # Every scene as counts of the object types in A or B, with at most max_num_objects objects in total
+    relevant = np.flatnonzero(in_A | in_B)
+    parts = compositions(len(relevant), max_num_objects)
+    scenes = np.zeros((len(parts), len(object_types)), dtype=int)
+    scenes[:, relevant] = parts
 
-            for k in range(0, len(curr_tuple)):
-                if curr_tuple[k] == "blue":
-                    curr_A_set.add("blue_3") # Blue triangle
-                elif curr_tuple[k] == "red":
-                    curr_A_set.add("red_3") # Red triangle
+    # Order by number of objects in A, then A (most of the first type first), then objects only in B
+    a_part = scenes[:, in_A]
+    b_part = scenes[:, in_B & ~in_A]
+    keys = [b_part[:, t] for t in reversed(range(b_part.shape[1]))] + \
+           [-a_part[:, t] for t in reversed(range(a_part.shape[1]))] + [a_part.sum(axis=1)]
+    scenes = scenes[np.lexsort(keys)]
 
-            A_B_possible.append((curr_A_set, []))
-    
-    # Given each A set, generate possible B sets
-    for tup in A_B_possible:
-
-        # Get details of current set
-        curr_A_set = tup[0]
-        n_red_triangles = 0
-        n_blue_triangles = 0
-        for obj in curr_A_set:
-            if "blue" in obj:
-                n_blue_triangles += 1
-            else:
-                n_red_triangles += 1
-
-        # Generate all B sets corresponding to this A set (adding same num red triangles, then red circles)
-        for i in range(0, max_num_objects - n_blue_triangles - n_red_triangles + 1):
-            possible_B_set = Multiset()
-            for j in range(0, n_red_triangles):
-                possible_B_set.add("red_3")
-            for k in range(0,i):
-                possible_B_set.add("red_100")
-            tup[1].append(possible_B_set)
-
-    # Build contexts from A/B possible sets
-    for tup in A_B_possible:
-        a_set = tup[0]
-        for b_set in tup[1]:
-            contexts.append(FunctionData(input=[a_set,b_set], output=None, alpha=1.0))
-
-    # Output to csv file
-    with open("./../data/" + "contexts.csv", "w") as f:
+    # Project scenes to contexts (set A, set B), keeping each distinct context once
+    counts = np.stack([scenes * in_A, scenes * in_B], axis=1)
+    _, first = np.unique(counts.reshape(len(counts), -1), axis=0, return_index=True)
+    counts = counts[np.sort(first)]
+
+    # Written to temporary files (one per process) which then replace the cache files, so that runs reading
+    # the cache concurrently never see a partly written space. The csv goes first, the npz marks the space as cached
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "w") as f:
         f.write("set_A,set_B\n")
-        for context in contexts:
-            i = context.input
-            a = str(i[0])
-            a = re.sub(r'OBJECT|<|{|}|<|>|:| |,|', '', a)
-            a = re.sub(r'3', '3;', a)
-            a = re.sub(r'100', '100;', a)
-            b = str(i[1])
-            b = re.sub(r'OBJECT|<|{|}|<|>|:| |,|', '', b)
-            b = re.sub(r'3', '3;', b)
-            b = re.sub(r'100', '100;', b)
-            f.write(a + "," + b + "\n")
-    
-    return contexts
+        for a_set, b_set in counts:
+            f.write(format_set(a_set, object_types) + "," + format_set(b_set, object_types) + "\n")
+    os.replace(tmp, path + ".csv")
+    with open(tmp, 'wb') as f:
+        np.savez(f, counts=counts, object_types=np.array(object_types))
+    os.replace(tmp, path + ".npz")
+
+    return ContextSpace(counts, object_types)
+
+def compositions(k, n):
+    """
+    All vectors of k non-negative integers summing to at most n (by "stars and bars": the
+    positions of k bars among n stars and k bars, the last part being the unused stars).
+
+    Returns:
+        - parts (numpy array (int)): Array of shape (C(n + k, k), k)
+    """
+    if k == 0:
+        return np.zeros((1, 0), dtype=int)
+    bars = np.fromiter(itertools.chain.from_iterable(combinations(range(n + k), k)), dtype=int).reshape(-1, k)
+    return np.diff(bars, axis=1, prepend=-1) - 1
+
+def format_set(counts, object_types=OBJECT_TYPES):
+    """
+    Format a count vector as objects separated by semicolons (i.e. red_3;red_3;red_100;)
+
+    Parameters:
+        - counts (numpy array (int)): Number of objects of each type in object_types
+        - object_types (list (str)): The object types counted
+
+    Returns:
+        - (str): The formatted set
+    """
+    return "".join((t + ";") * c for t, c in zip(object_types, counts))
+
  
-def load(data_dir, alpha):
+def load(data_dir, alpha, threads=None):
     """
     Loads and returns training data for the model (contexts -> labels).
     For example, with 10 humans seeing 96 contexts each, there will be
     960 data points. Data is stored as a list of FunctionData objects. 
     Each FunctionData object represents a datum with an input 
-    which is a list of two multisets of colored objects, and an output which is 
+    which is a list of two multisets of colored objects (CountSets), and an output which is 
     true or false denoting if the input represents the current concept being learned.
 
     NOTE: This loading method gives a certain structure to data (i.e. two multisets, A and B). In particular, given default experiment,
@@ -116,54 +385,84 @@ def load(data_dir, alpha):
     Parameters:
         - data_dir (str): Path to where data is stored. By default, there are multiple CSV files for one experiment type (representing each human). 
         - alpha (float): Assumed noisiness of data being loaded (i.e. incorrect labels, etc.)
+        - threads (int): Number of files read concurrently (Python's default for thread pools if not given)
 
     Returns:
         - data (list): A list of FunctionData objects, LOTLib's specific data type for input/output pairs.
         - n_contexts (int): Number of contexts seen per each human
     """
 
-    data = []  
-    n_contexts = 0  # Number of contexts seen per each human
-
-    # Load all data files in experiment directory
-    for f_name in os.listdir(data_dir):
-        n_contexts = 0
-        path = data_dir + f_name
-        df = pd.read_csv(open(path, 'r', encoding="utf-8"))
-
-        # Iterate over rows and columns, create FunctionData objects
-        df = df.loc[:, 'obj1':'shape8'].dropna()
-        for index, row in df.iterrows():
-
-            n_contexts += 1
-            context_objects = [] # all objects in context
-            set_A = Multiset() # all triangles in context
-            set_B = Multiset() # all red objects in context
-            label = None       # Whether quantifier is true in this context of set A and B
-
-            # Construct objects from this row's (datapoint's) columns
-            shape_num = 0
-            for col in df:
-                if "obj" in col:
-                    context_objects.append(row[col])
-                elif "corrAns" in col:
-                    label = (row[col] == "t")
-                elif "shape" in col:
-                    context_objects[shape_num] = context_objects[shape_num] + "_" + str(int(row[col]))
-                    shape_num += 1
-                else:
-                    continue
-            
-            # Split objects into appropriate sets
-            for o in context_objects:
-                if 'gray' in o:
-                    continue
-                if "3" in o:
-                    set_A.add(o)
-                if 'red' in o:
-                    set_B.add(o)
-
-            # Add this context/label to dataset
-            data.append(FunctionData(input=[set_A, set_B], output=label, alpha=alpha))
-
-    return data, n_contexts
\ No newline at end of file
+    # Load all data files in experiment directory (in directory order, as models are matched to humans by it)
+    paths = [data_dir + f_name for f_name in os.listdir(data_dir)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        loaded = list(pool.map(load_file, paths))
+
+    if len(loaded) == 0:
+        return make_contexts(np.zeros((0, 2, len(OBJECT_TYPES)), dtype=int), [], alpha), 0
+
+    counts = np.concatenate([file_counts for file_counts, _ in loaded])
+    labels = [label for _, file_labels in loaded for label in file_labels]
+    n_contexts = len(loaded[-1][1]) # Number of contexts seen per each human
+
+    # Contexts are views into one array (no per-object allocation)
+    data = make_contexts(counts, labels, alpha)
+
+    return data, n_contexts
+
+def load_file(path):
+    """
+    Load the contexts one human saw from their data file.
+
+    Parameters:
+        - path (str): Path to the human's CSV file
+
+    Returns:
+        - counts, labels: See parse_contexts
+    """
+    import pandas as pd # Only needed to parse data files (not when data comes from a compiled dataset)
+    return parse_contexts(pd.read_csv(path, encoding="utf-8"), path)
+
+def parse_contexts(df, path):
+    """
+    Parse the contexts one human saw from the table of their data file.
+
+    Parameters:
+        - df (pandas.DataFrame): The human's data file
+        - path (str): Path to the file (for error messages)
+
+    Returns:
+        - counts (numpy array (int)): n x 2 x |OBJECT_TYPES| array, counts of set A (all triangles) and set B (all red objects) per context
+        - labels (list (bool)): Whether the quantifier is true in each context (None if the file has no corrAns column)
+    """
+    df = df.loc[:, 'obj1':'shape8'].dropna()
+
+    # Object i of a context is the color in the ith obj column and the shape in the ith shape column
+    # (objects past the last shape column have no shape, so they are unknown objects unless gray)
+    obj_cols = [col for col in df.columns if "obj" in col]
+    shape_cols = [col for col in df.columns if "shape" in col and "obj" not in col and "corrAns" not in col]
+    colors = df[obj_cols].to_numpy(dtype=str)
+    shapes = df[shape_cols].to_numpy(dtype=float).astype(int).astype(str)
+    k = min(shapes.shape[1], colors.shape[1])
+    objects = np.concatenate([np.char.add(np.char.add(colors[:, :k], "_"), shapes[:, :k]), colors[:, k:]], axis=1)
+
+    # Integer code (index into OBJECT_TYPES) of every object, gray objects are not in any set
+    codes = np.full(objects.shape, -1)
+    for t, object_type in enumerate(OBJECT_TYPES):
+        codes[objects == object_type] = t
+    gray = np.char.find(objects, 'gray') >= 0
+    unknown = (codes < 0) & ~gray
+    if np.any(unknown):
+        raise Exception("Unknown object \'" + objects[unknown][0] + "\' in " + path + ". Known object types are " + str(OBJECT_TYPES) + ".")
+
+    # Count objects of each type per context, then split them into set A (triangles) and set B (red objects)
+    type_counts = np.sum(codes[:, :, np.newaxis] == np.arange(len(OBJECT_TYPES)), axis=1)
+    in_A = np.array(["3" in o for o in OBJECT_TYPES])
+    in_B = np.array(['red' in o for o in OBJECT_TYPES])
+    counts = np.stack([type_counts * in_A, type_counts * in_B], axis=1)
+
+    if "corrAns" in df.columns:
+        labels = (df["corrAns"] == "t").tolist()
+    else:
+        labels = [None] * len(df)
+
+    return counts, labels
@@ -0,0 +1,223 @@
+# -----------------------------------------------------------
+# Compiled (binary) copies of experiment data: the contexts, labels and
+# human answers parsed from an experiment's CSV files, stored as NumPy
+# arrays that later runs (and worker processes) open memory-mapped
+# instead of parsing the CSVs again.
+#
+# Usage: python dataset_cache.py build -exp_type at_least_3
+#        python dataset_cache.py inspect -exp_type at_least_3
+# -----------------------------------------------------------
+
+# Python Imports
+import os
+import argparse
+import hashlib
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Personal Code
+import data_handling
+
+# Other
+import numpy as np
+
+# Increase when the format of cached datasets changes (older caches are then rebuilt)
+VERSION = 1
+
+def parse_args():
+    """
+    Parse all command line arguments
+
+    Parameters:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The list of arguments passed in
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", type=str, choices=["build", "inspect"], help="Build (or rebuild if out of date) the cache of an experiment's data, or show what is cached")
+    parser.add_argument("-exp_type", type=str, nargs="+", help="Experiment types (folder names of data for quantifiers of choice)", required=True)
+    parser.add_argument("-data_dir",type=str, help = "Path to main data directory (not specific quantifier)", default ="./../sample_data/")
+    parser.add_argument("-cache",type=str, help = "Directory where compiled datasets are stored", default ="./../dataset_cache/")
+    args = parser.parse_args()
+    return args
+
+def source_files(data_dir):
+    """
+    The data files of an experiment, in the order data_handling.load reads them, with their
+    modification time and size (a cached dataset is out of date when these change).
+
+    Parameters:
+        - data_dir (str): Path to the experiment's data files
+
+    Returns:
+        - files (list): [file name, modification time (ns), size] per file
+    """
+    files = []
+    for f_name in os.listdir(data_dir):
+        stat = os.stat(data_dir + f_name)
+        files.append([f_name, stat.st_mtime_ns, stat.st_size])
+    return files
+
+def cache_path(data_dir, cache):
+    """
+    Directory of the cached dataset of data_dir (named after the data directory and a hash of its absolute path).
+    """
+    name = os.path.basename(os.path.normpath(data_dir))
+    return os.path.join(cache, name + "_" + hashlib.sha1(os.path.abspath(data_dir).encode("utf-8")).hexdigest()[:12])
+
+def read_file(path):
+    # Contexts and human answers of one data file (each file is read once)
+    import pandas as pd # Only needed to build datasets (not to open them)
+    df = pd.read_csv(path, encoding="utf-8")
+    counts, labels = data_handling.parse_contexts(df, path)
+    answers = np.array(df['key_resp_monotonicity.corr'].dropna(), dtype=float) if 'key_resp_monotonicity.corr' in df.columns else np.zeros(0)
+    return counts, labels, answers
+
+def build(data_dir, cache, threads=None):
+    """
+    Parse an experiment's data files and store them as a compiled dataset:
+        - counts.npy: n x 2 x |OBJECT_TYPES| counts of set A and set B of every context
+        - labels.npy: label of every context (1 = true, 0 = false, -1 = none)
+        - offsets.npy: index of the first context of each file (and the total number of contexts)
+        - answers.npy, answer_offsets.npy: human answers (key_resp_monotonicity.corr) of every file, concatenated
+        - meta.json: source files (with modification times and sizes), n_contexts and format version
+    The dataset is written to a temporary directory first and then moved into place, so readers never see a partial dataset.
+
+    Parameters:
+        - data_dir (str): Path to the experiment's data files
+        - cache (str): Directory where compiled datasets are stored
+        - threads (int): Number of files read concurrently
+
+    Returns:
+        - path (str): Directory of the compiled dataset
+    """
+    files = source_files(data_dir)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        parsed = list(pool.map(read_file, [data_dir + f[0] for f in files]))
+
+    n_types = len(data_handling.OBJECT_TYPES)
+    counts = np.concatenate([p[0] for p in parsed]) if len(parsed) > 0 else np.zeros((0, 2, n_types), dtype=int)
+    labels = np.array([-1 if l is None else int(l) for p in parsed for l in p[1]], dtype=np.int8)
+    offsets = np.cumsum([0] + [len(p[1]) for p in parsed])
+    answers = np.concatenate([p[2] for p in parsed]) if len(parsed) > 0 else np.zeros(0)
+    answer_offsets = np.cumsum([0] + [len(p[2]) for p in parsed])
+
+    meta = {'version': VERSION,
+            'data_dir': os.path.abspath(data_dir),
+            'object_types': data_handling.OBJECT_TYPES,
+            'files': files,
+            'n_contexts': len(parsed[-1][1]) if len(parsed) > 0 else 0}
+
+    os.makedirs(cache, exist_ok=True)
+    path = cache_path(data_dir, cache)
+    tmp = tempfile.mkdtemp(dir=cache)
+    np.save(os.path.join(tmp, "counts.npy"), counts.astype(np.int64))
+    np.save(os.path.join(tmp, "labels.npy"), labels)
+    np.save(os.path.join(tmp, "offsets.npy"), offsets.astype(np.int64))
+    np.save(os.path.join(tmp, "answers.npy"), answers)
+    np.save(os.path.join(tmp, "answer_offsets.npy"), answer_offsets.astype(np.int64))
+    with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+def up_to_date(data_dir, cache):
+    """
+    Whether the compiled dataset of data_dir exists and was built from the current data files.
+    """
+    path = cache_path(data_dir, cache)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return False
+    with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return meta['version'] == VERSION and meta['object_types'] == data_handling.OBJECT_TYPES \
+        and meta['files'] == source_files(data_dir)
+
+
+class Dataset(object):
+    """
+    A compiled dataset, with its arrays memory-mapped (read only, and shared by every process
+    that opens the same dataset).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.counts = np.load(os.path.join(path, "counts.npy"), mmap_mode='r')
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self.answers = np.load(os.path.join(path, "answers.npy"), mmap_mode='r')
+        self.answer_offsets = np.load(os.path.join(path, "answer_offsets.npy"), mmap_mode='r')
+        self.n_contexts = self.meta['n_contexts']
+
+    def data(self, alpha):
+        """
+        The dataset as data_handling.load returns it (contexts are views into the memory-mapped counts).
+
+        Returns:
+            - data (list): A list of FunctionData objects
+            - n_contexts (int): Number of contexts seen per each human
+        """
+        labels = [None if l < 0 else l == 1 for l in self.labels.tolist()]
+        return data_handling.make_contexts(self.counts, labels, alpha), self.n_contexts
+
+    def human_answers(self):
+        """
+        Returns:
+            - human_answers (list (numpy array)): The answers (1 if correct, else 0) of each human to each context
+        """
+        return [self.answers[self.answer_offsets[i]:self.answer_offsets[i + 1]] for i in range(len(self.answer_offsets) - 1)]
+
+
+def open_dataset(data_dir, cache):
+    """
+    Open the compiled dataset of data_dir, building it first if it does not exist or is out of date.
+
+    Parameters:
+        - data_dir (str): Path to the experiment's data files
+        - cache (str): Directory where compiled datasets are stored
+
+    Returns:
+        - dataset (Dataset): The compiled dataset
+    """
+    if not up_to_date(data_dir, cache):
+        build(data_dir, cache)
+    return Dataset(cache_path(data_dir, cache))
+
+def load(data_dir, alpha, cache):
+    """
+    Same as data_handling.load, but through the compiled dataset of data_dir.
+    """
+    return open_dataset(data_dir, cache).data(alpha)
+
+def inspect(data_dir, cache):
+    """
+    Print a summary of the compiled dataset of data_dir.
+    """
+    path = cache_path(data_dir, cache)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        print(data_dir + ": not cached")
+        return
+    dataset = Dataset(path)
+    print(data_dir + ":", path, "(up to date)" if up_to_date(data_dir, cache) else "(out of date)")
+    print("  Files:", len(dataset.meta['files']), ", Contexts:", len(dataset.counts), ", Contexts per human:", dataset.n_contexts)
+    print("  Labeled true:", int(np.sum(dataset.labels == 1)), ", false:", int(np.sum(dataset.labels == 0)), ", none:", int(np.sum(dataset.labels < 0)))
+    print("  Size:", sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)), "bytes")
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    for exp_type in args.exp_type:
+        data_dir = args.data_dir + "/" + exp_type + "/"
+        if args.action == "build":
+            path = build(data_dir, args.cache)
+            print("Built", path)
+        else:
+            inspect(data_dir, args.cache)
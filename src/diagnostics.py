@@ -0,0 +1,72 @@
+# -----------------------------------------------------------
+# Convergence diagnostics for MCMC chains (potential scale reduction
+# and effective sample size of a traced quantity, e.g. posterior score).
+# -----------------------------------------------------------
+
+import numpy as np
+
+
+def rhat(traces):
+    """
+    Split R-hat (potential scale reduction) of a quantity traced by several chains. Each chain
+    is split in halves, so one chain that drifts also gets a large R-hat. Values close to 1
+    mean the chains agree, values above ~1.1 that they have not converged.
+
+    Parameters:
+        - traces (numpy array (float)): K x n matrix, the quantity at each of n steps of K chains
+
+    Returns:
+        - (float): R-hat, nan if there are fewer than 4 steps per chain
+    """
+    traces = np.asarray(traces, dtype=float)
+    n = traces.shape[1] // 2
+    if n < 2:
+        return float('nan')
+    halves = np.concatenate([traces[:, :n], traces[:, -n:]])
+
+    within = np.mean(np.var(halves, axis=1, ddof=1))
+    between = n * np.var(np.mean(halves, axis=1), ddof=1)
+    if within == 0:
+        return 1.0 if between == 0 else float('inf')
+    var_plus = ((n - 1) / n) * within + between / n
+    return float(np.sqrt(var_plus / within))
+
+def ess(traces):
+    """
+    Effective sample size of a quantity traced by one or more chains: the number of independent
+    samples the chains are worth, given the autocorrelation of each chain (summed over lags
+    until consecutive pairs of autocorrelations stop being positive, Geyer's initial positive
+    sequence).
+
+    Parameters:
+        - traces (numpy array (float)): K x n matrix, the quantity at each of n steps of K chains
+
+    Returns:
+        - (float): Effective sample size summed over chains
+    """
+    traces = np.atleast_2d(np.asarray(traces, dtype=float))
+    total = 0.0
+    for trace in traces:
+        n = len(trace)
+        if n < 2:
+            total += n
+            continue
+        x = trace - np.mean(trace)
+        var = np.dot(x, x) / n
+        if var == 0:
+            # A chain that never moves is worth one sample
+            total += 1.0
+            continue
+
+        # Autocorrelation at every lag (via FFT)
+        f = np.fft.rfft(x, 2 * n)
+        acf = np.fft.irfft(f * np.conjugate(f))[:n] / (n * var)
+
+        tau = -1.0
+        for t in range(0, n - 1, 2):
+            pair = acf[t] + acf[t + 1]
+            if pair <= 0:
+                break
+            tau += 2.0 * pair
+        total += n / max(tau, 1.0 / n)
+    return float(total)
@@ -0,0 +1,289 @@
+# -----------------------------------------------------------
+# Enumerates the semantically distinct hypotheses of a grammar (up to a
+# depth) for exact inference, instead of sampling them with MCMC.
+# -----------------------------------------------------------
+
+import os
+from math import log
+import numpy as np
+
+# Personal Code
+import cache
+import compiler
+import data_handling
+import hypotheses
+
+
+class EnumeratedSpace(object):
+    """
+    The semantically distinct hypotheses of a grammar: one representative per truth table over
+    all_contexts, namely the expression with the highest grammar probability (degrees only depend
+    on the truth table, so this is also the representative with the highest prior for any lambdas).
+        - expressions (list (str)): The H representative expressions
+        - truth (numpy array (bool)): H x |all_contexts| matrix of truth values
+        - log_probability (numpy array (float)): Log probability of each expression under the grammar
+        - degree_monotonicity, degree_conservativity (numpy array (float)): Degrees of each hypothesis
+        - truncated (bool): Whether values were dropped by the size cap while enumerating (see enumerate_space),
+        in which case the space may be missing hypotheses
+    """
+
+    def __init__(self, expressions, truth, log_probability, degree_monotonicity, degree_conservativity, truncated=False):
+        self.expressions = expressions
+        self.truth = truth
+        self.log_probability = log_probability
+        self.degree_monotonicity = degree_monotonicity
+        self.degree_conservativity = degree_conservativity
+        self.truncated = truncated
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def priors(self, lam_1, lam_2, prior_temperature=1.0):
+        """
+        Log prior of every hypothesis, as in HypothesisA.compute_prior.
+
+        Returns:
+            - priors (numpy array (float)): Length H vector of log priors
+        """
+        return (self.log_probability / prior_temperature) + (lam_1 * hypotheses.limit_log_array(self.degree_monotonicity)) \
+            + (lam_2 * hypotheses.limit_log_array(self.degree_conservativity))
+
+    def truth_on(self, data, all_contexts):
+        """
+        Truth value of every hypothesis on every datum (looked up in the truth matrix).
+
+        Parameters:
+            - data (list): A list of FunctionData objects
+            - all_contexts (data_handling.ContextSpace): The contexts the space was enumerated over
+
+        Returns:
+            - truth (numpy array (bool)): H x len(data) matrix of truth values
+        """
+        if isinstance(data, data_handling.InternedData) and data.contexts is all_contexts:
+            return self.truth[:, data.index]
+        index = all_contexts.index(data_handling.context_counts(data))
+        if np.any(index < 0):
+            raise Exception("Exact inference needs every context in the data to be in all_contexts.")
+        return self.truth[:, index]
+
+    def save(self, path):
+        # Written to a temporary file (one per process) which then replaces path, so that runs reading
+        # the cache concurrently never see a partly written space
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, expressions=np.array(self.expressions), truth=self.truth, log_probability=self.log_probability,
+                                degree_monotonicity=self.degree_monotonicity, degree_conservativity=self.degree_conservativity,
+                                truncated=self.truncated)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        f = np.load(path)
+        return EnumeratedSpace(list(f['expressions']), f['truth'], f['log_probability'],
+                               f['degree_monotonicity'], f['degree_conservativity'], bool(f['truncated']))
+
+
+def enumerate_space(grammar, all_contexts, max_depth=5, max_size=100000, max_nodes=25):
+    """
+    Walk the grammar bottom up, building every expression of depth up to max_depth (terminals
+    have depth 1). Expressions of every nonterminal are evaluated on all contexts (and their
+    conservation models) with the vectorized primitives in compiler.py, and at each depth
+    expressions with the same values are collapsed, keeping the most probable one. Since the
+    probability of an expression is the product of its rules' probabilities, collapsing
+    subexpressions never loses the most probable representative of a class. Expressions with
+    more than max_nodes nodes are left out, as HypothesisA.compute_prior gives them a prior of
+    -Infinity (nodes are counted on the representatives, which are also the smallest expressions
+    of their class unless a larger one is more probable).
+
+    Parameters:
+        - grammar (LOTLib3.Grammar): The grammar (all its primitives must be in compiler.OPERATIONS)
+        - all_contexts (data_handling.ContextSpace): All possible contexts
+        - max_depth (int): Maximum depth of expressions
+        - max_size (int): Maximum number of distinct values kept per nonterminal and depth (the most
+        probable are kept), bounds the cost of combining expressions. A warning is printed and the
+        space is marked as truncated if values are dropped
+        - max_nodes (int): Maximum number of nodes of an expression (the hypotheses' maxnodes)
+
+    Returns:
+        - space (EnumeratedSpace): The semantically distinct hypotheses of the start symbol
+    """
+
+    # Evaluate on all contexts followed by their conservation models
+    n = len(all_contexts)
+    A = np.concatenate([all_contexts.A, all_contexts.A])
+    B = np.concatenate([all_contexts.B, np.minimum(all_contexts.A, all_contexts.B)])
+
+    # Rules and their (normalized) log probabilities
+    rule_list = []
+    rule_log_p = []
+    for nt in grammar.rules:
+        total = sum(r.p for r in grammar.rules[nt])
+        for r in grammar.rules[nt]:
+            rule_list.append((nt, r.name, list(r.to) if r.to else []))
+            rule_log_p.append(log(r.p / total))
+
+    # levels[d][nt] holds the distinct values of nt with depth <= d, their number of nodes and how each
+    # was built: rule (index into rule_list, -1 if carried over from depth d-1) and children (indices at depth d-1)
+    empty = {'values': None, 'log_p': np.zeros(0), 'nodes': np.zeros(0, dtype=int), 'rule': np.zeros(0, dtype=int),
+             'c1': np.zeros(0, dtype=int), 'c2': np.zeros(0, dtype=int)}
+    levels = [{nt: empty for nt in grammar.rules}]
+    truncated = False
+
+    for d in range(1, max_depth + 1):
+        prev = levels[-1]
+        level = {}
+        for nt in grammar.rules:
+            parts = []
+
+            # Carried over from depth d-1
+            if len(prev[nt]['log_p']) > 0:
+                k = len(prev[nt]['log_p'])
+                parts.append((prev[nt]['values'], prev[nt]['log_p'], prev[nt]['nodes'], np.full(k, -1), np.arange(k), np.full(k, -1)))
+
+            for rule_index, (rule_nt, name, to) in enumerate(rule_list):
+                if rule_nt != nt:
+                    continue
+                lp = rule_log_p[rule_index]
+                if len(to) == 0:
+                    if d == 1:
+                        parts.append((terminal_value(name, A, B)[np.newaxis], np.array([lp]), np.array([1]), np.array([rule_index]),
+                                      np.array([-1]), np.array([-1])))
+                    continue
+
+                if name not in compiler.OPERATIONS:
+                    raise compiler.CompileError("Cannot enumerate primitive \'" + str(name) + "\'")
+                op = compiler.OPERATIONS[name]
+                children = [prev[c] for c in to]
+                if any(len(c['log_p']) == 0 for c in children):
+                    continue
+
+                if len(to) == 1:
+                    X = children[0]
+                    k = len(X['log_p'])
+                    small = np.flatnonzero(X['nodes'] + 1 <= max_nodes)
+                    parts.append(dedup(op(X['values'][small]), lp + X['log_p'][small], X['nodes'][small] + 1,
+                                       np.full(len(small), rule_index), small, np.full(len(small), -1)))
+                elif len(to) == 2:
+                    X, Y = children
+                    k1, k2 = len(X['log_p']), len(Y['log_p'])
+                    # Combine every pair of children, a block of first children at a time to bound memory
+                    block = max(1, int(2e7 // max(1, k2 * Y['values'][0].size)))
+                    for start in range(0, k1, block):
+                        stop = min(k1, start + block)
+                        values = op(X['values'][start:stop, np.newaxis], Y['values'][np.newaxis, :])
+                        values = values.reshape((-1,) + values.shape[2:])
+                        log_p = (lp + X['log_p'][start:stop, np.newaxis] + Y['log_p'][np.newaxis, :]).ravel()
+                        nodes = (1 + X['nodes'][start:stop, np.newaxis] + Y['nodes'][np.newaxis, :]).ravel()
+                        c1 = np.repeat(np.arange(start, stop), k2)
+                        c2 = np.tile(np.arange(k2), stop - start)
+                        small = np.flatnonzero(nodes <= max_nodes)
+                        parts.append(dedup(values[small], log_p[small], nodes[small], np.full(len(small), rule_index), c1[small], c2[small]))
+                else:
+                    raise compiler.CompileError("Cannot enumerate primitive \'" + str(name) + "\' with " + str(len(to)) + " arguments")
+
+            if len(parts) == 0:
+                level[nt] = empty
+                continue
+            values, log_p, nodes, rule, c1, c2 = dedup(*[np.concatenate(x) for x in zip(*parts)])
+            if len(log_p) > max_size:
+                truncated = True
+                print("WARNING: Kept the", max_size, "most probable of", len(log_p), "distinct values of", nt, "at depth", str(d) +
+                      ", the enumerated space may be missing hypotheses (raise max_size)")
+                values, log_p, nodes, rule, c1, c2 = most_probable(max_size, values, log_p, nodes, rule, c1, c2)
+            level[nt] = {'values': values, 'log_p': log_p, 'nodes': nodes, 'rule': rule, 'c1': c1, 'c2': c2}
+        levels.append(level)
+
+    # Hypotheses are the values of the start symbol, distinct on all_contexts (without conservation models)
+    top = levels[-1][grammar.start]
+    truth = np.asarray(top['values'], dtype=bool)
+    keep = dedup(truth[:, :n], top['log_p'], np.arange(len(top['log_p'])))[2]
+    truth, cons = truth[keep, :n], truth[keep, n:]
+    log_p = top['log_p'][keep]
+
+    # Reconstruct the representative expressions
+    built = {}
+    def expression(nt, d, i):
+        if (nt, d, i) not in built:
+            entry = levels[d][nt]
+            rule_index = entry['rule'][i]
+            if rule_index < 0:
+                built[(nt, d, i)] = expression(nt, d - 1, entry['c1'][i])
+            else:
+                _, name, to = rule_list[rule_index]
+                args = [expression(c, d - 1, j) for c, j in zip(to, (entry['c1'][i], entry['c2'][i]))]
+                built[(nt, d, i)] = name + "(" + ", ".join(args) + ")" if len(to) > 0 else name
+        return built[(nt, d, i)]
+    expressions = [expression(grammar.start, len(levels) - 1, i) for i in keep]
+
+    # Degrees of every hypothesis at once
+    truth_f = truth.astype(np.float32)
+    sub = (truth_f @ all_contexts.sub.T.astype(np.float32)) > 0
+    sup = (truth_f @ all_contexts.super.T.astype(np.float32)) > 0
+    probs = hypotheses.degree_probs(truth, sub, sup, cons)
+
+    return EnumeratedSpace(expressions, truth, log_p, hypotheses.degree_monotonicity(probs), hypotheses.degree_conservativity(probs), truncated)
+
+def terminal_value(name, A, B):
+    """
+    Value of a terminal on every context (see compiler.compile_node).
+    """
+    return np.broadcast_to(compiler.compile_node(name)(A, B), (len(A),) if name not in ('A', 'B') else A.shape).copy()
+
+def dedup(values, log_p, *columns):
+    """
+    Collapse expressions with identical values, keeping the most probable of each (the first
+    one on ties).
+
+    Parameters:
+        - values (numpy array): Value of each expression (one per row)
+        - log_p (numpy array (float)): Log probability of each expression
+        - columns (numpy array): Other attributes of each expression (e.g. rule, children)
+
+    Returns:
+        - (tuple): values, log_p and columns of the kept expressions
+    """
+    if len(log_p) == 0:
+        return (values, log_p) + columns
+    flat = values.reshape(len(values), -1)
+    if flat.dtype == bool:
+        flat = np.packbits(flat, axis=1)
+    flat = np.ascontiguousarray(flat)
+    keys = flat.view(np.dtype((np.void, flat.shape[1] * flat.itemsize))).ravel()
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+
+    order = np.lexsort((-log_p, inverse))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = inverse[order][1:] != inverse[order][:-1]
+    keep = np.sort(order[first])
+    return (values[keep], log_p[keep]) + tuple(column[keep] for column in columns)
+
+def most_probable(max_size, values, log_p, *columns):
+    """
+    Keep the max_size most probable expressions (the first ones on ties), in their order.
+
+    Returns:
+        - (tuple): values, log_p and columns of the kept expressions (see dedup)
+    """
+    keep = np.sort(np.argsort(-log_p, kind='stable')[:max_size])
+    return (values[keep], log_p[keep]) + tuple(column[keep] for column in columns)
+
+def load_or_enumerate(grammar, all_contexts, max_depth=5, max_size=100000, max_nodes=25, cache_dir="./../spaces/"):
+    """
+    Load the enumerated space of a grammar from the cache directory, or enumerate it and save
+    it there. Cached spaces are identified by hashes of the grammar and of all_contexts, and
+    by max_depth, max_size and max_nodes.
+
+    Returns:
+        - space (EnumeratedSpace): The semantically distinct hypotheses of the grammar
+    """
+    name = "space_" + cache.grammar_hash(grammar)[:16] + "_" + cache.contexts_hash(all_contexts)[:16] + \
+        "_" + str(max_depth) + "_" + str(max_size) + "_" + str(max_nodes) + ".npz"
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(path):
+        return EnumeratedSpace.load(path)
+
+    space = enumerate_space(grammar, all_contexts, max_depth, max_size, max_nodes)
+    os.makedirs(cache_dir, exist_ok=True)
+    space.save(path)
+    return space
@@ -12,9 +12,28 @@ from LOTlib3.Miscellaneous import Infinity, attrmem
 from LOTlib3.Eval import EvaluationException
 from math import log
 from os import path
+from copy import copy
+import numpy as np
+
+# Personal Code
+import compiler
+import data_handling
+import cache
 
 k = 0.00001
 
+# Prior components per expression (see HypothesisA.compute_prior_components), and the hashes of the grammar and
+# contexts they are for (they depend on both, and are keyed by the expression only)
+prior_components = cache.LRUCache()
+prior_space = (None, None)
+
+# Per-datum log likelihoods per expression and data (see HypothesisA.likelihood_vector)
+likelihoods = cache.LRUCache()
+
+# Values of subtrees on all_contexts per subtree expression (see HypothesisA.truth_vector), and the hash of the contexts they are over
+subtree_values = cache.LRUCache()
+subtree_contexts = None
+
 class HypothesisA(BinaryLikelihood, LOTHypothesis):
     """
     A hypothesis type which assumes two sets and a simple likelihood function
@@ -26,6 +45,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
     lam_1 = 0.0
     lam_2 = 0.0
     all_contexts = None
+    prior_cache = None
 
     def __init__(self, **kwargs):
         LOTHypothesis.__init__(self, display="lambda A, B: %s", **kwargs)
@@ -35,6 +55,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         self.lam_1 = kwargs.get('lam_1', 0.0)
         self.lam_2 = kwargs.get('lam_2', 0.0)
         self.all_contexts = kwargs.get('all_contexts', None)
+        self.prior_cache = kwargs.get('prior_cache', None)
         
     def __call__(self, *args):
         try:
@@ -42,6 +63,126 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         except EvaluationException: # catch recursion and too big
             return None
 
+    def __getstate__(self):
+        """
+        Pickle (i.e. to send to worker processes) without the compiled functions, which cannot be
+        pickled. Copying the value drops everything cached on it (see NoCopy).
+        """
+        state = dict(self.__dict__)
+        state['value'] = copy(self.value)
+        state.pop('fvalue', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fvalue = self.compile_function()
+
+    def compute_single_likelihood(self, datum):
+        """
+        Likelihood of a single datum, as in BinaryLikelihood: with probability alpha the
+        label is generated by the hypothesis, otherwise it is a coin flip.
+        """
+        return log(datum.alpha * (self(*datum.input) == datum.output) + (1.0 - datum.alpha) / 2.0)
+
+    def compute_likelihood(self, data, shortcut=-Infinity):
+        """
+        Overriden likelihood computation which scores all data at once (see likelihood_vector).
+        The cumulative log likelihood is cached on the hypothesis value, so if data extends the
+        data last scored (as when a chain is warm started on one more context) only the new data
+        is evaluated. Interned data (see data_handling.InternedData) is scored from the truth
+        vector, once per distinct context and label.
+        """
+        ll = None
+        cached = getattr(self.value, 'cumulative_likelihood', None)
+        if self.interned(data):
+            ll = data.log_likelihood(self.truth_vector())
+        elif cached is not None:
+            n, last_datum, cached_ll = cached
+            if 0 < n <= len(data) and data[n - 1] is last_datum:
+                ll = cached_ll + float(np.sum(self.likelihood_vector(data[n:])))
+        if ll is None:
+            ll = float(np.sum(self.likelihood_vector(data)))
+
+        setattr(self.value, 'cumulative_likelihood', (len(data), data[-1] if len(data) > 0 else None, ll))
+        self.value.NoCopy.add('cumulative_likelihood')
+
+        self.likelihood = ll / self.likelihood_temperature
+        return self.likelihood
+
+    def likelihood_vector(self, data):
+        """
+        Log likelihood of every datum, equal to compute_single_likelihood on each datum.
+
+        Parameters:
+            - data (list): A list of FunctionData objects
+
+        Returns:
+            - ll (numpy array (float)): The log likelihood of each datum
+        """
+        if len(data) == 0:
+            return np.zeros(0)
+
+        # The same expression is often scored on the same data again (by another proposal). Data is
+        # identified by its length and its first and last datum (the data are prefixes of one list)
+        key = (str(self.value), len(data))
+        cached = likelihoods.get(key)
+        if cached is not None and cached[0] is data[0] and cached[1] is data[-1]:
+            return cached[2]
+
+        if self.interned(data):
+            ll = data.log_likelihoods(self.truth_vector())
+        elif self.compiled() is None:
+            ll = np.array([self.compute_single_likelihood(datum) for datum in data], dtype=float)
+        else:
+            truth = self.eval_counts(data_handling.context_counts(data))
+            outputs = np.array([datum.output for datum in data], dtype=bool)
+            alpha = np.array([datum.alpha for datum in data], dtype=float)
+            ll = np.log(alpha * (truth == outputs) + (1.0 - alpha) / 2.0)
+
+        likelihoods.put(key, (data[0], data[-1], ll))
+        return ll
+
+    def interned(self, data):
+        # Whether data is interned in all_contexts, so likelihoods can be read off the truth vector
+        return isinstance(data, data_handling.InternedData) and data.contexts is self.all_contexts
+
+    def compiled(self):
+        """
+        The hypothesis compiled into a vectorized NumPy function (see compiler.py), cached on the
+        hypothesis value (not copied to proposals).
+
+        Returns:
+            - f (function): f(A, B) over arrays of set counts, or None if the hypothesis uses primitives
+            that cannot be compiled (the interpreter is used instead)
+        """
+        if getattr(self.value, 'compiled', None) is None:
+            try:
+                f = compiler.compile_value(self.value)
+            except compiler.CompileError:
+                f = False
+            setattr(self.value, 'compiled', f)
+            self.value.NoCopy.add('compiled')
+        return self.value.compiled or None
+
+    def eval_counts(self, counts, contexts=None):
+        """
+        Evaluate the hypothesis on many contexts at once.
+
+        Parameters:
+            - counts (numpy array (int)): Array of shape (n, 2, n_types) of set A and set B counts per context
+            - contexts (list): The same contexts as FunctionData objects, used only if the hypothesis cannot be
+            compiled (built from counts if not given)
+
+        Returns:
+            - truth (numpy array (bool)): The truth value of the hypothesis in each context
+        """
+        f = self.compiled()
+        if f is not None:
+            return f(counts[:, 0, :], counts[:, 1, :])
+        if contexts is None:
+            contexts = data_handling.make_contexts(counts)
+        return np.array([bool(self.eval_q_m(context)) for context in contexts], dtype=bool)
+
     def semantic_equiv(self, other):
         """
         Compare with another hypothesis to see if they are semantically equivalent.
@@ -50,14 +191,50 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
             # Easy check if they are same value (avoids checking semantics)
             if self.value == other.value:
                 return True
-            # Check if semantically equivalent
-            for context in self.all_contexts:
-                if self.eval_q_m(context) != other.eval_q_m(context):
-                    return False
-            return True
+            # Check if semantically equivalent (same truth value on every context)
+            return self.signature() == other.signature()
 
         return NotImplemented
 
+    def truth_vector(self):
+        """
+        Truth value of the hypothesis on every context in all_contexts. Computed once
+        per hypothesis value and cached on it (not copied to proposals). Subtrees shared with
+        hypotheses evaluated before (e.g. the part of a proposal that was not regenerated) are
+        not evaluated again (see compiler.evaluate_value).
+
+        Returns:
+            - truth (numpy array (bool)): Element i is 1Q(M_i) for the ith context
+        """
+        if getattr(self.value, 'truth_vector', None) is None:
+            global subtree_contexts
+            contexts = value_hash(self.all_contexts, cache.contexts_hash)
+            if subtree_contexts != contexts:
+                # Cached subtree values are over other contexts
+                subtree_values.entries.clear()
+                subtree_contexts = contexts
+            try:
+                truth = compiler.evaluate_value(self.value, self.all_contexts.A, self.all_contexts.B, subtree_values)
+            except compiler.CompileError:
+                truth = self.eval_counts(self.all_contexts.counts, self.all_contexts)
+            setattr(self.value, 'truth_vector', truth)
+            self.value.NoCopy.add('truth_vector')
+        return self.value.truth_vector
+
+    def signature(self):
+        """
+        Packed bit-vector of the hypothesis' truth values over all_contexts. Two hypotheses
+        are semantically equivalent (over all_contexts) iff their signatures are equal, so
+        this can be used as a dictionary key.
+
+        Returns:
+            - signature (bytes): The packed truth vector
+        """
+        if getattr(self.value, 'signature', None) is None:
+            setattr(self.value, 'signature', np.packbits(self.truth_vector()).tobytes())
+            self.value.NoCopy.add('signature')
+        return self.value.signature
+
     def compute_degree_probs(self):
         """
         Evaluate the hypothesis on contexts to get probabilities
@@ -67,6 +244,9 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
             - p(1Q = True, 1Q< = True) = prob that both true in current model and exists a submodel
             - etc... 
 
+        The hypothesis is evaluated once on every context; truth in sub/super/conservation models
+        is then read off the partial-order index precomputed on all_contexts (see data_handling.ContextSpace).
+
         Parameters:
             - self
 
@@ -75,119 +255,30 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
 
         """
 
-        # Get counts of all situations, i.e. number times true in current model, not true in submodels, etc.
-        counts = {'M_t': 0,
-                  'M_f': 0,
-                  'sub_t': 0,
-                  'sub_f': 0,
-                  'super_t': 0,
-                  'super_f': 0,
-                  'cons_t': 0,
-                  'cons_f': 0,
-                  'M_t_sub_t': 0,
-                  'M_t_sub_f': 0,
-                  'M_f_sub_t': 0,
-                  'M_f_sub_f': 0,
-                  'M_t_super_t': 0,
-                  'M_t_super_f': 0,
-                  'M_f_super_t': 0,
-                  'M_f_super_f': 0,
-                  'M_t_cons_t': 0,
-                  'M_t_cons_f': 0,
-                  'M_f_cons_t': 0,
-                  'M_f_cons_f': 0 
-                  }       
-
-        # Iterate over all contexts get counts
-        for context in self.all_contexts:
-            # T/F for curr context
-            curr_truth = None
-            if self.eval_q_m(context):
-                counts['M_t'] += 1
-                curr_truth = True
-            else:
-                counts['M_f'] += 1
-                curr_truth = False
-            
-            # Sub T/F for curr context
-            curr_sub_truth = None
-            if self.sub_q_m(context):
-                counts['sub_t'] += 1
-                curr_sub_truth = True
-            else:
-                counts['sub_f'] += 1
-                curr_sub_truth = False
-
-            # Super T/F for curr context
-            curr_super_truth = None
-            if self.super_q_m(context):
-                counts['super_t'] += 1
-                curr_super_truth = True
-            else:
-                counts['super_f'] += 1
-                curr_super_truth = False
-            
-            # Cons T/F for curr context
-            curr_cons_truth = None
-            if self.cons_q_m(context):
-                counts['cons_t'] += 1
-                curr_cons_truth = True
-            else:
-                counts['cons_f'] += 1
-                curr_cons_truth = False
-
-            # TT, TF, FT, FF for curr and submodels
-            if curr_truth and curr_sub_truth:
-                counts['M_t_sub_t'] += 1
-            elif curr_truth and not curr_sub_truth:
-                counts['M_t_sub_f'] += 1
-            elif not curr_truth and curr_sub_truth:
-                counts['M_f_sub_t'] += 1
-            elif not curr_truth and not curr_sub_truth:
-                counts['M_f_sub_f'] += 1
-            
-            # TT, TF, FT, FF for curr and supermodels
-            if curr_truth and curr_super_truth:
-                counts['M_t_super_t'] += 1
-            elif curr_truth and not curr_super_truth:
-                counts['M_t_super_f'] += 1
-            elif not curr_truth and curr_super_truth:
-                counts['M_f_super_t'] += 1
-            elif not curr_truth and not curr_super_truth:
-                counts['M_f_super_f'] += 1
-
-            # TT, TF, FT, FF for curr and cons model
-            if curr_truth and curr_cons_truth:
-                counts['M_t_cons_t'] += 1
-            elif curr_truth and not curr_cons_truth:
-                counts['M_t_cons_f'] += 1
-            elif not curr_truth and curr_cons_truth:
-                counts['M_f_cons_t'] += 1
-            elif not curr_truth and not curr_cons_truth:
-                counts['M_f_cons_f'] += 1
-            
-        probs = {'M_t': float(counts['M_t']/len(self.all_contexts)),
-                  'M_f': float(counts['M_f']/len(self.all_contexts)),
-                  'sub_t': float(counts['sub_t']/len(self.all_contexts)),
-                  'sub_f': float(counts['sub_f']/len(self.all_contexts)),
-                  'super_t': float(counts['super_t']/len(self.all_contexts)),
-                  'super_f': float(counts['super_f']/len(self.all_contexts)),
-                  'cons_t': float(counts['cons_t']/len(self.all_contexts)),
-                  'cons_f': float(counts['cons_f']/len(self.all_contexts)),
-                  'M_t_sub_t': float(counts['M_t_sub_t']/len(self.all_contexts)),
-                  'M_t_sub_f': float(counts['M_t_sub_f']/len(self.all_contexts)),
-                  'M_f_sub_t': float(counts['M_f_sub_t']/len(self.all_contexts)),
-                  'M_f_sub_f': float(counts['M_f_sub_f']/len(self.all_contexts)),
-                  'M_t_super_t': float(counts['M_t_super_t']/len(self.all_contexts)),
-                  'M_t_super_f': float(counts['M_t_super_f']/len(self.all_contexts)),
-                  'M_f_super_t': float(counts['M_f_super_t']/len(self.all_contexts)),
-                  'M_f_super_f': float(counts['M_f_super_f']/len(self.all_contexts)),
-                  'M_t_cons_t': float(counts['M_t_cons_t']/len(self.all_contexts)),
-                  'M_t_cons_f': float(counts['M_t_cons_f']/len(self.all_contexts)),
-                  'M_f_cons_t': float(counts['M_f_cons_t']/len(self.all_contexts)),
-                  'M_f_cons_f': float(counts['M_f_cons_f']/len(self.all_contexts))}
-        
-        return probs
+        # T/F in every context, and whether a sub/super/conservation model is true
+        truth = self.truth_vector()
+        probs = degree_probs(truth,
+                             (self.all_contexts.sub & truth).any(axis=1),
+                             (self.all_contexts.super & truth).any(axis=1),
+                             self.cons_vector())
+
+        return {key: float(p) for key, p in probs.items()}
+
+    def cons_vector(self):
+        """
+        Truth value of the hypothesis in the conservation model <A, A \cap B> of every context
+        in all_contexts. Looked up in the truth vector when the conservation model is itself
+        in all_contexts, otherwise evaluated directly.
+
+        Returns:
+            - cons (numpy array (bool)): Element i is 1Q(M_i') where M_i' is the conservation model of M_i
+        """
+        truth = self.truth_vector()
+        cons_index = self.all_contexts.cons
+        cons = truth[cons_index]
+        for i in np.flatnonzero(cons_index < 0):
+            cons[i] = bool(self.cons_q_m(self.all_contexts[i]))
+        return cons
 
     def eval_q_m(self, m):
         """
@@ -196,7 +287,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
 
         Parameters:
             - self
-            - m (List of multisets): A given context (data input)
+            - m (FunctionData): A given context (data input), a list of two CountSets
 
         Returns:
             - The truth value of the hypothesis evaluated on this model (context) m
@@ -211,7 +302,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         
         Parameters:
             - self
-            - m (List of multisets): A given context (data input)
+            - m (FunctionData): A given context (data input), a list of two CountSets
 
         Returns:
             - True if there exists a supermodel m' where the hypothesis evaluates to true    
@@ -231,7 +322,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         
         Parameters:
             - self
-            - m (List of multisets): A given context (data input)
+            - m (FunctionData): A given context (data input), a list of two CountSets
 
         Returns:
             - True if there exists a submodel m' where the hypothesis evaluates to true    
@@ -250,7 +341,7 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         
         Parameters:
             - self
-            - m (List of multisets): A given context (data input)
+            - m (FunctionData): A given context (data input), a list of two CountSets
 
         Returns:
             - True if there exists a conservation model m' where the hypothesis evaluates to true    
@@ -273,19 +364,42 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
             setattr(self.value, 'probs', None)
             return -Infinity
 
-        # Compute degrees if needed
-        if self.lam_1 > 0.0 or self.lam_2 > 0.0:
-            setattr(self.value, 'probs', self.compute_degree_probs())
-        else:
-            setattr(self.value, 'probs', None)
+        # Prior components of this expression, from the caches if available. Degrees do not depend
+        # on lambda, so both are computed if either is needed and shared with every other hypothesis
+        # with the same expression (in this process, and across runs through the persistent cache)
+        need_degrees = self.lam_1 > 0.0 or self.lam_2 > 0.0
+        global prior_space
+        space = (value_hash(self.grammar, cache.grammar_hash), value_hash(self.all_contexts, cache.contexts_hash))
+        if prior_space != space:
+            # Cached prior components are for another grammar or other contexts
+            prior_components.entries.clear()
+            prior_space = space
+        key = str(self.value)
+        components = prior_components.get(key)
+        if components is None and self.prior_cache is not None:
+            components = self.prior_cache.get(key)
+            if components is not None:
+                components['probs'] = None
+                prior_components.put(key, components)
+        if components is None or (need_degrees and components['degree_monotonicity'] is None):
+            components = self.compute_prior_components(need_degrees)
+            prior_components.put(key, components)
+            if self.prior_cache is not None:
+                self.prior_cache.put(key, components)
+
+        if getattr(self.value, 'signature', None) is None and components['signature'] is not None:
+            setattr(self.value, 'signature', components['signature'])
+            self.value.NoCopy.add('signature')
+
+        setattr(self.value, 'probs', components['probs'] if need_degrees else None)
         if self.lam_1 > 0.0:
-            setattr(self.value, 'degree_monotonicity', self.compute_degree_monotonicity())
+            setattr(self.value, 'degree_monotonicity', components['degree_monotonicity'])
         else:
             # Not actually meaningfully zero, just so that the term zeroes out in prior computation
             setattr(self.value, 'degree_monotonicity', 0.0)
 
         if self.lam_2 > 0.0:
-            setattr(self.value, 'degree_conservativity', self.compute_degree_conservativity())
+            setattr(self.value, 'degree_conservativity', components['degree_conservativity'])
         else:
             # Not actually meaningfully zero, just so that the term zeroes out in prior computation
             setattr(self.value, 'degree_conservativity', 0.0)         
@@ -294,76 +408,155 @@ class HypothesisA(BinaryLikelihood, LOTHypothesis):
         self.value.NoCopy.add('degree_monotonicity')
         self.value.NoCopy.add('degree_conservativity')
 
-        return (self.grammar.log_probability(self.value) / self.prior_temperature) + (self.lam_1 * limit_log(self.value.degree_monotonicity)) + (self.lam_2 * limit_log(self.value.degree_conservativity))
+        return (components['log_probability'] / self.prior_temperature) + (self.lam_1 * limit_log(self.value.degree_monotonicity)) + (self.lam_2 * limit_log(self.value.degree_conservativity))
+
+    def compute_prior_components(self, need_degrees):
+        """
+        Compute the parts of the prior which only depend on the expression (not on lambda).
+
+        Parameters:
+            - need_degrees (bool): Whether to compute the degrees of monotonicity and conservativity
+
+        Returns:
+            - components (dict): log_probability (under the grammar), probs, degree_monotonicity and
+            degree_conservativity (None if not computed) and signature (see signature)
+        """
+        components = {'log_probability': self.grammar.log_probability(self.value),
+                      'probs': None,
+                      'degree_monotonicity': None,
+                      'degree_conservativity': None,
+                      'signature': self.signature()}
+        if need_degrees:
+            setattr(self.value, 'probs', self.compute_degree_probs())
+            components['probs'] = self.value.probs
+            components['degree_monotonicity'] = self.compute_degree_monotonicity()
+            components['degree_conservativity'] = self.compute_degree_conservativity()
+        return components
 
     def compute_degree_monotonicity(self):
         """
         Compute degree of monotonicity, similar to that seen in Posdijk
         Takes the max of the upward monotonicity measure and downward
         """
+        return float(degree_monotonicity(self.value.probs))
 
-        # Get H(1Q)
-        h_1_q = -((self.value.probs['M_t'] * limit_log(self.value.probs['M_t'])) + (self.value.probs['M_f'] * limit_log(self.value.probs['M_f'])))
+    def compute_degree_conservativity(self):
+        """
+        Compute degree of conservativity, evaluate truth in <M, A, A \cap B>
+        i.e. B' = A \cap B
+        """
+        return float(degree_conservativity(self.value.probs))
 
-        if h_1_q == 0.0:
-            return 1.0
-            
-        # Get H(1Q | 1Q<)
-        h_1_q_sub = -((self.value.probs['M_t_sub_t'] * limit_log(self.value.probs['M_t_sub_t'] / (self.value.probs['sub_t'] + k))) +\
-                    (self.value.probs['M_t_sub_f'] * limit_log(self.value.probs['M_t_sub_f'] / (self.value.probs['sub_f'] + k))) +\
-                    (self.value.probs['M_f_sub_t'] * limit_log(self.value.probs['M_f_sub_t'] / (self.value.probs['sub_t'] + k))) +\
-                    (self.value.probs['M_f_sub_f'] * limit_log(self.value.probs['M_f_sub_f'] / (self.value.probs['sub_f'] + k))))
+def degree_probs(truth, sub, sup, cons):
+    """
+    Probabilities (proportions of contexts) of a quantifier being true/false in a context and
+    in its sub/super/conservation models, as used by degree_monotonicity and degree_conservativity.
+    Works on the truth values of one quantifier (vectors) or of many at once (one row each).
 
-        # Get H(1Q | 1Q>)
-        h_1_q_super = -((self.value.probs['M_t_super_t'] * limit_log(self.value.probs['M_t_super_t'] / (self.value.probs['super_t'] + k))) +\
-                    (self.value.probs['M_t_super_f'] * limit_log(self.value.probs['M_t_super_f'] / (self.value.probs['super_f'] + k))) +\
-                    (self.value.probs['M_f_super_t'] * limit_log(self.value.probs['M_f_super_t'] / (self.value.probs['super_t'] + k))) +\
-                    (self.value.probs['M_f_super_f'] * limit_log(self.value.probs['M_f_super_f'] / (self.value.probs['super_f'] + k))))
+    Parameters:
+        - truth (numpy array (bool)): 1Q(M) for every context M
+        - sub (numpy array (bool)): Whether 1Q is true in some submodel of every context
+        - sup (numpy array (bool)): Whether 1Q is true in some supermodel of every context
+        - cons (numpy array (bool)): 1Q in the conservation model of every context
 
-        up_degree = float(1 - (h_1_q_sub / h_1_q))
-        down_degree = float(1 - (h_1_q_super / h_1_q))
+    Returns:
+        - probs (dict): Dictionary of relevant probabilities (M_t, sub_t, M_t_sub_f, ...)
+    """
+    related = {'sub': sub, 'super': sup, 'cons': cons}
+
+    # Proportions of all situations, i.e. true in current model, not true in submodels, etc.
+    probs = {'M_t': np.mean(truth, axis=-1),
+             'M_f': np.mean(~truth, axis=-1)}
+    for name, other in related.items():
+        probs[name + '_t'] = np.mean(other, axis=-1)
+        probs[name + '_f'] = np.mean(~other, axis=-1)
+    for name, other in related.items():
+        probs['M_t_' + name + '_t'] = np.mean(truth & other, axis=-1)
+        probs['M_t_' + name + '_f'] = np.mean(truth & ~other, axis=-1)
+        probs['M_f_' + name + '_t'] = np.mean(~truth & other, axis=-1)
+        probs['M_f_' + name + '_f'] = np.mean(~truth & ~other, axis=-1)
+
+    return probs
+
+def degree_monotonicity(probs):
+    """
+    Degree of monotonicity from degree_probs (elementwise if the probabilities are arrays).
+    Takes the max of the upward monotonicity measure and downward
+    """
 
-        # Make sure values in range (sometimes they get very slightly above or below)
-        if up_degree < 0.:
-            up_degree = 0
-        if up_degree > 0.999:
-            up_degree = 1.0
-        if down_degree < 0.:
-            down_degree = 0
-        if down_degree > 0.999:
-            down_degree = 1.0
+    # Get H(1Q)
+    h_1_q = -((probs['M_t'] * limit_log_array(probs['M_t'])) + (probs['M_f'] * limit_log_array(probs['M_f'])))
 
-        return max(up_degree, down_degree)
+    # Get H(1Q | 1Q<)
+    h_1_q_sub = -((probs['M_t_sub_t'] * limit_log_array(probs['M_t_sub_t'] / (probs['sub_t'] + k))) +\
+                (probs['M_t_sub_f'] * limit_log_array(probs['M_t_sub_f'] / (probs['sub_f'] + k))) +\
+                (probs['M_f_sub_t'] * limit_log_array(probs['M_f_sub_t'] / (probs['sub_t'] + k))) +\
+                (probs['M_f_sub_f'] * limit_log_array(probs['M_f_sub_f'] / (probs['sub_f'] + k))))
 
-    def compute_degree_conservativity(self):
-        """
-        Compute degree of conservativity, evaluate truth in <M, A, A \cap B>
-        i.e. B' = A \cap B
-        """
+    # Get H(1Q | 1Q>)
+    h_1_q_super = -((probs['M_t_super_t'] * limit_log_array(probs['M_t_super_t'] / (probs['super_t'] + k))) +\
+                (probs['M_t_super_f'] * limit_log_array(probs['M_t_super_f'] / (probs['super_f'] + k))) +\
+                (probs['M_f_super_t'] * limit_log_array(probs['M_f_super_t'] / (probs['super_t'] + k))) +\
+                (probs['M_f_super_f'] * limit_log_array(probs['M_f_super_f'] / (probs['super_f'] + k))))
+
+    # Make sure values in range (sometimes they get very slightly above or below)
+    up_degree = clip_degree(1 - (h_1_q_sub / np.where(h_1_q == 0.0, 1.0, h_1_q)))
+    down_degree = clip_degree(1 - (h_1_q_super / np.where(h_1_q == 0.0, 1.0, h_1_q)))
 
-        # Get H(1Q)
-        h_1_q = -((self.value.probs['M_t'] * limit_log(self.value.probs['M_t'])) + (self.value.probs['M_f'] * limit_log(self.value.probs['M_f'])))
+    return np.where(h_1_q == 0.0, 1.0, np.maximum(up_degree, down_degree))
 
-        if h_1_q == 0:
-            return 1
+def degree_conservativity(probs):
+    """
+    Degree of conservativity from degree_probs (elementwise if the probabilities are arrays),
+    evaluate truth in <M, A, A \cap B> i.e. B' = A \cap B
+    """
 
-        # Get H(1Q | 1Q con)
-        h_1_q_cons = -((self.value.probs['M_t_cons_t'] * limit_log(self.value.probs['M_t_cons_t'] / (self.value.probs['cons_t'] + k))) +\
-                    (self.value.probs['M_t_cons_f'] * limit_log(self.value.probs['M_t_cons_f'] / (self.value.probs['cons_f'] + k))) +\
-                    (self.value.probs['M_f_cons_t'] * limit_log(self.value.probs['M_f_cons_t'] / (self.value.probs['cons_t'] + k))) +\
-                    (self.value.probs['M_f_cons_f'] * limit_log(self.value.probs['M_f_cons_f'] / (self.value.probs['cons_f'] + k))))
+    # Get H(1Q)
+    h_1_q = -((probs['M_t'] * limit_log_array(probs['M_t'])) + (probs['M_f'] * limit_log_array(probs['M_f'])))
 
-        degree_cons = float(1 - (h_1_q_cons / h_1_q))
+    # Get H(1Q | 1Q con)
+    h_1_q_cons = -((probs['M_t_cons_t'] * limit_log_array(probs['M_t_cons_t'] / (probs['cons_t'] + k))) +\
+                (probs['M_t_cons_f'] * limit_log_array(probs['M_t_cons_f'] / (probs['cons_f'] + k))) +\
+                (probs['M_f_cons_t'] * limit_log_array(probs['M_f_cons_t'] / (probs['cons_t'] + k))) +\
+                (probs['M_f_cons_f'] * limit_log_array(probs['M_f_cons_f'] / (probs['cons_f'] + k))))
 
-        # Make sure in range
-        if degree_cons < 0.:
-            degree_cons = 0
-        if degree_cons > 0.999:
-            degree_cons = 1.0
+    # Make sure in range
+    degree_cons = clip_degree(1 - (h_1_q_cons / np.where(h_1_q == 0.0, 1.0, h_1_q)))
 
-        return degree_cons
+    return np.where(h_1_q == 0.0, 1.0, degree_cons)
+
+def clip_degree(degree):
+    """
+    Make sure degrees are in [0, 1] (sometimes they get very slightly above or below)
+    """
+    return np.where(degree < 0., 0.0, np.where(degree > 0.999, 1.0, degree))
 
-def create_hypothesis(h_type, grammar, lam_1, lam_2, all_contexts):
+def space_degrees(h_space, all_contexts):
+    """
+    Degrees of monotonicity and conservativity of many hypotheses at once (e.g. a fixed hypothesis
+    space), from their truth values on all_contexts and on the conservation models of all_contexts.
+
+    Parameters:
+        - h_space (list): Hypotheses with eval_counts (HypothesisA, or restored from a checkpoint)
+        - all_contexts (data_handling.ContextSpace): All possible contexts
+
+    Returns:
+        - degree_monotonicity, degree_conservativity (numpy array (float)): Degrees of each hypothesis
+    """
+    if len(h_space) == 0:
+        return np.zeros(0), np.zeros(0)
+    A, B = all_contexts.counts[:, 0, :], all_contexts.counts[:, 1, :]
+    counts = np.concatenate([all_contexts.counts, np.stack([A, np.minimum(A, B)], axis=1)])
+    n = len(all_contexts.counts)
+    evaluated = np.array([h.eval_counts(counts) for h in h_space], dtype=bool)
+    truth, cons = evaluated[:, :n], evaluated[:, n:]
+    truth_f = truth.astype(np.float32)
+    sub = (truth_f @ all_contexts.sub.T.astype(np.float32)) > 0
+    sup = (truth_f @ all_contexts.super.T.astype(np.float32)) > 0
+    probs = degree_probs(truth, sub, sup, cons)
+    return degree_monotonicity(probs), degree_conservativity(probs)
+
+def create_hypothesis(h_type, grammar, lam_1, lam_2, all_contexts, prior_cache=None):
     """
     Uses a grammar and a specified hypothesis type to create an object
     of the desired hypothesis class. This is used to be able to return
@@ -377,21 +570,56 @@ def create_hypothesis(h_type, grammar, lam_1, lam_2, all_contexts):
         be generated
         - lam_1 (float): Lambda value [0,1] to give weight to degree of monotonicity
         - lam_2 (float): Lambda value [0,1] to give weight to degree of conservativity
-        - all_contexts (float): For measuring degrees
+        - all_contexts (data_handling.ContextSpace): For measuring degrees
+        - prior_cache (cache.PriorCache): Persistent cache of prior components (None to not use one)
 
     Returns:
         - (LOTLib3.Hypothesis): A hypothesis of the type specified with the grammar specified.
         - None: If the hypothesis specified does not exist yet (you must create it).
     """
     if h_type == "A":
-        return HypothesisA(grammar=grammar, lam_1=lam_1, lam_2=lam_2, all_contexts=all_contexts)
+        return HypothesisA(grammar=grammar, lam_1=lam_1, lam_2=lam_2, all_contexts=all_contexts, prior_cache=prior_cache)
     else:
         raise Exception("There exists no h_type \'" + h_type + '\'. Check hypotheses.py for types of hypotheses to use.')
 
+def value_hash(obj, hash_function):
+    """
+    Hash of a grammar or context space by value (cache.grammar_hash or cache.contexts_hash), computed once
+    per object and kept on it. Copies of the object (e.g. sent to worker processes with each task) carry
+    it along, and equal objects have equal hashes, so they share the in-process caches.
+    """
+    h = getattr(obj, 'value_hash', None)
+    if h is None:
+        h = hash_function(obj)
+        setattr(obj, 'value_hash', h)
+    return h
+
+def resize_caches(capacity):
+    """
+    Set the capacity (number of expressions) of the in-process prior, likelihood and subtree value caches.
+    """
+    prior_components.resize(capacity)
+    likelihoods.resize(capacity)
+    subtree_values.resize(capacity)
+
+def cache_stats():
+    """
+    Returns:
+        - (dict): Hit/miss statistics of the in-process prior and likelihood caches
+    """
+    return {'prior_lru': prior_components.stats(), 'likelihood_lru': likelihoods.stats(), 'subtree_lru': subtree_values.stats()}
+
 def limit_log(x):
     """
     Suitable for entropies where convention is to use limit of 0 * log(0) = 0
     """
     if x == 0.0:
         return 0
-    return log(x,2)
\ No newline at end of file
+    return log(x,2)
+
+def limit_log_array(x):
+    """
+    Elementwise limit_log for arrays (0 where x is 0, else log base 2)
+    """
+    x = np.asarray(x, dtype=float)
+    return np.log2(np.where(x == 0.0, 1.0, x))
@@ -6,7 +6,7 @@
 # -----------------------------------------------------------
 
 from LOTlib3.Eval import primitive
-from multiset import *
+
 
 @primitive
 def card_gt(x,y):
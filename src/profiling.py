@@ -0,0 +1,145 @@
+# -----------------------------------------------------------
+# Lightweight profiling of training runs: wall time (total and own, i.e.
+# excluding instrumented calls inside), call counts and evaluation counts
+# per phase, plus peak memory. Functions are only wrapped when profiling
+# is turned on, so there is no overhead otherwise.
+# -----------------------------------------------------------
+
+import time
+from functools import wraps
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+enabled = False
+phases = {}   # Phase name -> [calls, evaluations, seconds, own seconds]
+counters = {} # Counter name -> count
+stack = []    # Time spent in instrumented calls inside each running phase
+
+
+def record(name, elapsed, evaluations=0):
+    # Add a finished call to a phase's totals
+    inner = stack.pop()
+    entry = phases.setdefault(name, [0, 0, 0.0, 0.0])
+    entry[0] += 1
+    entry[1] += evaluations
+    entry[2] += elapsed
+    entry[3] += elapsed - inner
+    if len(stack) > 0:
+        stack[-1] += elapsed
+
+def instrument(owner, attr, name=None, evaluations=None):
+    """
+    Replace a function or method with a timed version (once, instrumenting again does nothing).
+
+    Parameters:
+        - owner (class or module): Where the function is defined
+        - attr (str): Name of the function
+        - name (str): Name of the phase (attr if not given)
+        - evaluations (function): Called with the function's arguments, returns the number of evaluations the call does
+    """
+    f = getattr(owner, attr)
+    if getattr(f, 'profiled', False):
+        return
+    name = attr if name is None else name
+
+    @wraps(f)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        stack.append(0.0)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start, evaluations(*args, **kwargs) if evaluations is not None else 0)
+
+    timed.profiled = True
+    setattr(owner, attr, timed)
+
+
+class phase(object):
+    """
+    Context manager timing a block of code as a phase (does nothing if profiling is off).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+            stack.append(0.0)
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def count(name, n=1):
+    # Add to a counter (does nothing if profiling is off)
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+def reset():
+    phases.clear()
+    counters.clear()
+    del stack[:]
+
+def peak_memory_mb():
+    """
+    Returns:
+        - (float): Peak resident memory of this process (and of its finished child processes), in MB (None if unknown)
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+def summary():
+    """
+    Returns:
+        - (dict): Totals of every phase and counter recorded since the last reset, and peak memory
+    """
+    return {'phases': {name: {'calls': e[0], 'evaluations': e[1], 'seconds': e[2], 'own_seconds': e[3]} for name, e in phases.items()},
+            'counters': dict(counters),
+            'peak_memory_mb': peak_memory_mb()}
+
+def merge(summaries):
+    """
+    Combine summaries (e.g. of models trained in different processes): totals are added, peak memory is the maximum.
+
+    Returns:
+        - (dict): The combined summary
+    """
+    merged = {'phases': {}, 'counters': {}, 'peak_memory_mb': None}
+    for s in summaries:
+        for name, p in s['phases'].items():
+            m = merged['phases'].setdefault(name, {'calls': 0, 'evaluations': 0, 'seconds': 0.0, 'own_seconds': 0.0})
+            for key in m:
+                m[key] += p[key]
+        for name, n in s['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + n
+        if s['peak_memory_mb'] is not None:
+            merged['peak_memory_mb'] = max(merged['peak_memory_mb'] or 0.0, s['peak_memory_mb'])
+    return merged
+
+def difference(after, before):
+    """
+    What was recorded between two summaries of the same process (peak memory is the later one).
+
+    Returns:
+        - (dict): A summary of the calls and counts in after but not in before
+    """
+    diff = {'phases': {}, 'counters': {}, 'peak_memory_mb': after['peak_memory_mb']}
+    for name, p in after['phases'].items():
+        b = before['phases'].get(name, {})
+        d = {key: p[key] - b.get(key, 0) for key in p}
+        if d['calls'] > 0:
+            diff['phases'][name] = d
+    for name, n in after['counters'].items():
+        if n - before['counters'].get(name, 0) > 0:
+            diff['counters'][name] = n - before['counters'].get(name, 0)
+    return diff
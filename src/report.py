@@ -0,0 +1,199 @@
+# -----------------------------------------------------------
+# Report on finished experiments (post hoc, e.g. after a sweep or runs
+# with -no_plot): scans a results folder, compares every experiment's
+# models with the human data (whose accuracies are computed once per
+# experiment type and cached), writes one summary table of all runs and
+# plots the experiments in parallel. Each experiment's results folder
+# records how it was run in run.json, which gives the human data.
+#
+# Usage: python report.py -out ./../results/ [-exp_id ID ...] [-workers N]
+# -----------------------------------------------------------
+
+# Python Imports
+import os
+import argparse
+import csv
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Personal Code
+import dataset_cache as dataset_cache_module
+import results
+
+# Other
+import numpy as np
+
+# Parameters of each run written to the summary table (from its run.json)
+RUN_COLUMNS = ['exp_type', 'g_type', 'inference', 'lam_1', 'lam_2', 'alpha', 'sample_steps', 'chain', 'seed']
+
+def parse_args():
+    """
+    Parse all command line arguments
+
+    Parameters:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The list of arguments passed in
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-out",type=str, help = "Path where experiment results folders are stored", default ="./../results/")
+    parser.add_argument("-exp_id",type=str, nargs="+", help = "Experiments to report on (every finished experiment in out if not given)", default=None)
+    parser.add_argument("-force",action="store_true", help = "Plot experiments again even if they already have a plot")
+    parser.add_argument("-no_plot",action="store_true", help = "Only write the summary table")
+    parser.add_argument("-workers",type=int, help = "Number of processes plotting experiments in parallel", default=os.cpu_count())
+    parser.add_argument("-dpi",type=int, help = "Resolution of the plots", default=400)
+    parser.add_argument("-human_cache",type=str, help = "Directory where human accuracies of each experiment type are cached (out/human_accuracy/ if not given)", default=None)
+    parser.add_argument("-summary",type=str, help = "Path of the summary table (out/summary.csv if not given)", default=None)
+    args = parser.parse_args()
+    return args
+
+def finished_experiments(out):
+    """
+    Returns:
+        - exp_ids (list (str)): The experiments in out with results (sorted)
+    """
+    return sorted(f_name for f_name in os.listdir(out)
+                  if os.path.exists(out + f_name + "/run.json") and os.path.exists(results.path(out, f_name)))
+
+def read_run(out, exp_id):
+    with open(out + exp_id + "/run.json", 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def human_accuracy(data_path, human_cache, dataset_cache=None):
+    """
+    Proportion of humans correct at each context (see visualize.h_acc), cached in human_cache
+    and computed again only when the data files change.
+
+    Parameters:
+        - data_path (str): Path to the experiment's data files
+        - human_cache (str): Directory where human accuracies are cached
+        - dataset_cache (str): Directory of compiled datasets (see dataset_cache.py), if the run used one
+
+    Returns:
+        - human_percent_correct (numpy array (float)): Proportion of humans correct at each context
+    """
+    key = hashlib.sha1(json.dumps([os.path.abspath(data_path), dataset_cache_module.source_files(data_path)]).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(human_cache, os.path.basename(os.path.normpath(data_path)) + "_" + key + ".npy")
+    if os.path.exists(path):
+        return np.load(path)
+
+    # Answers of each human (1 if correct), read without the plotting libraries
+    if dataset_cache is not None:
+        answers = dataset_cache_module.open_dataset(data_path, dataset_cache).human_answers()
+    else:
+        with ThreadPoolExecutor() as pool:
+            answers = [parsed[2] for parsed in pool.map(dataset_cache_module.read_file, [data_path + f_name for f_name in os.listdir(data_path)])]
+    human_percent_correct = np.mean(np.array(answers).T == 1.0, axis=1)
+    os.makedirs(human_cache, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, human_percent_correct)
+    os.replace(tmp, path)
+    return human_percent_correct
+
+def summarize(curves, human_percent_correct):
+    """
+    Compare the learning curves of many experiments (of the same experiment type) with the humans', all at once.
+
+    Parameters:
+        - curves (numpy array (float)): runs x contexts average posterior predictive of the models
+        - human_percent_correct (numpy array (float)): Proportion of humans correct at each context
+
+    Returns:
+        - stats (dict): r2 (coefficient of determination of the human curve by the model curve, as
+        sklearn's r2_score), mae (mean absolute difference) and the final model and human values, one per run
+    """
+    n = min(curves.shape[1], len(human_percent_correct))
+    curves, human = curves[:, :n], human_percent_correct[np.newaxis, :n]
+    ss_res = np.sum((human - curves) ** 2, axis=1)
+    ss_tot = np.sum((human - np.mean(human)) ** 2)
+    return {'r2': 1.0 - ss_res / ss_tot if ss_tot > 0 else np.full(len(curves), np.nan),
+            'mae': np.mean(np.abs(human - curves), axis=1),
+            'final_model': curves[:, -1] if n > 0 else np.full(len(curves), np.nan),
+            'final_human': np.full(len(curves), human[0, -1] if n > 0 else np.nan)}
+
+def plot(out, exp_id, exp_type, human_percent_correct, dpi):
+    # Plot one experiment (in a worker process, which imports the plotting libraries)
+    import visualize
+    visualize.plt_hm_acc(None, out, exp_id, exp_type, human_percent_correct=human_percent_correct, dpi=dpi)
+    return exp_id
+
+def report(out, exp_ids, human_cache, summary_path, plot_workers=1, force=False, no_plot=False, dpi=400):
+    """
+    Summarize and plot the results of finished experiments.
+
+    Parameters:
+        - out (str): Path where experiment results folders are stored
+        - exp_ids (list (str)): Identifiers of the experiments
+        - human_cache (str): Directory where human accuracies are cached
+        - summary_path (str): Path of the summary table (one row per experiment)
+        - plot_workers (int): Number of processes plotting experiments
+        - force (bool): Plot experiments that already have a plot again
+        - no_plot (bool): Only write the summary table
+        - dpi (int): Resolution of the plots
+
+    Returns:
+        - rows (list (dict)): The rows of the summary table
+    """
+    runs = {exp_id: read_run(out, exp_id) for exp_id in exp_ids}
+
+    # Human accuracies once per data directory, model learning curves grouped by it
+    groups = {}
+    for exp_id, run in runs.items():
+        data_path = run['data_dir'] + "/" + run['exp_type'] + "/"
+        groups.setdefault((data_path, run.get('dataset_cache')), []).append(exp_id)
+
+    rows = []
+    human = {}
+    for (data_path, dataset_cache), group in sorted(groups.items(), key=lambda item: str(item[0])):
+        print("Human accuracy of", data_path)
+        human_percent_correct = human_accuracy(data_path, human_cache, dataset_cache)
+        loaded = [results.load(out, exp_id) for exp_id in group]
+        width = max(r.post_preds.shape[1] for r in loaded)
+        curves = np.full((len(group), width), np.nan)
+        for k, r in enumerate(loaded):
+            curves[k, :r.post_preds.shape[1]] = np.nanmean(r.post_preds, axis=0)
+        stats = summarize(curves, human_percent_correct)
+
+        for k, exp_id in enumerate(group):
+            human[exp_id] = human_percent_correct
+            row = {'exp_id': exp_id}
+            row.update({name: runs[exp_id].get(name) for name in RUN_COLUMNS})
+            row['models'] = len(loaded[k])
+            row['contexts'] = int(np.max(loaded[k].n_contexts)) if len(loaded[k]) > 0 else 0
+            row.update({name: float(values[k]) for name, values in stats.items()})
+            row['mean_rhat'] = float(np.nanmean(loaded[k].rhat)) if np.any(~np.isnan(loaded[k].rhat)) else float('nan')
+            row['mean_steps'] = float(np.nanmean(loaded[k].steps)) if np.any(~np.isnan(loaded[k].steps)) else float('nan')
+            rows.append(row)
+
+    rows.sort(key=lambda row: row['exp_id'])
+    os.makedirs(os.path.dirname(summary_path) or ".", exist_ok=True)
+    with open(summary_path + ".tmp", 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['exp_id'] + RUN_COLUMNS + ['models', 'contexts', 'r2', 'mae', 'final_model', 'final_human', 'mean_rhat', 'mean_steps'])
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(summary_path + ".tmp", summary_path)
+    print("Wrote summary of", len(rows), "experiments to", summary_path)
+
+    if not no_plot:
+        to_plot = [exp_id for exp_id in exp_ids if force or not os.path.exists(out + exp_id + "/" + exp_id + "_acc.png")]
+        print("Plotting", len(to_plot), "experiments (" + str(len(exp_ids) - len(to_plot)), "already plotted)")
+        if plot_workers > 1 and len(to_plot) > 1:
+            with ProcessPoolExecutor(max_workers=plot_workers) as pool:
+                for exp_id in pool.map(plot, [out] * len(to_plot), to_plot, [runs[e]['exp_type'] for e in to_plot],
+                                       [human[e] for e in to_plot], [dpi] * len(to_plot)):
+                    print("Plotted", exp_id)
+        else:
+            for exp_id in to_plot:
+                print("Plotted", plot(out, exp_id, runs[exp_id]['exp_type'], human[exp_id], dpi))
+    return rows
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    exp_ids = args.exp_id if args.exp_id is not None else finished_experiments(args.out)
+    human_cache = args.human_cache if args.human_cache is not None else os.path.join(args.out, "human_accuracy")
+    summary_path = args.summary if args.summary is not None else os.path.join(args.out, "summary.csv")
+    report(args.out, exp_ids, human_cache, summary_path, args.workers, args.force, args.no_plot, args.dpi)
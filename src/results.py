@@ -0,0 +1,153 @@
+# -----------------------------------------------------------
+# Results of an experiment in one file (exp_id_results.npz): the posterior
+# predictive of every model at every context, each model's hypothesis space
+# (expressions, priors, degrees) with the posterior over it at every
+# context, convergence diagnostics, sampler steps and how the experiment
+# was run.
+# -----------------------------------------------------------
+
+import os
+import json
+
+import numpy as np
+
+# Number of hypotheses kept per model with exact inference (the most probable ones at any context),
+# since the enumerated space is too large to store the posterior over all of it for every model
+EXACT_TOP = 100
+
+
+def path(out, exp_id):
+    """
+    Path of the results file of an experiment.
+    """
+    return out + exp_id + "/" + exp_id + "_results.npz"
+
+def model_result(post_preds, posterior_probs, expressions, priors, degree_monotonicity, degree_conservativity, convergence=None, steps=None):
+    """
+    Results of one model.
+
+    Parameters:
+        - post_preds (numpy array (float)): Posterior predictive probability of each context's label
+        - posterior_probs (numpy array (float)): H x n matrix, posterior of each hypothesis before each context
+        - expressions (list (str)): The H hypotheses
+        - priors (numpy array (float)): Log prior of each hypothesis
+        - degree_monotonicity, degree_conservativity (numpy array (float)): Degrees of each hypothesis
+        - convergence (list (tuple)): R-hat and ESS at each context, if several chains were run
+        - steps (list (int)): Number of sampler steps taken at each context, if known
+
+    Returns:
+        - result (dict): The model's results (see save)
+    """
+    n = len(post_preds)
+    convergence = np.array(convergence, dtype=float).reshape(-1, 2) if convergence is not None and len(convergence) > 0 \
+        else np.full((n, 2), np.nan)
+    return {'post_preds': np.asarray(post_preds, dtype=float),
+            'posterior_probs': np.asarray(posterior_probs, dtype=float).reshape(len(expressions), n),
+            'expressions': [str(e) for e in expressions],
+            'priors': np.asarray(priors, dtype=float),
+            'degree_monotonicity': np.asarray(degree_monotonicity, dtype=float),
+            'degree_conservativity': np.asarray(degree_conservativity, dtype=float),
+            'rhat': convergence[:, 0],
+            'ess': convergence[:, 1],
+            'steps': np.asarray(steps, dtype=float) if steps is not None and len(steps) == n else np.full(n, np.nan)}
+
+def save(results_path, models, metadata):
+    """
+    Write the results of all models of an experiment at once (to a temporary file, which then
+    replaces the results file). Models with fewer contexts than others are padded with NaN.
+
+    Parameters:
+        - results_path (str): Path of the results file
+        - models (list (dict)): Results of each model in order (see model_result)
+        - metadata (dict): How the experiment was run (JSON serializable)
+
+    Returns:
+        - None
+    """
+    n_contexts = np.array([len(m['post_preds']) for m in models], dtype=np.int64)
+    width = int(n_contexts.max()) if len(models) > 0 else 0
+    n_hypotheses = np.array([len(m['expressions']) for m in models], dtype=np.int64)
+
+    def padded(key, rows):
+        # Stack per-model arrays (rows x contexts) into one NaN-padded matrix
+        stacked = np.full((sum(rows), width), np.nan)
+        start = 0
+        for m, r in zip(models, rows):
+            if r == 0:
+                continue
+            values = m[key].reshape(r, -1)
+            stacked[start:start + r, :values.shape[1]] = values
+            start += r
+        return stacked
+
+    ones = [1] * len(models)
+    arrays = {'post_preds': padded('post_preds', ones),
+              'rhat': padded('rhat', ones),
+              'ess': padded('ess', ones),
+              'steps': padded('steps', ones),
+              'n_contexts': n_contexts,
+              'h_offsets': np.concatenate([[0], np.cumsum(n_hypotheses)]).astype(np.int64),
+              'posterior_probs': padded('posterior_probs', n_hypotheses),
+              'expressions': np.array([e for m in models for e in m['expressions']], dtype=str),
+              'metadata': np.array(json.dumps(metadata))}
+    for key in ('priors', 'degree_monotonicity', 'degree_conservativity'):
+        arrays[key] = np.concatenate([m[key] for m in models]) if len(models) > 0 else np.zeros(0)
+
+    tmp = results_path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, results_path)
+
+
+class Results(object):
+    """
+    The results of an experiment, read from its results file in one go.
+
+    Attributes:
+        - post_preds (numpy array (float)): models x contexts posterior predictive probabilities (NaN past a model's last context)
+        - rhat, ess (numpy array (float)): models x contexts convergence diagnostics (NaN if one chain was run)
+        - steps (numpy array (float)): models x contexts number of sampler steps taken (NaN if not known)
+        - n_contexts (numpy array (int)): Number of contexts of each model
+        - metadata (dict): How the experiment was run
+    """
+
+    def __init__(self, results_path):
+        with np.load(results_path) as f:
+            arrays = {key: f[key] for key in f.files}
+        self.post_preds = arrays['post_preds']
+        self.rhat = arrays['rhat']
+        self.ess = arrays['ess']
+        self.steps = arrays['steps'] if 'steps' in arrays else np.full(self.post_preds.shape, np.nan)
+        self.n_contexts = arrays['n_contexts']
+        self.h_offsets = arrays['h_offsets']
+        self.posterior_probs = arrays['posterior_probs']
+        self.expressions = arrays['expressions']
+        self.priors = arrays['priors']
+        self.degree_monotonicity = arrays['degree_monotonicity']
+        self.degree_conservativity = arrays['degree_conservativity']
+        self.metadata = json.loads(str(arrays['metadata']))
+
+    def __len__(self):
+        return len(self.n_contexts)
+
+    def hypotheses(self, i):
+        """
+        Hypothesis space of model i (counting from 0).
+
+        Returns:
+            - space (dict): expressions, priors, degree_monotonicity, degree_conservativity (one per
+            hypothesis) and posterior_probs (hypotheses x contexts)
+        """
+        start, end = self.h_offsets[i], self.h_offsets[i + 1]
+        return {'expressions': self.expressions[start:end],
+                'priors': self.priors[start:end],
+                'degree_monotonicity': self.degree_monotonicity[start:end],
+                'degree_conservativity': self.degree_conservativity[start:end],
+                'posterior_probs': self.posterior_probs[start:end, :self.n_contexts[i]]}
+
+def load(out, exp_id):
+    """
+    Returns:
+        - results (Results): The results of the experiment exp_id in out
+    """
+    return Results(path(out, exp_id))
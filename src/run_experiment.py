@@ -7,16 +7,29 @@
 # -----------------------------------------------------------
 
 # Python Imports
+import time
+START = time.perf_counter() # For the time to import the training path (once per process)
 import os
+import sys
 import argparse
-import time
+import json
+import cProfile
+import random
+from copy import copy
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Personal Code
 import primitives
 import data_handling
 import grammars
 import hypotheses
-import visualize
+import cache
+import enumeration
+import diagnostics
+import dataset_cache
+import profiling
+import checkpoint
+import results
 
 # LOTLib
 from LOTlib3.Samplers.MetropolisHastings import MetropolisHastingsSampler
@@ -26,19 +39,21 @@ from LOTlib3.Miscellaneous import Infinity
 from LOTlib3 import break_ctrlc
 
 # Other
-from multiset import *
 import numpy as np
-from math import exp
-from scipy.special import softmax
 
-TIME = time.strftime("%m%d%M%S")
+IMPORT_SECONDS = time.perf_counter() - START
+
+TIME = time.strftime("%m%d%H%M%S")
+
+# Options that can be changed when an experiment is resumed (they do not change its results)
+RESUME_OVERRIDES = ('resume', 'out', 'workers', 'no_plot', 'profile', 'cprofile', 'startup_budget')
 
-def parse_args():
+def parse_args(argv=None):
     """
     Parse all command line arguments
 
     Parameters:
-        - None
+        - argv (list (str)): Arguments to parse (the command line if None)
 
     Returns:
         - args (argparse.Namespace): The list of arguments passed in
@@ -53,11 +68,55 @@ def parse_args():
     parser.add_argument("-alpha",type=float, help = "Assumed noisiness of data (min = 1.0)", default=0.99)
     parser.add_argument("-lam_1",type=float, help = "How much weight to give to degree of monotonicity [0,1]", default=0.0)
     parser.add_argument("-lam_2",type=float, help = "How much weight to give to degree of conservativity [0,1]", default=0.0)
-    args = parser.parse_args()
+    parser.add_argument("-workers",type=int, help = "Number of processes to train models (one per human) in parallel", default=1)
+    parser.add_argument("-seed",type=int, help = "Random seed, each model is seeded from this and its number (random if not given)", default=None)
+    parser.add_argument("-prior_cache",type=str, help = "Path to a persistent cache (SQLite database) of hypothesis priors and degrees, shared across runs (none if not given)", default=None)
+    parser.add_argument("-prior_cache_size",type=int, help = "Maximum number of entries in the persistent prior cache", default=100000)
+    parser.add_argument("-lru_size",type=int, help = "Number of expressions (and subtrees) kept in the in-process caches of priors, likelihoods and subtree values", default=10000)
+    parser.add_argument("-chain",type=str, choices=["restart", "warm"], help = "Restart the sampler from h0 at every context, or continue the chain from the previous context (warm start)", default="restart")
+    parser.add_argument("-chains",type=int, help = "Number of chains run in parallel processes at each context (their TopN hypotheses are merged)", default=1)
+    parser.add_argument("-temperatures",type=float, nargs="+", help = "Likelihood temperature of each chain, for parallel tempering (all 1.0 if not given)", default=None)
+    parser.add_argument("-swap_every",type=int, help = "Number of steps between proposed swaps of states between chains at adjacent temperatures (0 = no swaps)", default=0)
+    parser.add_argument("-inference",type=str, choices=["mcmc", "exact"], help = "Sample hypotheses with MCMC, or compute the exact posterior over all semantically distinct hypotheses up to -depth", default="mcmc")
+    parser.add_argument("-depth",type=int, help = "Maximum depth of the hypotheses enumerated for exact inference", default=5)
+    parser.add_argument("-max_size",type=int, help = "Maximum number of distinct values kept per nonterminal and depth when enumerating hypotheses for exact inference (the most probable are kept)", default=100000)
+    parser.add_argument("-space_cache",type=str, help = "Directory where enumerated hypothesis spaces are cached (for exact inference)", default="./../spaces/")
+    parser.add_argument("-adaptive",action="store_true", help = "Stop sampling at each context once the TopN hypotheses and the best posterior score have not changed for -stable_window steps (instead of always taking -sample_steps)")
+    parser.add_argument("-min_steps",type=int, help = "Minimum number of steps at each context in adaptive mode (-sample_steps / 5 if not given)", default=None)
+    parser.add_argument("-max_steps",type=int, help = "Maximum number of steps at each context in adaptive mode (-sample_steps if not given)", default=None)
+    parser.add_argument("-stable_window",type=int, help = "Number of steps without change in the TopN hypotheses and best score after which adaptive sampling stops (-sample_steps / 5 if not given)", default=None)
+    parser.add_argument("-checkpoint_every",type=int, help = "Checkpoint each model's training every this many contexts, so the run can be resumed (0 = no checkpoints)", default=1)
+    parser.add_argument("-resume",type=str, help = "Resume the experiment with this exp_id from its checkpoints (with the options it was started with), skipping completed models and contexts", default=None)
+    parser.add_argument("-profile",action="store_true", help = "Record time, calls and evaluations per training phase, cache hit rates and peak memory in [exp_id]_profile.json")
+    parser.add_argument("-cprofile",action="store_true", help = "Also write a cProfile dump of training (in this process) to [exp_id].prof")
+    parser.add_argument("-no_plot",action="store_true", help = "Headless mode: do not import the plotting stack or plot results (plot later with report.py)")
+    parser.add_argument("-startup_budget",type=float, help = "Warn if importing the training path and the time from the start of the run until training begins exceed this many seconds (none if not given)", default=None)
+    parser.add_argument("-dataset_cache",type=str, help = "Directory of compiled (binary) datasets, built from the data files on first use and rebuilt when they change (data files are parsed on every run if not given)", default=None)
+    args = parser.parse_args(argv)
+    if args.adaptive:
+        min_steps, max_steps, stable_window = adaptive_steps(args)
+        if min_steps > max_steps:
+            parser.error("-min_steps (" + str(min_steps) + ") must not be more than -max_steps (" + str(max_steps) + ")")
+        if stable_window >= max_steps:
+            parser.error("-stable_window (" + str(stable_window) + ") must be less than -max_steps (" + str(max_steps) + "), or sampling never stops early")
     return args
 
+def adaptive_steps(args):
+    """
+    Step limits of adaptive sampling, with the ones not given derived from sample_steps.
+
+    Parameters:
+        - args (argparse.Namespace): Experiment parameters (see parse_args)
 
-def mcmc(data, out, exp_id, h0, grammar, sample_steps, model_num, fixed_h_space):
+    Returns:
+        - adaptive (tuple): (min_steps, max_steps, stable_window), see mcmc
+    """
+    return (args.min_steps if args.min_steps is not None else args.sample_steps // 5,
+            args.max_steps if args.max_steps is not None else args.sample_steps,
+            args.stable_window if args.stable_window is not None else args.sample_steps // 5)
+
+
+def mcmc(data, out, exp_id, h0, grammar, sample_steps, model_num, fixed_h_space, adaptive=None):
     """
     Using data, grammar, and a starting hypothesis, takes sample_steps number
     of samples over data and stores the best ranking hypotheses in TopN. In other
@@ -71,11 +130,15 @@ def mcmc(data, out, exp_id, h0, grammar, sample_steps, model_num, fixed_h_space)
         - grammar (LOTlib3.Grammar): A PCFG grammar specifying the space of possible hypotheses
         - sample_steps (int): Number of samples to perform in inferencing over the given data
         - model_num (int): What number model we are training (since data may be split per human)
-        - fixed_h_space (list): A set of the TopN hypotheses for each context
+        - fixed_h_space (dict): The TopN hypotheses for each context, keyed by truth-table signature
         - all_contexts (list): All possible contexts model can see
+        - adaptive (tuple): (min_steps, max_steps, stable_window) to stop sampling once the TopN hypotheses
+        and the best posterior score have not changed for stable_window steps (after at least min_steps,
+        at most max_steps), None to take sample_steps steps
 
     Returns:
-        - None
+        - h (LOTlib3.LOTHypothesis): The last state of the chain (to warm start the next context)
+        - steps (int): Number of steps taken
     """
     # Store the top N hypotheses
     TN = TopN(N=25)
@@ -86,52 +149,140 @@ def mcmc(data, out, exp_id, h0, grammar, sample_steps, model_num, fixed_h_space)
     # Record top N concept(s) with top posterior probability over this data/steps
     # Infer with data/labels from all previous contexts (not current), 0th context = inference with no labels seen yet
     i = 1
-    for h in break_ctrlc(MetropolisHastingsSampler(h0, infer_data, steps=sample_steps)):
-        # print("Sample #", i, "--- Hypothesis Length:", h.value.count_nodes(),\
-        #     "Mono:", h.value.degree_monotonicity, "Cons:", h.value.degree_conservativity)
-        TN.add(h)
-        i += 1
+    h = h0
+    steps = sample_steps if adaptive is None else adaptive[1]
+    if adaptive is not None:
+        # The TopN and best score are compared every check_every steps
+        min_steps, max_steps, stable_window = adaptive
+        check_every = max(1, stable_window // 10)
+        last_top, last_best, stable_since = None, None, 0
+    with profiling.phase('mh_sampling'):
+        for h in break_ctrlc(MetropolisHastingsSampler(h0, infer_data, steps=steps)):
+            # print("Sample #", i, "--- Hypothesis Length:", h.value.count_nodes(),\
+            #     "Mono:", h.value.degree_monotonicity, "Cons:", h.value.degree_conservativity)
+            TN.add(h)
+            if adaptive is not None and i % check_every == 0:
+                top = TN.get_all(sorted=True)
+                members = frozenset(str(top_h.value) for top_h in top)
+                best = top[-1].posterior_score if len(top) > 0 else None
+                if members != last_top or best != last_best:
+                    last_top, last_best, stable_since = members, best, i
+                elif i >= min_steps and i - stable_since >= stable_window:
+                    i += 1
+                    break
+            i += 1
+    profiling.count('mh_samples', i - 1)
 
     # Add TopN hypotheses over this data to fixed hypothesis space
-    # Do not add semantically-duplicate ones!
-    for top_n_h in TN.get_all(sorted=True):
-
-        # Always add the first hypothesis to the fixed space
-        if len(fixed_h_space) == 0:
-            fixed_h_space.append(top_n_h)
-            continue
-
-        # to_remove = []
-        # add = True
-        # for fixed_h in fixed_h_space:
-        #     if top_n_h.semantic_equiv(fixed_h) and top_n_h.prior > fixed_h.prior:
-        #         to_remove.append(fixed_h)
-        #     elif top_n_h.semantic_equiv(fixed_h) and top_n_h.prior <= fixed_h.prior:
-        #         add = False
-        
-        # for h in to_remove:
-        #     fixed_h_space.remove(h)
-        # if add:
-        #     fixed_h_space.append(top_n_h)
-
-        # The current top_n_h and its semantic equivalents in fixed space
-        semantic_equiv = [(top_n_h, top_n_h.prior)]
-        
-        # Find all semantically equivalent hypotheses fixed space
-        for fixed_h in fixed_h_space:
-            if top_n_h.semantic_equiv(fixed_h):
-                semantic_equiv.append((fixed_h, fixed_h.prior))
-        
-        # Remove all from the space (top_n_h and all equivalent)
-        for tup in semantic_equiv:
-            if tup[0] in fixed_h_space:
-                fixed_h_space.remove(tup[0])
-        
-        # Add back only the one with the best prior (if non equivalent, just adds top_n_h)
-        fixed_h_space.append(sorted(semantic_equiv, key = lambda x: x[1])[-1][0])        
-
-        
-def train(data, h0, n_contexts, out, exp_id, sample_steps):
+    # Do not add semantically-duplicate ones! Hypotheses are indexed by their truth-table
+    # signature, so among semantic equivalents only the one with the best prior is kept
+    with profiling.phase('fixed_space_dedup'):
+        for top_n_h in TN.get_all(sorted=True):
+            sig = top_n_h.signature()
+            if sig not in fixed_h_space or top_n_h.prior > fixed_h_space[sig].prior:
+                fixed_h_space[sig] = top_n_h
+
+    return h, i - 1
+
+def run_chain(data, h0, steps, temperature, seed):
+    """
+    Run one chain (or segment of a chain) of the sampler, in a worker process.
+
+    Parameters:
+        - data (list): The FunctionData objects to infer with
+        - h0 (LOTlib3.LOTHypothesis): The chain's starting state
+        - steps (int): Number of samples to take
+        - temperature (float): Likelihood temperature of the chain
+        - seed (int): Random seed of this chain segment
+
+    Returns:
+        - h (LOTlib3.LOTHypothesis): The last state of the chain
+        - top (list): The TopN hypotheses of the chain
+        - trace (list (float)): The (untempered) posterior score at every step
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    TN = TopN(N=25)
+    trace = []
+    h = h0
+    for h in MetropolisHastingsSampler(h0, data, steps=steps, likelihood_temperature=temperature):
+        TN.add(h)
+        trace.append(h.prior + h.likelihood)
+    return h, TN.get_all(sorted=True), trace
+
+def mcmc_chains(data, h_starts, sample_steps, temperatures, swap_every, fixed_h_space, pool, seed):
+    """
+    Version of mcmc with several chains run in parallel (one per temperature), with replica
+    exchange: every swap_every steps, the states of chains at adjacent temperatures are swapped
+    with the Metropolis probability of the swap. The TopN hypotheses of every chain are added
+    to fixed_h_space.
+
+    Parameters:
+        - data (list): A list of FunctionData objects (inference is done on all but the last, as in mcmc)
+        - h_starts (list): Starting state of each chain
+        - sample_steps (int): Number of samples each chain takes
+        - temperatures (list (float)): Likelihood temperature of each chain
+        - swap_every (int): Steps between swaps (0 = no swaps)
+        - fixed_h_space (dict): The TopN hypotheses for each context, keyed by truth-table signature
+        - pool (concurrent.futures.Executor): Worker processes to run the chains in
+        - seed (int): Random seed for this context, chains and swaps are seeded from it
+
+    Returns:
+        - h_lasts (list): The last state of the chain at each temperature
+        - traces (numpy array (float)): K x sample_steps matrix, posterior score at each step of the chain at each temperature
+    """
+    infer_data = data[0:-1]
+    rng = np.random.RandomState(seed)
+    seeds = np.random.SeedSequence(seed)
+    segment = swap_every if swap_every > 0 else sample_steps
+
+    hs = list(h_starts)
+    traces = [[] for _ in temperatures]
+    done = 0
+    while done < sample_steps:
+        steps = min(segment, sample_steps - done)
+        chain_seeds = seeds.spawn(len(temperatures))
+        futures = [pool.submit(run_chain, infer_data, hs[k], steps, temperatures[k], int(chain_seeds[k].generate_state(1)[0]))
+                   for k in range(len(temperatures))]
+        for k, future in enumerate(futures):
+            hs[k], top, trace = future.result()
+            traces[k].extend(trace)
+            for top_n_h in top:
+                sig = top_n_h.signature()
+                if sig not in fixed_h_space or top_n_h.prior > fixed_h_space[sig].prior:
+                    fixed_h_space[sig] = top_n_h
+        done += steps
+
+        if swap_every > 0 and done < sample_steps:
+            swap_states(hs, temperatures, rng)
+
+    return hs, np.array(traces)
+
+def swap_states(hs, temperatures, rng):
+    """
+    Propose a swap of the states of every pair of chains at adjacent temperatures (in place),
+    each accepted with the Metropolis probability of the swap.
+
+    Parameters:
+        - hs (list): The state of the chain at each temperature
+        - temperatures (list (float)): Likelihood temperature of each chain
+        - rng (numpy.random.RandomState): Random state deciding the swaps
+
+    Returns:
+        - swapped (list (bool)): Whether the states of chains k and k + 1 were swapped, for each k
+    """
+    swapped = []
+    for k in range(len(temperatures) - 1):
+        # Likelihoods of sampled hypotheses are untempered (the sampler applies the temperature)
+        log_accept = (1.0 / temperatures[k] - 1.0 / temperatures[k + 1]) * (hs[k + 1].likelihood - hs[k].likelihood)
+        swapped.append(bool(log_accept >= 0 or rng.random_sample() < np.exp(log_accept)))
+        if swapped[-1]:
+            hs[k], hs[k + 1] = hs[k + 1], hs[k]
+    return swapped
+
+def train(data, h0, n_contexts, out, exp_id, sample_steps, chain="restart", workers=1, seed=0, lru_size=10000, temperatures=None, swap_every=0,
+          profile=False, checkpoint_every=0, adaptive=None, resume=False, options=None):
     """
     Train as many models as there are humans, each with n contexts (training data points). 
     Each model is trained on same data as the corresponding human sees 
@@ -145,10 +296,27 @@ def train(data, h0, n_contexts, out, exp_id, sample_steps):
         - out (str): A path to where output files will be stored (model accuracy, probabilities, etc.)
         - exp_id (str): Identifier for this experiment run
         - sample_steps (int): Number of samples to perform in inferencing over the given data
-        - all_contexts (list): All possible contexts model can see
+        - chain (str): "restart" to start the sampler from h0 at every context, "warm" to continue from
+        the chain's state at the previous context (only the new datum's likelihood is then computed for it)
+        - workers (int): Number of processes to train models in parallel (models are independent)
+        - seed (int): Random seed, each model's random state is derived from this and the model's number
+        - lru_size (int): Number of expressions kept in the in-process caches of priors, likelihoods and subtree values
+        - temperatures (list (float)): Likelihood temperature of each chain if several chains are run in
+        parallel at each context (one chain in this process if None)
+        - swap_every (int): Steps between swaps of states between chains at adjacent temperatures (0 = no swaps)
+        - profile (bool): Profile the training phases of every model (see profile_training)
+        - checkpoint_every (int): Checkpoint each model every this many contexts (0 = never)
+        - adaptive (tuple): (min_steps, max_steps, stable_window) to stop sampling at each context once it
+        has converged (see mcmc), None to always take sample_steps steps
+        - resume (bool): Continue models from their checkpoints and skip completed models (checkpoints are
+        only read when resuming)
+        - options (dict): Options of the run (see checkpoint.run_options), saved in every checkpoint. A model
+        is only resumed from a checkpoint written with the same options
     
     Returns:
-        - None
+        - caches (dict): Hits, misses and hit rate of each cache over all models
+        - profile (dict): Profile of training summed over all models (see profiling.summary), None if not profiled
+        - model_results (list (dict)): Results of each model in order (see results.model_result)
     """
 
     # Split data per n amount of contexts per human
@@ -158,67 +326,430 @@ def train(data, h0, n_contexts, out, exp_id, sample_steps):
         data_split.append(data[i:i+n_contexts])    
 
     # Inference over data seen so far by given model (mimicking humans seeing contexts in succession)
-    for i in range(0, len(data_split)):
-        fixed_h_space = []
-        model_i_data = data_split[i]
-        print("Training Model:", i + 1, "of", len(data_split))
-
-        # First pass over this model's data, get TopN hypotheses at each context, create fixed hypothesis space
-        for j in range(len(model_i_data)):
-            data_chunk = model_i_data[0:j+1]
-            print("Model " + str(i + 1) + ", Context #:", j + 1, ", Inferring with Contexts #:", 0, "to", j)
-            mcmc(data_chunk, args.out, exp_id, h0, grammar, sample_steps, i+1, fixed_h_space)
-        
-        # Make second pass over this model's data, compute posterior probs and posterior predictive probs for hypotheses in fixed space
-        with open(out + exp_id + "/" + exp_id + "_" + str(i+1) +  ".csv", 'a', encoding='utf-8') as f:
-            f.write("post_pred\n")
-            # Go over all number of contexts
-            for j in range(len(model_i_data)):
-                s = 0.0
-                data_chunk = model_i_data[0:j+1]
-                curr_context = data_chunk[-1]
-                infer_contexts = data_chunk[0:-1]
-                posterior_scores = np.array([h.compute_posterior(infer_contexts) for h in fixed_h_space])
-                posterior_probs = softmax(posterior_scores)
-                # Create posterior predictive probability for this amount of data
-                for k, h in enumerate(fixed_h_space):  
-                    if j % 30 == 0:       
-                        print(h, posterior_probs[k])
-                    s += exp(h.compute_single_likelihood(curr_context)) * posterior_probs[k]
-                print("Model " + str(i + 1) + ", Context #:", j + 1, ", Posterior Predictive:", str(s))
-                f.write(str(s) + "\n")
-                if j == len(model_i_data) - 1:
-                    print(sorted([(h, posterior_probs[k]) for k, h in enumerate(fixed_h_space)], key=lambda tup: tup[1]))
-            f.close()
+    model_stats = []
+    model_profiles = []
+    model_results = [None] * len(data_split)
+    if temperatures is not None:
+        # Models are trained one after another, each running its chains in the pool
+        with ProcessPoolExecutor(max_workers=len(temperatures)) as pool:
+            for i in range(0, len(data_split)):
+                print("Training Model:", i + 1, "of", len(data_split))
+                i, stats, model_profile, model_results[i] = train_model(i, data_split[i], h0, out, exp_id, sample_steps, chain, seed, lru_size,
+                                                                        temperatures=temperatures, swap_every=swap_every, pool=pool,
+                                                                        profile=profile, checkpoint_every=checkpoint_every, adaptive=adaptive,
+                                                                        resume=resume, options=options)
+                model_stats.append(stats)
+                model_profiles.append(model_profile)
+    elif workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(train_model, i, data_split[i], copy(h0), out, exp_id, sample_steps, chain, seed, lru_size, False,
+                                   profile=profile, checkpoint_every=checkpoint_every, adaptive=adaptive, resume=resume, options=options)
+                       for i in range(0, len(data_split))]
+            for n_done, future in enumerate(as_completed(futures)):
+                i, stats, model_profile, model_results[i] = future.result()
+                model_stats.append(stats)
+                model_profiles.append(model_profile)
+                print("Finished Model:", i + 1, "(" + str(n_done + 1), "of", len(data_split), "done)")
+    else:
+        for i in range(0, len(data_split)):
+            print("Training Model:", i + 1, "of", len(data_split))
+            i, stats, model_profile, model_results[i] = train_model(i, data_split[i], h0, out, exp_id, sample_steps, chain, seed, lru_size,
+                                                                    profile=profile, checkpoint_every=checkpoint_every, adaptive=adaptive,
+                                                                    resume=resume, options=options)
+            model_stats.append(stats)
+            model_profiles.append(model_profile)
 
-if __name__ == "__main__":
+    # Cache hit rates over all models
+    caches = {}
+    for name in sorted(model_stats[0].keys() if len(model_stats) > 0 else []):
+        hits = sum(stats[name]['hits'] for stats in model_stats)
+        misses = sum(stats[name]['misses'] for stats in model_stats)
+        caches[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / max(hits + misses, 1)}
+        print("Cache", name + ": hits", hits, ", misses", misses, ", hit rate", caches[name]['hit_rate'])
+
+    return caches, (profiling.merge(model_profiles) if profile else None), model_results
+
+def profile_training():
+    """
+    Turn on profiling in this process: the training phases (sampling, priors, degrees, likelihoods,
+    compilation, signatures and the posterior predictive pass) are timed from now on.
+    """
+    profiling.enabled = True
+    for attr in ('compute_prior', 'compute_degree_probs', 'compiled', 'signature', 'semantic_equiv'):
+        profiling.instrument(hypotheses.HypothesisA, attr)
+    # Data points scored: interned data is scored in compute_likelihood itself, other data through likelihood_vector
+    profiling.instrument(hypotheses.HypothesisA, 'compute_likelihood', evaluations=lambda h, data, *args, **kwargs: len(data) if h.interned(data) else 0)
+    profiling.instrument(hypotheses.HypothesisA, 'likelihood_vector', evaluations=lambda h, data: len(data))
+    module = sys.modules[__name__]
+    for attr in ('mcmc', 'mcmc_chains', 'train_exact', 'posterior_predictive'):
+        profiling.instrument(module, attr)
+
+def cache_stats(h0):
+    """
+    Hit/miss counts of the caches used by hypotheses (in this process) since they were created.
+
+    Parameters:
+        - h0 (LOTlib3.LOTHypothesis): The starting hypothesis (holds the persistent prior cache, if any)
+
+    Returns:
+        - stats (dict): Hits and misses per cache
+    """
+    stats = hypotheses.cache_stats()
+    if h0.prior_cache is not None:
+        stats['prior_cache'] = h0.prior_cache.stats()
+    return stats
+
+def train_model(i, model_i_data, h0, out, exp_id, sample_steps, chain="restart", seed=0, lru_size=10000, verbose=True,
+                temperatures=None, swap_every=0, pool=None, profile=False, checkpoint_every=0, adaptive=None, resume=False, options=None):
+    """
+    Train the model for one human on the contexts that human saw, and compute its
+    posterior predictive probability for each context.
+
+    Parameters:
+        - i (int): Index of the model (human) being trained
+        - model_i_data (list): The FunctionData objects seen by this human, in order
+        - h0, out, exp_id, sample_steps, chain, seed, lru_size, temperatures, swap_every, checkpoint_every, adaptive, resume, options: See train
+        - verbose (bool): Print progress per context (turned off when models are trained in parallel)
+        - pool (concurrent.futures.Executor): Worker processes to run chains in (if temperatures is given)
+        - profile (bool): Profile the training phases of this model
+
+    Returns:
+        - i (int): Index of the model trained
+        - stats (dict): Hits and misses of each cache while training this model
+        - profile (dict): Profile of training this model (see profiling.summary), None if not profiled
+        - result (dict): The model's results (see results.model_result)
+    """
+    log = print if verbose else (lambda *args: None)
+    hypotheses.resize_caches(lru_size)
+    stats_before = cache_stats(h0)
+    if profile:
+        profile_training()
+        profile_before = profiling.summary()
+
+    # Random state depends only on the seed and model number (not on which process trains the model or when)
+    model_seed = int(np.random.SeedSequence([seed, i]).generate_state(1)[0])
+    random.seed(model_seed)
+    np.random.seed(model_seed)
+
+    fixed_h_space = {}
+    h_start = h0
+    h_starts = [h0] * len(temperatures) if temperatures is not None else None
+    convergence = []
+    steps_used = []
+    start = 0
+
+    # Continue from this model's checkpoint when resuming, if it has one
+    checkpoint_path = checkpoint.path(out, exp_id, i)
+    state = checkpoint.load(checkpoint_path) if resume else None
+    if state is not None and state.get('options') != options:
+        raise Exception("Cannot resume model " + str(i + 1) + " of " + exp_id + ": its checkpoint was written with other options.")
+    if state is not None and state['done']:
+        log("Model " + str(i + 1) + " already completed (checkpoint)")
+        return i, {name: {'hits': 0, 'misses': 0} for name in stats_before}, (profiling.summary() if profile else None), \
+            {key: (np.array(value, dtype=float) if key != 'expressions' else value) for key, value in state['result'].items()}
+    if state is not None:
+        log("Model " + str(i + 1) + " resuming from context", state['contexts'] + 1)
+        start = state['contexts']
+        fixed_h_space = checkpoint.decode_space(state['fixed_h_space'])
+        convergence = [tuple(c) for c in state['convergence']]
+        steps_used = state.get('steps', [])
+        checkpoint.restore_rng(state['rng'])
+        if state['chain_state'] is not None:
+            values = checkpoint.decode_object(state['chain_state'])
+            if temperatures is not None:
+                h_starts = [h0.__copy__(value=v) for v in values]
+            else:
+                h_start = h0.__copy__(value=values[0])
+
+    def save_checkpoint(contexts, done, result=None):
+        chain_state = None
+        if chain == "warm" and not done:
+            chain_state = checkpoint.encode_object([copy(h.value) for h in (h_starts if temperatures is not None else [h_start])])
+        checkpoint.save(checkpoint_path, {'options': options, 'contexts': contexts, 'done': done, 'fixed_h_space': checkpoint.encode_space(fixed_h_space),
+                                          'convergence': convergence, 'steps': steps_used, 'rng': checkpoint.encode_rng(), 'chain_state': chain_state,
+                                          'result': None if result is None else {key: (value.tolist() if key != 'expressions' else value)
+                                                                                 for key, value in result.items()}})
+
+    # First pass over this model's data, get TopN hypotheses at each context, create fixed hypothesis space
+    for j in range(start, len(model_i_data)):
+        data_chunk = model_i_data[0:j+1]
+        log("Model " + str(i + 1) + ", Context #:", j + 1, ", Inferring with Contexts #:", 0, "to", j)
+        if temperatures is not None:
+            h_lasts, traces = mcmc_chains(data_chunk, h_starts, sample_steps, temperatures, swap_every, fixed_h_space, pool,
+                                          int(np.random.SeedSequence([seed, i, j]).generate_state(1)[0]))
+            # Diagnostics of the posterior score over the chains at temperature 1 (the others sample a different distribution)
+            cold = traces[np.isclose(temperatures, 1.0)]
+            convergence.append((diagnostics.rhat(cold) if len(cold) > 1 else float('nan'), diagnostics.ess(cold) if len(cold) > 0 else float('nan')))
+            log("Model " + str(i + 1) + ", Context #:", j + 1, ", R-hat:", convergence[-1][0], ", ESS:", convergence[-1][1])
+            if chain == "warm":
+                h_starts = h_lasts
+            steps_used.append(sample_steps)
+        else:
+            h_last, steps = mcmc(data_chunk, out, exp_id, h_start, h0.grammar, sample_steps, i+1, fixed_h_space, adaptive)
+            if adaptive is not None:
+                log("Model " + str(i + 1) + ", Context #:", j + 1, ", Steps:", steps)
+            steps_used.append(steps)
+            if chain == "warm":
+                h_start = h_last
+        if checkpoint_every > 0 and ((j + 1) % checkpoint_every == 0 or j + 1 == len(model_i_data)):
+            save_checkpoint(j + 1, False)
     
-    args = parse_args()
+    # Make second pass over this model's data, compute posterior probs and posterior predictive probs for hypotheses in fixed space
+    h_space = list(fixed_h_space.values())
+    priors = np.array([h.compute_prior() for h in h_space])
+    likelihoods = np.array([h.likelihood_vector(model_i_data) for h in h_space])
+    post_preds, posterior_probs = posterior_predictive(priors, likelihoods)
+
+    for j in range(len(model_i_data)):
+        if j % 30 == 0:
+            for k, h in enumerate(h_space):
+                log(h, posterior_probs[k, j])
+        log("Model " + str(i + 1) + ", Context #:", j + 1, ", Posterior Predictive:", str(post_preds[j]))
+    log(sorted([(h, posterior_probs[k, -1]) for k, h in enumerate(h_space)], key=lambda tup: tup[1]))
+
+    degree_mono, degree_cons = hypotheses.space_degrees(h_space, h0.all_contexts)
+    result = results.model_result(post_preds, posterior_probs, [h.value for h in h_space], priors, degree_mono, degree_cons,
+                                  convergence if temperatures is not None else None, steps_used)
+    if checkpoint_every > 0:
+        save_checkpoint(len(model_i_data), True, result)
+
+    stats = cache_stats(h0)
+    for name in stats:
+        stats[name] = {'hits': stats[name]['hits'] - stats_before[name]['hits'],
+                       'misses': stats[name]['misses'] - stats_before[name]['misses']}
+    if h0.prior_cache is not None and not verbose:
+        h0.prior_cache.close()
+    return i, stats, (profiling.difference(profiling.summary(), profile_before) if profile else None), result
+
+def train_exact(data, space, all_contexts, priors, n_contexts, out, exp_id):
+    """
+    Exact version of train: the posterior of each model is computed over the whole enumerated
+    hypothesis space, so there is no sampling (and no fixed space built from samples).
+
+    Parameters:
+        - data (list): A list of FunctionData objects
+        - space (enumeration.EnumeratedSpace): The semantically distinct hypotheses
+        - all_contexts (data_handling.ContextSpace): All possible contexts (the space's truth tables are over these)
+        - priors (numpy array (float)): Log prior of each hypothesis in the space
+        - n_contexts, out, exp_id: See train
+
+    Returns:
+        - model_results (list (dict)): Results of each model (see results.model_result), with the
+        results.EXACT_TOP most probable hypotheses (at any context) of each model
+    """
+
+    model_results = []
+    for i, start in enumerate(range(0, len(data), n_contexts)):
+        print("Training Model:", i + 1, "of", -(-len(data) // n_contexts))
+
+        # Truth value of every hypothesis on this model's data, and the likelihoods (see HypothesisA.compute_single_likelihood),
+        # one model at a time since a matrix over all models' data is too large for big spaces
+        model_data = data[start:start+n_contexts]
+        truth = space.truth_on(model_data, all_contexts)
+        labels = np.array([d.output for d in model_data], dtype=bool)
+        alphas = np.array([d.alpha for d in model_data])
+        likelihoods = np.log(alphas * (truth == labels) + (1.0 - alphas) / 2.0)
+        post_preds, posterior_probs = posterior_predictive(priors, likelihoods)
+
+        top = np.argsort(-posterior_probs[:, -1])[:10]
+        print([(space.expressions[k], posterior_probs[k, -1]) for k in top])
+
+        keep = np.sort(np.argsort(-np.max(posterior_probs, axis=1))[:results.EXACT_TOP])
+        model_results.append(results.model_result(post_preds, posterior_probs[keep], [space.expressions[k] for k in keep], priors[keep],
+                                                  space.degree_monotonicity[keep], space.degree_conservativity[keep]))
+    return model_results
+
+def posterior_predictive(priors, likelihoods):
+    """
+    Compute the posterior over a fixed hypothesis space and the posterior predictive probability
+    of the label of each context, given all contexts before it. With H hypotheses and n contexts:
+        - posterior score before context j = prior + sum of log likelihoods of contexts 0 to j-1 (a cumulative sum)
+        - posterior probabilities = softmax of the posterior scores over hypotheses
+        - posterior predictive of context j = sum over hypotheses of p(label_j | h) * p(h | contexts 0 to j-1)
+
+    Parameters:
+        - priors (numpy array (float)): Length H vector of hypothesis log priors
+        - likelihoods (numpy array (float)): H x n matrix, log likelihood of each context under each hypothesis
+
+    Returns:
+        - post_preds (numpy array (float)): Length n vector, posterior predictive probability of each context's label
+        - posterior_probs (numpy array (float)): H x n matrix, posterior probability of each hypothesis before seeing each context
+    """
+    seen = np.zeros_like(likelihoods)
+    seen[:, 1:] = np.cumsum(likelihoods[:, :-1], axis=1)
+    scores = priors[:, np.newaxis] + seen
+    posterior_probs = np.exp(scores - np.max(scores, axis=0))
+    posterior_probs /= np.sum(posterior_probs, axis=0)
+    post_preds = np.einsum('hj,hj->j', np.exp(likelihoods), posterior_probs)
+    return post_preds, posterior_probs
+
+def resume_args(args):
+    """
+    Arguments to resume an experiment with: the ones it was started with (from its run.json), except
+    for options that do not change its results (e.g. the number of workers or profiling).
+
+    Parameters:
+        - args (argparse.Namespace): The arguments passed in (args.resume is the exp_id to resume)
+
+    Returns:
+        - args (argparse.Namespace): The arguments of the resumed experiment
+    """
+    run_path = args.out + args.resume + "/run.json"
+    if not os.path.exists(run_path):
+        raise Exception("Cannot resume " + args.resume + ": " + run_path + " does not exist.")
+    with open(run_path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    resumed = argparse.Namespace(**vars(args))
+    for name, value in saved.items():
+        if name in vars(args) and name not in RESUME_OVERRIDES:
+            setattr(resumed, name, value)
+    resumed.seed = saved['seed']
+    return resumed
+
+def run(args, exp_id=None, all_contexts=None, loaded=None):
+    """
+    Run one experiment: load data, train a model per human and plot the results.
+
+    Parameters:
+        - args (argparse.Namespace): Experiment parameters (see parse_args)
+        - exp_id (str): Identifier for this experiment run (by default from the time, exp_type and lambdas, or args.resume)
+        - all_contexts (data_handling.ContextSpace): All possible contexts, generated if not given
+        - loaded (tuple): (data, n_contexts) as returned by data_handling.load, loaded if not given
+
+    Returns:
+        - exp_id (str): Identifier for this experiment run
+    """
+
+    # Startup of this run (results folder, data and context space) is timed from here
+    global START
+    START = time.perf_counter()
     
+    # Continue an interrupted experiment (models continue from their checkpoints)
+    if args.resume is not None:
+        args = resume_args(args)
+        exp_id = args.resume
+        print("Resuming", exp_id)
+
     # Make results folder
     lam_1 = args.lam_1
     lam_2 = args.lam_2
     if not os.path.exists(args.out): 
         os.makedirs(args.out)
     data_path = args.data_dir + "/" + args.exp_type + "/"
-    exp_id = TIME + "_" + args.exp_type + "_" + str(lam_1) + "_" + str(lam_2)
-    os.mkdir(args.out + exp_id + "/")
+    if exp_id is None:
+        exp_id = TIME + "_" + args.exp_type + "_" + str(lam_1) + "_" + str(lam_2)
+    if args.resume is not None:
+        os.makedirs(args.out + exp_id + "/", exist_ok=True)
+    else:
+        # A new experiment never writes into the results folder of another
+        os.makedirs(args.out + exp_id + "/")
 
     # Load all possible contexts (for degrees of univ.)
     # Better than doing in hypothesis class since this only needs calculation once
-    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 8)
+    if all_contexts is None:
+        all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 8)
 
     # Load data, create grammar
-    data, n_contexts = data_handling.load(data_path, args.alpha)
+    if loaded is None:
+        if args.dataset_cache is not None:
+            loaded = dataset_cache.load(data_path, args.alpha, args.dataset_cache)
+        else:
+            loaded = data_handling.load(data_path, args.alpha)
+    data, n_contexts = loaded
+
+    # Intern the data in all_contexts, so likelihoods are computed once per distinct context and label
+    data = data_handling.intern(data, all_contexts)
+    if isinstance(data, data_handling.InternedData):
+        print("Interned", len(data), "data points (" + str(len(np.unique(data.index))), "distinct contexts)")
+    else:
+        print("WARNING: Some contexts in the data are not possible contexts, likelihoods are computed per data point")
     grammar = grammars.create_grammar(args.g_type)
     sample_steps = args.sample_steps
 
     # # For bug testing purposes
     # test_hypothesis = hypotheses.create_hypothesis(args.h_type, grammars.create_grammar("error_testing"), lam_1, lam_2, all_contexts)
 
+    # Record how this experiment was run (report.py plots results from it)
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    with open(args.out + exp_id + "/run.json", 'w', encoding='utf-8') as f:
+        json.dump(dict(vars(args), exp_id=exp_id, seed=seed), f)
+
+    startup = time.perf_counter() - START
+    print("Startup:", round(startup, 3), "s (imports:", round(IMPORT_SECONDS, 3), "s)")
+    if args.startup_budget is not None and IMPORT_SECONDS + startup > args.startup_budget:
+        print("WARNING: Startup with imports took", round(IMPORT_SECONDS + startup, 3), "s, over the budget of", args.startup_budget, "s")
+
     # Select a starting hypothesis and train
-    h0 = hypotheses.create_hypothesis(args.h_type, grammar, lam_1, lam_2, all_contexts)
-    train(data, h0, n_contexts, args.out, exp_id, sample_steps)
+    print("Seed:", seed)
+    random.seed(seed)
+    prior_cache = None
+    if args.prior_cache is not None:
+        prior_cache = cache.PriorCache(args.prior_cache, grammar, all_contexts, args.prior_cache_size)
+    if args.profile:
+        profile_training()
+        profile_before = profiling.summary()
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    train_start = time.perf_counter()
+    caches, profile = {}, None
+
+    if args.inference == "exact":
+        # Hypotheses over the sampled hypotheses' node limit have a prior of -Infinity, so are not enumerated
+        max_nodes = hypotheses.create_hypothesis(args.h_type, grammar, lam_1, lam_2, all_contexts).maxnodes
+        space = enumeration.load_or_enumerate(grammar, all_contexts, args.depth, args.max_size, max_nodes, cache_dir=args.space_cache)
+        print("Enumerated", len(space), "semantically distinct hypotheses")
+        if space.truncated:
+            print("WARNING: The enumerated space was truncated to -max_size", args.max_size, "values per nonterminal and depth, it may be missing hypotheses")
+        model_results = train_exact(data, space, all_contexts, space.priors(lam_1, lam_2), n_contexts, args.out, exp_id)
+        if args.profile:
+            profile = profiling.difference(profiling.summary(), profile_before)
+    else:
+        h0 = hypotheses.create_hypothesis(args.h_type, grammar, lam_1, lam_2, all_contexts, prior_cache)
+        temperatures = None
+        if args.chains > 1 or args.temperatures is not None:
+            temperatures = args.temperatures if args.temperatures is not None else [1.0] * args.chains
+            if args.temperatures is not None and args.chains > 1 and len(temperatures) != args.chains:
+                raise Exception("Give one temperature per chain (" + str(args.chains) + " chains, " + str(len(temperatures)) + " temperatures).")
+            if args.workers > 1:
+                raise Exception("Run either several chains (-chains) or several models (-workers) in parallel, not both.")
+            if args.adaptive:
+                raise Exception("Adaptive sampling (-adaptive) stops a single chain, it cannot be used with -chains or -temperatures.")
+        adaptive = None
+        if args.adaptive:
+            adaptive = adaptive_steps(args)
+        caches, profile, model_results = train(data, h0, n_contexts, args.out, exp_id, sample_steps, args.chain, args.workers, seed,
+                                               args.lru_size, temperatures, args.swap_every, args.profile, args.checkpoint_every, adaptive,
+                                               args.resume is not None, checkpoint.run_options(args, seed, RESUME_OVERRIDES))
+    if prior_cache is not None:
+        prior_cache.close()
 
-    # Plot outputs
-    visualize.plt_hm_acc(data_path, args.out, exp_id, args.exp_type)
\ No newline at end of file
+    # Write the results of all models
+    results.save(results.path(args.out, exp_id), model_results, dict(vars(args), exp_id=exp_id, seed=seed, caches=caches))
+
+    # Write the profile of training
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.out + exp_id + "/" + exp_id + ".prof")
+    if args.profile:
+        profile['import_seconds'] = IMPORT_SECONDS
+        profile['startup_seconds'] = startup
+        profile['train_seconds'] = time.perf_counter() - train_start
+        profile['caches'] = caches
+        profile['peak_memory_mb'] = max(profile['peak_memory_mb'] or 0.0, profiling.peak_memory_mb() or 0.0)
+        with open(args.out + exp_id + "/" + exp_id + "_profile.json", 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+        for name, p in sorted(profile['phases'].items(), key=lambda item: -item[1]['own_seconds']):
+            print("Profile", name + ":", p['calls'], "calls,", round(p['seconds'], 3), "s total,", round(p['own_seconds'], 3), "s own")
+
+    # Plot outputs (the plotting stack is only imported here)
+    if not args.no_plot:
+        import visualize
+        visualize.plt_hm_acc(data_path, args.out, exp_id, args.exp_type, args.dataset_cache)
+
+    return exp_id
+
+if __name__ == "__main__":
+    
+    args = parse_args()
+    run(args)
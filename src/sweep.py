@@ -0,0 +1,212 @@
+# -----------------------------------------------------------
+# Run experiments over grids of lambda/alpha values and experiment types.
+# The context space and loaded data are computed once and shared by all
+# runs (and prior components through one persistent cache), and completed
+# runs are recorded in a manifest so reruns skip them.
+# -----------------------------------------------------------
+
+# Python Imports
+import os
+import argparse
+import hashlib
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Personal Code
+import checkpoint
+import data_handling
+import dataset_cache
+import run_experiment
+
+MANIFEST = "sweep_manifest.jsonl"
+PRIOR_CACHE = "prior_cache.sqlite"
+
+# Options of a run that only say where its caches are, left out of its identifier (with the ones that can
+# change when a run is resumed) since they do not change its results
+CACHE_OPTIONS = ('prior_cache', 'prior_cache_size', 'lru_size', 'dataset_cache', 'space_cache')
+
+# Shared by all runs in a worker process (set by init_worker)
+shared = {}
+
+def parse_args(argv=None):
+    """
+    Parse all command line arguments
+
+    Parameters:
+        - argv (list (str)): Arguments to parse (the command line if None)
+
+    Returns:
+        - args (argparse.Namespace): The list of arguments passed in
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-exp_type", type=str, nargs="+", help="Experiment types (folder names of data for quantifiers of choice)", required=True)
+    parser.add_argument("-lam_1", type=float, nargs="+", help="Values of weight to give to degree of monotonicity [0,1]", default=[0.0])
+    parser.add_argument("-lam_2", type=float, nargs="+", help="Values of weight to give to degree of conservativity [0,1]", default=[0.0])
+    parser.add_argument("-alpha", type=float, nargs="+", help="Values of assumed noisiness of data (min = 1.0)", default=[0.99])
+    parser.add_argument("-data_dir",type=str, help = "Path to main data directory (not specific quantifier)", default ="./../sample_data/")
+    parser.add_argument("-out",type=str, help = "Path to store outputs (and the sweep manifest)", default ="./../results/")
+    parser.add_argument("-g_type",type=str, help = "What type of grammar to use, defined in grammars.py {quant,...}. Define your own in grammars.py", default ="quant")
+    parser.add_argument("-h_type",type=str, help = "What type of hypothesis to use, defined in hypotheses.py {A,B,...}. Define your own in hypotheses.py", default ="A")
+    parser.add_argument("-sample_steps",type=int, help = "How many steps to run the sampler", default=500)
+    parser.add_argument("-chain",type=str, choices=["restart", "warm"], help = "Restart the sampler from h0 at every context, or continue the chain from the previous context (warm start)", default="restart")
+    parser.add_argument("-seed",type=int, help = "Random seed for every run (random if not given)", default=None)
+    parser.add_argument("-workers",type=int, help = "Number of runs (configurations) to run in parallel", default=1)
+    parser.add_argument("-no_plot",action="store_true", help = "Do not plot the results of each run (plot later with report.py)")
+    parser.add_argument("-dataset_cache",type=str, help = "Directory of compiled (binary) datasets, opened memory-mapped by every worker (data files are parsed once and sent to workers if not given)", default=None)
+    parser.add_argument("-prior_cache",type=str, help = "Path to the persistent cache (SQLite database) of hypothesis priors and degrees shared by every run (out/" + PRIOR_CACHE + " if not given)", default=None)
+    args = parser.parse_args(argv)
+    return args
+
+def run_arguments(args, config):
+    """
+    Arguments of run_experiment.py for one configuration of the sweep.
+
+    Parameters:
+        - args (argparse.Namespace): Sweep arguments (see parse_args)
+        - config (dict): exp_type, lam_1, lam_2 and alpha of the run
+
+    Returns:
+        - run_args (argparse.Namespace): The run's arguments (see run_experiment.parse_args)
+    """
+    # Options of run_experiment.py that the sweep does not set keep their defaults
+    run_args = run_experiment.parse_args([])
+    for name, value in vars(args).items():
+        setattr(run_args, name, value)
+    run_args.exp_type = config['exp_type']
+    run_args.lam_1 = config['lam_1']
+    run_args.lam_2 = config['lam_2']
+    run_args.alpha = config['alpha']
+    run_args.workers = 1
+
+    # Every run (in every worker) reads and writes the same persistent prior cache
+    run_args.prior_cache = args.prior_cache if args.prior_cache is not None else args.out + PRIOR_CACHE
+    return run_args
+
+def config_id(run_args):
+    """
+    Identifier (and results folder name) of a run: its exp_type, lambdas and alpha, and a hash of all of
+    its options, so it is the same on every rerun and differs if any option that changes results differs.
+
+    Parameters:
+        - run_args (argparse.Namespace): The run's arguments (see run_arguments)
+
+    Returns:
+        - (str): The run's identifier
+    """
+    options = checkpoint.run_options(run_args, run_args.seed, run_experiment.RESUME_OVERRIDES + CACHE_OPTIONS)
+    key = hashlib.sha1(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    return "_".join([run_args.exp_type, str(run_args.lam_1), str(run_args.lam_2), str(run_args.alpha), key])
+
+def read_manifest(out):
+    """
+    Read the records of completed runs from the sweep manifest.
+
+    Parameters:
+        - out (str): Path where outputs (and the manifest) are stored
+
+    Returns:
+        - done (dict): Records of completed runs keyed by exp_id
+    """
+    done = {}
+    path = out + MANIFEST
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            record = json.loads(line)
+            if record['status'] == "done":
+                done[record['exp_id']] = record
+    return done
+
+def init_worker(all_contexts, loaded, dataset_paths=None):
+    """
+    Store the precomputed context space and loaded data in a worker process. If dataset_paths
+    (compiled datasets per experiment type) is given, the data is opened from them instead, so
+    all workers share the same memory-mapped arrays.
+    """
+    shared['all_contexts'] = all_contexts
+    shared['loaded'] = loaded
+    if dataset_paths is not None:
+        shared['loaded'] = {exp_type: dataset_cache.Dataset(path).data(1.0) for exp_type, path in dataset_paths.items()}
+
+def run_config(args, config):
+    """
+    Run one configuration of the sweep (in a worker process).
+
+    Parameters:
+        - args (argparse.Namespace): Sweep arguments (see parse_args)
+        - config (dict): exp_type, lam_1, lam_2 and alpha of this run
+
+    Returns:
+        - record (dict): Manifest record of this run
+    """
+    run_args = run_arguments(args, config)
+
+    # A run that failed or was interrupted in an earlier sweep continues from its checkpoints
+    exp_id = config_id(run_args)
+    if os.path.exists(args.out + exp_id + "/run.json"):
+        run_args.resume = exp_id
+
+    data, n_contexts = shared['loaded'][config['exp_type']]
+    start = time.time()
+    exp_id = run_experiment.run(run_args, exp_id, shared['all_contexts'], (data_handling.with_alpha(data, config['alpha']), n_contexts))
+
+    return dict(config, exp_id=exp_id, status="done", seconds=time.time() - start)
+
+def sweep(args):
+    """
+    Run every configuration in the grid given by args that is not already recorded as
+    completed in the manifest, appending a record to the manifest as each run finishes.
+
+    Parameters:
+        - args (argparse.Namespace): Sweep arguments (see parse_args)
+
+    Returns:
+        - None
+    """
+    if not os.path.exists(args.out):
+        os.makedirs(args.out)
+
+    done = read_manifest(args.out)
+    configs = [{'exp_type': exp_type, 'lam_1': lam_1, 'lam_2': lam_2, 'alpha': alpha}
+               for exp_type, lam_1, lam_2, alpha in itertools.product(args.exp_type, args.lam_1, args.lam_2, args.alpha)]
+    exp_ids = [config_id(run_arguments(args, config)) for config in configs]
+    todo = [config for config, exp_id in zip(configs, exp_ids) if exp_id not in done]
+    print("Sweep:", len(configs), "configurations,", len(configs) - len(todo), "already completed")
+    if len(todo) == 0:
+        return
+
+    # Shared precomputation (independent of lambda and alpha)
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 8)
+    loaded = {}
+    dataset_paths = None
+    exp_types = sorted(set(config['exp_type'] for config in todo))
+    if args.dataset_cache is not None:
+        dataset_paths = {}
+        for exp_type in exp_types:
+            dataset_paths[exp_type] = dataset_cache.open_dataset(args.data_dir + "/" + exp_type + "/", args.dataset_cache).path
+    else:
+        for exp_type in exp_types:
+            loaded[exp_type] = data_handling.load(args.data_dir + "/" + exp_type + "/", 1.0)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(all_contexts, loaded, dataset_paths)) as pool:
+        futures = {pool.submit(run_config, args, config): config for config in todo}
+        with open(args.out + MANIFEST, 'a', encoding='utf-8') as f:
+            for n_done, future in enumerate(as_completed(futures)):
+                config = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = dict(config, exp_id=config_id(run_arguments(args, config)), status="failed", error=repr(e))
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                print("Sweep:", record['exp_id'], record['status'], "(" + str(n_done + 1), "of", len(todo), "run)")
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    sweep(args)
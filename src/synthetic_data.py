@@ -0,0 +1,168 @@
+# -----------------------------------------------------------
+# Generate synthetic participant data for a known quantifier, in the
+# same format as the experiment data (see data_handling.load and
+# visualize.h_acc), for load testing and for checking that models
+# recover a known answer.
+#
+# Usage: python synthetic_data.py -quantifier "card_gteq(cardinality_(intersection_(A, B)), 3)" -participants 1000
+# -----------------------------------------------------------
+
+# Python Imports
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Personal Code
+import compiler
+import data_handling
+
+# Other
+import numpy as np
+
+COLORS = ['red', 'blue']
+SHAPES = [3, 100]
+N_OBJECTS = 8 # Object slots per context (obj1..obj8, shape1..shape8), unused slots are gray
+
+def parse_args():
+    """
+    Parse all command line arguments
+
+    Parameters:
+        - None
+
+    Returns:
+        - args (argparse.Namespace): The list of arguments passed in
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-quantifier",type=str, help = "Ground truth quantifier, an expression in the grammar's primitives over sets A and B (e.g. card_gteq(cardinality_(intersection_(A, B)), 3))", required=True)
+    parser.add_argument("-participants",type=int, help = "Number of participants (files)", default=10)
+    parser.add_argument("-contexts",type=int, help = "Number of contexts each participant sees", default=96)
+    parser.add_argument("-noise",type=float, help = "Probability that a context's label (corrAns) is flipped", default=0.0)
+    parser.add_argument("-final_accuracy",type=float, help = "Simulated human accuracy at the last context (rising linearly from chance at the first)", default=0.9)
+    parser.add_argument("-balance",action="store_true", help = "Make half of each participant's contexts true (when the quantifier allows it)")
+    parser.add_argument("-exp_type",type=str, help = "Name of the folder the files are written to (the experiment type to pass to run_experiment.py)", default="synthetic")
+    parser.add_argument("-out",type=str, help = "Path to the main data directory the experiment folder is created in", default="./../synthetic_data/")
+    parser.add_argument("-seed",type=int, help = "Random seed, each participant is seeded from this and its number", default=0)
+    parser.add_argument("-workers",type=int, help = "Number of processes writing files in parallel", default=os.cpu_count())
+    args = parser.parse_args()
+    return args
+
+
+def parse_quantifier(expression):
+    """
+    Parse a quantifier written in the grammar's language (i.e. as str(h.value) prints it).
+
+    Parameters:
+        - expression (str): The quantifier, e.g. card_gteq(cardinality_(intersection_(A, B)), 3)
+
+    Returns:
+        - f (function): f(A, B) over arrays of set A and set B counts, the truth value in each context (see compiler.compile_value)
+    """
+    return compiler.compile_value(compiler.parse_expression(expression))
+
+def scene_counts(colors, shapes):
+    """
+    Set A (triangles) and set B (red objects) counts of scenes, as data_handling.load computes them.
+
+    Parameters:
+        - colors (numpy array (str)): n x N_OBJECTS colors of the objects in each scene
+        - shapes (numpy array (int)): n x N_OBJECTS shapes of the objects in each scene
+
+    Returns:
+        - counts (numpy array (int)): n x 2 x |OBJECT_TYPES| counts
+    """
+    objects = np.char.add(np.char.add(colors, "_"), shapes.astype(str))
+    type_counts = np.stack([np.sum(objects == t, axis=1) for t in data_handling.OBJECT_TYPES], axis=1)
+    in_A = np.array(["3" in o for o in data_handling.OBJECT_TYPES])
+    in_B = np.array(['red' in o for o in data_handling.OBJECT_TYPES])
+    return np.stack([type_counts * in_A, type_counts * in_B], axis=1)
+
+def random_scenes(rng, n):
+    # n scenes of 1 to N_OBJECTS colored objects (the other slots are gray)
+    colors = rng.choice(COLORS, (n, N_OBJECTS))
+    shapes = rng.choice(SHAPES, (n, N_OBJECTS))
+    n_objects = rng.randint(1, N_OBJECTS + 1, n)
+    colors[np.arange(N_OBJECTS)[np.newaxis, :] >= n_objects[:, np.newaxis]] = 'gray'
+    return colors, shapes
+
+def write_participant(path, expression, contexts, noise, final_accuracy, balance, seed):
+    """
+    Generate and write one participant's file.
+
+    Parameters:
+        - path (str): Path of the file
+        - expression (str): Ground truth quantifier
+        - contexts, noise, final_accuracy, balance: See parse_args
+        - seed (int): Random seed of this participant
+
+    Returns:
+        - n_true (int): Number of contexts where the quantifier is true (before label noise)
+    """
+    rng = np.random.RandomState(seed)
+    f = parse_quantifier(expression)
+
+    if balance:
+        # Draw extra scenes and keep as close to half true ones as the quantifier allows
+        colors, shapes = random_scenes(rng, 20 * contexts)
+        counts = scene_counts(colors, shapes)
+        truth = f(counts[:, 0], counts[:, 1])
+        true_index, false_index = np.flatnonzero(truth), np.flatnonzero(~truth)
+        n_true = min(len(true_index), max(contexts // 2, contexts - len(false_index)))
+        index = np.concatenate([true_index[:n_true], false_index[:contexts - n_true]])
+        index = index[rng.permutation(len(index))]
+        colors, shapes, truth = colors[index], shapes[index], truth[index]
+    else:
+        colors, shapes = random_scenes(rng, contexts)
+        counts = scene_counts(colors, shapes)
+        truth = f(counts[:, 0], counts[:, 1])
+
+    # Labels with noise, simulated human answers (1 if correct) improving from chance to final_accuracy
+    labels = truth ^ (rng.random_sample(contexts) < noise)
+    accuracy = np.linspace(0.5, final_accuracy, contexts)
+    answers = (rng.random_sample(contexts) < accuracy).astype(int)
+
+    header = ["key_resp_monotonicity.corr"] + ["obj" + str(k) for k in range(1, N_OBJECTS + 1)] + ["corrAns"] + \
+             ["shape" + str(k) for k in range(1, N_OBJECTS + 1)]
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write(",".join(header) + "\n")
+        for j in range(contexts):
+            row = [str(answers[j])] + list(colors[j]) + ["t" if labels[j] else "f"] + [str(s) for s in shapes[j]]
+            out.write(",".join(row) + "\n")
+    return int(np.sum(truth))
+
+def generate(expression, participants, contexts, out, noise=0.0, final_accuracy=0.9, balance=False, seed=0, workers=1):
+    """
+    Write one CSV file per participant to out (in parallel).
+
+    Parameters:
+        - expression (str): Ground truth quantifier
+        - participants (int): Number of participants
+        - contexts (int): Number of contexts per participant
+        - out (str): Directory the files are written to
+        - noise, final_accuracy, balance: See parse_args
+        - seed (int): Random seed, each participant is seeded from this and its number
+        - workers (int): Number of processes writing files
+
+    Returns:
+        - n_true (int): Number of contexts (over all participants) where the quantifier is true
+    """
+    parse_quantifier(expression) # Fail before starting workers if the quantifier is not valid
+    os.makedirs(out, exist_ok=True)
+    digits = len(str(max(participants - 1, 0)))
+    paths = [os.path.join(out, "participant_" + str(p).zfill(digits) + ".csv") for p in range(participants)]
+    seeds = [int(np.random.SeedSequence([seed, p]).generate_state(1)[0]) for p in range(participants)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            n_true = pool.map(write_participant, paths, [expression] * participants, [contexts] * participants, [noise] * participants,
+                              [final_accuracy] * participants, [balance] * participants, seeds, chunksize=max(1, participants // (4 * workers)))
+            return sum(n_true)
+    return sum(write_participant(path, expression, contexts, noise, final_accuracy, balance, s) for path, s in zip(paths, seeds))
+
+if __name__ == "__main__":
+
+    args = parse_args()
+    out = args.out + "/" + args.exp_type + "/"
+    n_true = generate(args.quantifier, args.participants, args.contexts, out, args.noise, args.final_accuracy,
+                      args.balance, args.seed, args.workers)
+    print("Wrote", args.participants, "participants x", args.contexts, "contexts to", out + ",", n_true, "contexts true (before noise)")
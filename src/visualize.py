@@ -12,13 +12,17 @@ import seaborn as sns
 import numpy as np
 from sklearn.metrics import r2_score
 
-def h_acc(data_dir):
+import dataset_cache as dataset_cache_module
+import results
+
+def h_acc(data_dir, dataset_cache=None):
     """
     Calculates human accuracies from each of the human data files in the data_dir.
     This varian uses % of people who got the nth context right
 
     Parameters:
         - data_dir (str): Path to where human experiment data stored (used for plotting human performance)
+        - dataset_cache (str): Directory of compiled datasets (see dataset_cache.py) to read answers from instead of the CSV files
 
     Returns:
         - human_accuracies (numpy array): A matrix of all human accuracies (each row = human, each col = context)
@@ -26,58 +30,50 @@ def h_acc(data_dir):
     
     human_answers = []
 
-    # Load all experiment data in data directory (each participant)
-    for f_name in os.listdir(data_dir):
-        path = data_dir + f_name
-        df = pd.read_csv(open(path, 'r', encoding="utf-8"))
-        
-        # Length-n list where n = # of contexts, each element is 1 if human answered correctly, else 0
-        ans = np.array(df['key_resp_monotonicity.corr'].dropna())
+    if dataset_cache is not None:
+        human_answers = dataset_cache_module.open_dataset(data_dir, dataset_cache).human_answers()
+    else:
+        # Load all experiment data in data directory (each participant)
+        for f_name in os.listdir(data_dir):
+            path = data_dir + f_name
+            df = pd.read_csv(open(path, 'r', encoding="utf-8"))
+            
+            # Length-n list where n = # of contexts, each element is 1 if human answered correctly, else 0
+            ans = np.array(df['key_resp_monotonicity.corr'].dropna())
 
-        # Add this as a row to human accuraceies MxN where M = # humans, N = # contexts
-        human_answers.append(ans)
+            # Add this as a row to human accuraceies MxN where M = # humans, N = # contexts
+            human_answers.append(ans)
 
     human_answers = (np.array(human_answers)).T
     
-    human_accuracies = []
-    for i, row in enumerate(human_answers):
-        unique, counts = np.unique(human_answers[i, :], return_counts=True)
-        result = dict(zip(unique, counts))
-        acc = result[1.0] / len(human_answers[i, :])
-        human_accuracies.append(acc)
-
-    human_accuracies = np.array(human_accuracies)
+    # Proportion of humans who answered each context correctly
+    human_accuracies = np.mean(human_answers == 1.0, axis=1)
     
     return human_accuracies
 
-def plt_hm_acc(data_dir, out, exp_id, exp_type):
+def plt_hm_acc(data_dir, out, exp_id, exp_type, dataset_cache=None, human_percent_correct=None, dpi=400):
     """
     Plots the average human accuracy and average model accuracy per data seen.
     Saves a .png file of plot in experimental results folder.
 
     Parameters:
         - data_dir (str): Path to where human experiment data stored (used for plotting human performance)
-        - out (str): Path to where model output stored (used for plotting model performance) and path where plots (png files) will be saved
+        - out (str): Path to where model results are stored (used for plotting model performance, see results.py) and path where plots (png files) will be saved
         - exp_id (str): Identifier for this experiment run
         - exp_type (str): What kind of experiment is being run (monotone, non-convex, non-monotone, etc.)
+        - dataset_cache (str): Directory of compiled datasets to read human answers from (see h_acc)
+        - human_percent_correct (numpy array (float)): Human accuracies (see h_acc), computed from data_dir if not given
+        - dpi (int): Resolution of the plot
 
     Returns:
         - None
     """
     
     # Get model and human accuracies separately
-    model_post_preds = []
-
-    for f_name in os.listdir(out + exp_id):
-        if ".png" in f_name:
-            continue
-        path = out + exp_id + "/" + f_name
-        df = pd.read_csv(path, sep="|")
-        model_post_preds.append(df['post_pred'])
-
-    model_post_preds = (np.array(model_post_preds)).T
-    avg_mod_post_preds = np.average(model_post_preds, axis=1)
-    human_percent_correct = h_acc(data_dir)
+    model_post_preds = results.load(out, exp_id).post_preds
+    avg_mod_post_preds = np.nanmean(model_post_preds, axis=0)
+    if human_percent_correct is None:
+        human_percent_correct = h_acc(data_dir, dataset_cache)
 
     # Plot
     plt.figure()
@@ -95,7 +91,7 @@ def plt_hm_acc(data_dir, out, exp_id, exp_type):
     plt.legend(["% Humans Correct", 'Avg. Posterior Predictive'])
 
     # plt.show()
-    plt.savefig(out + exp_id + "/" + exp_id + '_acc.png', dpi=400)
+    plt.savefig(out + exp_id + "/" + exp_id + '_acc.png', dpi=dpi)
     plt.close('all')
 
 # plt_hm_acc("./../data/between_3_6/", "./../results/", exp_id="01203813_between_3_6_0.0_0.0", exp_type="between_3_6")
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import checkpoint
+import run_experiment
+import synthetic_data
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    synthetic_data.generate("card_gteq(cardinality_(intersection_(A, B)), 3)", 2, 4, str(tmp_path / "data" / "synthetic"), seed=0)
+    return str(tmp_path / "data")
+
+def run_args(data_dir, out, *argv):
+    return run_experiment.parse_args(["-exp_type", "synthetic", "-data_dir", data_dir, "-out", out, "-sample_steps", "5",
+                                      "-seed", "0", "-no_plot"] + list(argv))
+
+def test_new_run_does_not_reuse_results_folder(tmp_path, data_dir):
+    out = str(tmp_path / "results") + "/"
+    run_experiment.run(run_args(data_dir, out), "exp")
+    with pytest.raises(FileExistsError):
+        run_experiment.run(run_args(data_dir, out), "exp")
+
+def test_resume_checks_options(tmp_path, data_dir):
+    out = str(tmp_path / "results") + "/"
+    exp_id = run_experiment.run(run_args(data_dir, out), "exp")
+    state = checkpoint.load(checkpoint.path(out, exp_id, 0))
+    assert state['done'] and state['options']['sample_steps'] == 5
+
+    # Resuming a finished run reads every model from its checkpoint
+    assert run_experiment.run(run_args(data_dir, out, "-resume", exp_id)) == exp_id
+
+    state['options']['sample_steps'] = 50
+    checkpoint.save(checkpoint.path(out, exp_id, 0), state)
+    with pytest.raises(Exception, match="other options"):
+        run_experiment.run(run_args(data_dir, out, "-resume", exp_id))
@@ -0,0 +1,115 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import cache
+import compiler
+
+# Object types counted in each position of a set's count vector (as data_handling.OBJECT_TYPES)
+OBJECT_TYPES = ['red_3', 'blue_3', 'red_100', 'blue_100']
+
+SET_OPERATIONS = ['intersection_', 'union_', 'setdifference_']
+COMPARISONS = ['card_gt', 'card_gteq', 'card_lt', 'card_lteq', 'card_eq']
+
+
+def random_tree(rng, nonterminal, depth):
+    """
+    A random expression of the quant grammar (grammars.py), as compiler.Node trees with string terminals.
+    """
+    if nonterminal == 'SET':
+        if depth <= 1 or rng.random_sample() < 0.4:
+            return str(rng.choice(['A', 'B']))
+        return compiler.Node(str(rng.choice(SET_OPERATIONS)), [random_tree(rng, 'SET', depth - 1), random_tree(rng, 'SET', depth - 1)])
+    if nonterminal == 'NUM':
+        return str(rng.randint(0, 10))
+    choice = rng.randint(0, 4) if depth > 2 else 1
+    if choice == 0:
+        return compiler.Node('subset_', [random_tree(rng, 'SET', depth - 1), random_tree(rng, 'SET', depth - 1)])
+    if choice == 1:
+        card = compiler.Node('cardinality_', [random_tree(rng, 'SET', depth - 2)])
+        return compiler.Node(str(rng.choice(COMPARISONS)), [card, random_tree(rng, 'NUM', depth - 1)])
+    if choice == 2:
+        return compiler.Node('not_', [random_tree(rng, 'BOOL', depth - 1)])
+    return compiler.Node(str(rng.choice(['and_', 'or_'])), [random_tree(rng, 'BOOL', depth - 1), random_tree(rng, 'BOOL', depth - 1)])
+
+def multiset(counts):
+    return Counter({t: int(c) for t, c in zip(OBJECT_TYPES, counts) if c > 0})
+
+def reference(node, A, B):
+    """
+    Value of an expression on one context, with the sets as multisets and the primitives' definitions.
+    """
+    if isinstance(node, str):
+        return {'A': A, 'B': B}[node] if node in ('A', 'B') else int(node)
+    args = [reference(a, A, B) for a in node.args]
+    return {'intersection_': lambda x, y: x & y,
+            'union_': lambda x, y: x | y,
+            'setdifference_': lambda x, y: x - y,
+            'subset_': lambda x, y: all(x[t] <= y[t] for t in x),
+            'cardinality_': lambda x: sum(x.values()),
+            'card_gt': lambda x, y: x > y,
+            'card_gteq': lambda x, y: x >= y,
+            'card_lt': lambda x, y: x < y,
+            'card_lteq': lambda x, y: x <= y,
+            'card_eq': lambda x, y: x == y,
+            'and_': lambda x, y: x and y,
+            'or_': lambda x, y: x or y,
+            'not_': lambda x: not x}[node.name](*args)
+
+@pytest.fixture(scope="module")
+def contexts():
+    rng = np.random.RandomState(0)
+    A = rng.randint(0, 4, size=(200, len(OBJECT_TYPES)))
+    B = rng.randint(0, 4, size=(200, len(OBJECT_TYPES)))
+    return A, B
+
+def test_compiled_matches_reference(contexts):
+    A, B = contexts
+    rng = np.random.RandomState(1)
+    values = cache.LRUCache()
+    for _ in range(300):
+        tree = random_tree(rng, 'BOOL', 5)
+        expected = np.array([bool(reference(tree, multiset(a), multiset(b))) for a, b in zip(A, B)])
+        assert np.array_equal(compiler.compile_value(tree)(A, B), expected), str(tree)
+        # Subtree values are shared between trees through the cache
+        assert np.array_equal(compiler.evaluate_value(tree, A, B, values), expected), str(tree)
+        # Printed and parsed again, as restored from checkpoints
+        assert np.array_equal(compiler.compile_value(compiler.parse_expression(str(tree)))(A, B), expected), str(tree)
+
+def test_cached_subtree_is_not_walked(contexts):
+    A, B = contexts
+    values = cache.LRUCache()
+    card = compiler.Node('cardinality_', [compiler.Node('intersection_', ['A', 'B'])])
+    compiler.evaluate_value(compiler.Node('card_gteq', [card, '3']), A, B, values)
+    assert (values.hits, values.misses) == (0, 3)
+    # Only the new root is computed, its cached argument is one hit (its subtree is not looked up)
+    compiler.evaluate_value(compiler.Node('card_lt', [card, '2']), A, B, values)
+    assert (values.hits, values.misses) == (1, 4)
+    compiler.evaluate_value(compiler.Node('card_lt', [card, '2']), A, B, values)
+    assert (values.hits, values.misses) == (2, 4)
+
+def test_cannot_compile_unknown_primitive(contexts):
+    A, B = contexts
+    with pytest.raises(compiler.CompileError):
+        compiler.compile_value(compiler.Node('intersect_card_gteq_3', ['A', 'B']))
+    with pytest.raises(compiler.CompileError):
+        compiler.evaluate_value(compiler.Node('intersect_card_gteq_3', ['A', 'B']), A, B, cache.LRUCache())
+
+def test_compiled_matches_interpreter(tmp_path):
+    # Hypotheses sampled from the grammar, compiled and evaluated by LOTlib3 on CountSets
+    pytest.importorskip("LOTlib3")
+    import random
+    import data_handling
+    import grammars
+    import hypotheses
+    import primitives
+
+    random.seed(0)
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 4, cache_dir=str(tmp_path) + "/")
+    for _ in range(200):
+        h = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+        interpreted = np.array([bool(h.eval_q_m(context)) for context in all_contexts])
+        assert np.array_equal(h.eval_counts(all_contexts.counts), interpreted), str(h.value)
+        assert np.array_equal(h.truth_vector(), interpreted), str(h.value)
@@ -0,0 +1,66 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import data_handling
+import synthetic_data
+
+
+def load_sequential(data_dir):
+    # The data files read one row and column at a time, as data_handling.load did before it was vectorized
+    contexts = []
+    n_contexts = 0
+    for f_name in os.listdir(data_dir):
+        n_contexts = 0
+        df = pd.read_csv(open(data_dir + f_name, 'r', encoding="utf-8"))
+        df = df.loc[:, 'obj1':'shape8'].dropna()
+        for index, row in df.iterrows():
+            n_contexts += 1
+            context_objects = []
+            label = None
+            shape_num = 0
+            for col in df:
+                if "obj" in col:
+                    context_objects.append(row[col])
+                elif "corrAns" in col:
+                    label = (row[col] == "t")
+                elif "shape" in col:
+                    context_objects[shape_num] = context_objects[shape_num] + "_" + str(int(row[col]))
+                    shape_num += 1
+            set_A = Counter(o for o in context_objects if 'gray' not in o and "3" in o)
+            set_B = Counter(o for o in context_objects if 'gray' not in o and 'red' in o)
+            contexts.append((set_A, set_B, label))
+    return contexts, n_contexts
+
+def counter(count_set):
+    return Counter({t: int(c) for t, c in zip(data_handling.OBJECT_TYPES, count_set.counts) if c > 0})
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_load_matches_sequential(tmp_path, threads):
+    data_dir = str(tmp_path / "synthetic") + "/"
+    synthetic_data.generate("card_gteq(cardinality_(intersection_(A, B)), 3)", 6, 25, data_dir, noise=0.1, seed=0)
+    data, n_contexts = data_handling.load(data_dir, 0.9, threads=threads)
+    expected, expected_n = load_sequential(data_dir)
+
+    assert n_contexts == expected_n and len(data) == len(expected)
+    for datum, (set_A, set_B, label) in zip(data, expected):
+        assert counter(datum.input[0]) == set_A
+        assert counter(datum.input[1]) == set_B
+        assert datum.output == label and datum.alpha == 0.9
+
+def test_load_rejects_unknown_objects():
+    # The sample data has no shape columns, so its objects have no known type
+    with pytest.raises(Exception, match="Unknown object"):
+        data_handling.load(os.path.join(os.path.dirname(__file__), "..", "sample_data", "at_most_2") + "/", 0.9)
+
+def test_cached_contexts(tmp_path):
+    contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    cached = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    assert np.array_equal(cached.counts, contexts.counts) and cached.object_types == contexts.object_types
+    # Written through temporary files, which are not left behind
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".csv", ".npz"]
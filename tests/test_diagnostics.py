@@ -0,0 +1,39 @@
+import numpy as np
+
+import diagnostics
+
+
+def test_rhat_identical_chains():
+    rng = np.random.RandomState(0)
+    trace = rng.normal(size=2000)
+    assert abs(diagnostics.rhat(np.stack([trace, trace, trace])) - 1.0) < 0.01
+    # Chains that never move and agree
+    assert diagnostics.rhat(np.full((2, 100), -3.5)) == 1.0
+
+def test_rhat_disjoint_chains():
+    rng = np.random.RandomState(0)
+    traces = np.stack([rng.normal(0.0, 1.0, 1000), rng.normal(50.0, 1.0, 1000)])
+    assert diagnostics.rhat(traces) > 10.0
+    # Chains stuck at different values
+    assert diagnostics.rhat(np.stack([np.zeros(100), np.ones(100)])) == float('inf')
+    # One chain that drifts
+    assert diagnostics.rhat(np.linspace(0.0, 100.0, 1000)[np.newaxis, :] + rng.normal(size=(1, 1000))) > 1.5
+
+def test_rhat_needs_steps():
+    assert np.isnan(diagnostics.rhat(np.zeros((2, 3))))
+
+def test_ess():
+    rng = np.random.RandomState(0)
+    n = 4000
+    independent = rng.normal(size=n)
+    assert 0.8 * n < diagnostics.ess(independent) < 1.2 * n
+
+    # An autocorrelated chain (AR(1) with coefficient 0.9) is worth about n (1 - 0.9) / (1 + 0.9) samples
+    correlated = np.zeros(n)
+    for t in range(1, n):
+        correlated[t] = 0.9 * correlated[t - 1] + rng.normal()
+    assert 0.5 * n / 19 < diagnostics.ess(correlated) < 2.0 * n / 19
+
+    # Summed over chains, and a chain that never moves is worth one sample
+    assert diagnostics.ess(np.stack([independent, independent])) == 2 * diagnostics.ess(independent)
+    assert diagnostics.ess(np.zeros((3, 100))) == 3.0
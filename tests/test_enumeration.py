@@ -0,0 +1,75 @@
+from math import log
+
+import numpy as np
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import compiler
+import data_handling
+import enumeration
+import grammars
+
+
+@pytest.fixture(scope="module")
+def grammar():
+    return grammars.create_grammar("quant")
+
+@pytest.fixture(scope="module")
+def all_contexts(tmp_path_factory):
+    return data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path_factory.mktemp("contexts")) + "/")
+
+def all_expressions(grammar, nt, depth):
+    """
+    Every expression of nt with depth up to depth (terminals have depth 1) and its log probability under the grammar.
+    """
+    if depth == 0:
+        return []
+    total = sum(r.p for r in grammar.rules[nt])
+    expressions = []
+    for r in grammar.rules[nt]:
+        lp = log(r.p / total)
+        if not r.to:
+            expressions.append((r.name, lp))
+        elif len(r.to) == 1:
+            expressions += [(r.name + "(" + e + ")", lp + p) for e, p in all_expressions(grammar, r.to[0], depth - 1)]
+        else:
+            second = all_expressions(grammar, r.to[1], depth - 1)
+            expressions += [(r.name + "(" + e1 + ", " + e2 + ")", lp + p1 + p2)
+                            for e1, p1 in all_expressions(grammar, r.to[0], depth - 1) for e2, p2 in second]
+    return expressions
+
+def test_space_matches_every_expression(grammar, all_contexts):
+    # Every expression up to depth 3 evaluated with the compiler, grouped by truth table
+    A, B = all_contexts.A, all_contexts.B
+    best = {}
+    for e, lp in all_expressions(grammar, grammar.start, 3):
+        key = np.packbits(compiler.compile_value(compiler.parse_expression(e))(A, B)).tobytes()
+        best[key] = max(best.get(key, -np.inf), lp)
+
+    space = enumeration.enumerate_space(grammar, all_contexts, 3)
+    keys = [np.packbits(row).tobytes() for row in space.truth]
+    assert sorted(keys) == sorted(best)
+    for e, row, key, lp in zip(space.expressions, space.truth, keys, space.log_probability):
+        assert np.array_equal(compiler.compile_value(compiler.parse_expression(e))(A, B), row), e
+        assert np.isclose(lp, best[key]), e
+
+def test_truncation_is_reported(grammar, all_contexts, capsys):
+    assert not enumeration.enumerate_space(grammar, all_contexts, 3).truncated
+    space = enumeration.enumerate_space(grammar, all_contexts, 3, max_size=10)
+    assert space.truncated and len(space) <= 10
+    assert "WARNING" in capsys.readouterr().out
+
+def test_max_nodes(grammar, all_contexts):
+    space = enumeration.enumerate_space(grammar, all_contexts, 4, max_nodes=5)
+    full = enumeration.enumerate_space(grammar, all_contexts, 4)
+    assert 0 < len(space) < len(full)
+    # Nodes of an expression: one per primitive or terminal
+    assert all(len(e.replace("(", " ").replace(",", " ").replace(")", " ").split()) <= 5 for e in space.expressions)
+
+def test_cached_space(grammar, all_contexts, tmp_path):
+    space = enumeration.load_or_enumerate(grammar, all_contexts, 3, max_size=10, cache_dir=str(tmp_path))
+    cached = enumeration.load_or_enumerate(grammar, all_contexts, 3, max_size=10, cache_dir=str(tmp_path))
+    assert cached.truncated and cached.expressions == space.expressions
+    # Written through a temporary file, which is not left behind
+    assert [p.suffix for p in tmp_path.iterdir()] == [".npz"]
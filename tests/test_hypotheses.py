@@ -0,0 +1,147 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import data_handling
+import grammars
+import hypotheses
+import primitives
+
+
+def fresh_prior(seed, grammar, all_contexts):
+    # Prior of the hypothesis generated with seed, with empty in-process caches
+    capacity = hypotheses.prior_components.capacity
+    hypotheses.resize_caches(0)
+    hypotheses.resize_caches(capacity)
+    return prior(seed, grammar, all_contexts)
+
+def prior(seed, grammar, all_contexts):
+    random.seed(seed)
+    h = hypotheses.create_hypothesis("A", grammar, 1.0, 1.0, all_contexts)
+    return str(h.value), h.compute_prior()
+
+def test_prior_components_follow_grammar_and_contexts(tmp_path):
+    # The same expressions scored in one context space and then in another (as in one process
+    # running several experiments) get the priors of the second space, not the cached ones
+    grammar = grammars.create_grammar("quant")
+    small = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    large = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 4, cache_dir=str(tmp_path) + "/")
+    seeds = range(40)
+    expected = {seed: fresh_prior(seed, grammar, large) for seed in seeds}
+    assert any(fresh_prior(seed, grammar, small)[1] != expected[seed][1] for seed in seeds)
+
+    for all_contexts in (small, large):
+        for seed in seeds:
+            prior(seed, grammar, all_contexts)
+    assert {seed: prior(seed, grammar, large) for seed in seeds} == expected
+
+    other_grammar = grammars.create_grammar("quant")
+    expected = {seed: fresh_prior(seed, other_grammar, large) for seed in seeds}
+    for g in (grammar, other_grammar):
+        for seed in seeds:
+            prior(seed, g, small)
+            prior(seed, g, large)
+    assert {seed: prior(seed, other_grammar, large) for seed in seeds} == expected
+
+def test_prior_components_shared_by_copies(tmp_path):
+    # Copies of the grammar and contexts (as each task sent to a worker process brings) use the same cached prior components
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    expected = fresh_prior(0, grammar, all_contexts)
+    hits = hypotheses.prior_components.hits
+    assert prior(0, *pickle.loads(pickle.dumps((grammar, all_contexts)))) == expected
+    assert hypotheses.prior_components.hits == hits + 1
+
+def test_subtree_values_shared_by_copies(tmp_path):
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    random.seed(0)
+    expected = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts).truth_vector()
+    misses = hypotheses.subtree_values.misses
+    random.seed(0)
+    copied = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, pickle.loads(pickle.dumps(all_contexts)))
+    assert (copied.truth_vector() == expected).all()
+    # Every subtree is read from the cache
+    assert hypotheses.subtree_values.misses == misses
+
+def test_degrees_match_per_context_models(tmp_path):
+    # Degrees from the sub/supermodel index and conservation lookup agree with checking the
+    # sub/super/conservation models of every context one at a time (sub_q_m, super_q_m, cons_q_m)
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    random.seed(0)
+    h_space = [hypotheses.create_hypothesis("A", grammar, 1.0, 1.0, all_contexts) for _ in range(40)]
+    for h in h_space:
+        truth = np.array([bool(h.eval_q_m(m)) for m in all_contexts])
+        sub = np.array([h.sub_q_m(m) for m in all_contexts])
+        sup = np.array([h.super_q_m(m) for m in all_contexts])
+        cons = np.array([bool(h.cons_q_m(m)) for m in all_contexts])
+        expected = {'M_t': truth.mean(), 'M_f': (~truth).mean()}
+        for name, other in (('sub', sub), ('super', sup), ('cons', cons)):
+            expected[name + '_t'], expected[name + '_f'] = other.mean(), (~other).mean()
+            for t, m in ((True, truth), (False, ~truth)):
+                expected[('M_t_' if t else 'M_f_') + name + '_t'] = (m & other).mean()
+                expected[('M_t_' if t else 'M_f_') + name + '_f'] = (m & ~other).mean()
+
+        probs = h.compute_degree_probs()
+        assert probs.keys() == expected.keys()
+        for key in expected:
+            assert probs[key] == pytest.approx(expected[key]), (str(h.value), key)
+        h.value.probs = probs
+        assert h.compute_degree_monotonicity() == pytest.approx(float(hypotheses.degree_monotonicity(expected)))
+        assert h.compute_degree_conservativity() == pytest.approx(float(hypotheses.degree_conservativity(expected)))
+
+    # The same for a whole space at once
+    mono, cons = hypotheses.space_degrees(h_space, all_contexts)
+    assert mono == pytest.approx([h.compute_degree_monotonicity() for h in h_space])
+    assert cons == pytest.approx([h.compute_degree_conservativity() for h in h_space])
+
+def random_data(all_contexts, n, seed):
+    # Labeled data on contexts of all_contexts, with repeated contexts and two noise levels
+    rng = np.random.RandomState(seed)
+    index = rng.randint(0, 12, n)
+    data = data_handling.make_contexts(all_contexts.counts[index], (rng.random_sample(n) < 0.5).tolist(), 0.9)
+    for d in data[::3]:
+        d.alpha = 0.6
+    return data
+
+def test_interned_likelihood_matches_per_datum(tmp_path):
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    data = random_data(all_contexts, 60, 0)
+    interned = data_handling.intern(data, all_contexts)
+    assert isinstance(interned, data_handling.InternedData)
+    for seed in range(40):
+        random.seed(seed)
+        h = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+        random.seed(seed)
+        other = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+        expected = sum(h.compute_single_likelihood(d) for d in data)
+        assert h.compute_likelihood(interned) == pytest.approx(expected), str(h.value)
+        assert other.compute_likelihood(list(data)) == pytest.approx(expected), str(h.value)
+        assert h.likelihood_vector(interned) == pytest.approx([h.compute_single_likelihood(d) for d in data])
+
+def test_warm_started_likelihood_matches_from_scratch(tmp_path):
+    # When data extends the data last scored, only the new data is evaluated
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    data = random_data(all_contexts, 30, 1)
+    for seed in range(20):
+        random.seed(seed)
+        h = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+        scored = []
+        likelihood_vector = h.likelihood_vector
+        h.likelihood_vector = lambda d: scored.append(len(d)) or likelihood_vector(d)
+        for n in (10, 11, 20, 30):
+            random.seed(seed)
+            fresh = hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts)
+            assert h.compute_likelihood(data[:n]) == pytest.approx(fresh.compute_likelihood(data[:n])), str(h.value)
+        assert scored == [10, 1, 9, 10]
+
+        # Data that does not extend the data last scored is scored from scratch
+        assert h.compute_likelihood(data[5:25]) == pytest.approx(sum(h.compute_single_likelihood(d) for d in data[5:25]))
+        assert scored[-1] == 20
@@ -0,0 +1,42 @@
+import numpy as np
+
+import results
+
+
+def model(rng, n_contexts, n_hypotheses, steps=True):
+    posterior_probs = rng.random_sample((n_hypotheses, n_contexts))
+    return results.model_result(rng.random_sample(n_contexts), posterior_probs / posterior_probs.sum(axis=0),
+                                ["h" + str(k) + "_" + str(n_hypotheses) for k in range(n_hypotheses)], rng.normal(size=n_hypotheses),
+                                rng.random_sample(n_hypotheses), rng.random_sample(n_hypotheses),
+                                convergence=[(1.0 + j, 10.0 * j) for j in range(n_contexts)],
+                                steps=list(range(n_contexts)) if steps else None)
+
+def test_round_trip(tmp_path):
+    rng = np.random.RandomState(0)
+    # Models with different numbers of contexts and hypotheses (the second ends early, the last has no hypotheses)
+    models = [model(rng, 6, 3), model(rng, 4, 5, steps=False), model(rng, 6, 1), model(rng, 6, 0)]
+    metadata = {'exp_type': "synthetic", 'seed': 3, 'caches': {'prior_lru': {'hits': 1, 'misses': 2}}}
+    results.save(str(tmp_path / "r_results.npz"), models, metadata)
+    loaded = results.Results(str(tmp_path / "r_results.npz"))
+
+    assert len(loaded) == 4 and loaded.metadata == metadata
+    assert list(loaded.n_contexts) == [6, 4, 6, 6]
+    for i, m in enumerate(models):
+        n = len(m['post_preds'])
+        for key in ('post_preds', 'rhat', 'ess', 'steps'):
+            assert np.array_equal(getattr(loaded, key)[i, :n], m[key], equal_nan=True)
+            # Padded with NaN past the model's last context
+            assert np.all(np.isnan(getattr(loaded, key)[i, n:]))
+
+        space = loaded.hypotheses(i)
+        assert list(space['expressions']) == m['expressions']
+        for key in ('priors', 'degree_monotonicity', 'degree_conservativity'):
+            assert np.array_equal(space[key], m[key])
+        assert space['posterior_probs'].shape == (len(m['expressions']), n)
+        assert np.array_equal(space['posterior_probs'], m['posterior_probs'])
+
+    assert np.all(np.isnan(loaded.steps[1]))
+
+def test_no_models(tmp_path):
+    results.save(str(tmp_path / "r_results.npz"), [], {})
+    assert len(results.Results(str(tmp_path / "r_results.npz"))) == 0
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import run_experiment
+
+
+def posterior_predictive_loop(priors, likelihoods):
+    # One context at a time, as train computed the posterior predictive before it was vectorized
+    H, n = likelihoods.shape
+    post_preds = np.zeros(n)
+    posterior_probs = np.zeros((H, n))
+    for j in range(n):
+        scores = np.array([priors[k] + np.sum(likelihoods[k, :j]) for k in range(H)])
+        probs = np.exp(scores - np.max(scores))
+        probs /= np.sum(probs)
+        posterior_probs[:, j] = probs
+        post_preds[j] = sum(np.exp(likelihoods[k, j]) * probs[k] for k in range(H))
+    return post_preds, posterior_probs
+
+@pytest.mark.parametrize("H,n", [(1, 1), (5, 30), (40, 96)])
+def test_posterior_predictive_matches_loop(H, n):
+    rng = np.random.RandomState(H * n)
+    priors = rng.normal(-10.0, 5.0, size=H)
+    priors[-1] = -np.inf if H > 1 else priors[-1] # Hypotheses over maxnodes have a prior of -Infinity
+    alpha = 0.99
+    correct = rng.random_sample((H, n)) < 0.7
+    likelihoods = np.log(alpha * correct + (1.0 - alpha) / 2.0)
+
+    post_preds, posterior_probs = run_experiment.posterior_predictive(priors, likelihoods)
+    expected_preds, expected_probs = posterior_predictive_loop(priors, likelihoods)
+    assert np.allclose(post_preds, expected_preds)
+    assert np.allclose(posterior_probs, expected_probs)
+
+def test_profile_counts_interned_evaluations(tmp_path):
+    # Likelihood evaluations are counted whether or not the data is interned
+    import random
+    import data_handling
+    import grammars
+    import hypotheses
+    import profiling
+
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    data = data_handling.make_contexts(all_contexts.counts[:10], [True, False] * 5, 0.9)
+    interned = data_handling.intern(data, all_contexts)
+    assert isinstance(interned, data_handling.InternedData)
+
+    run_experiment.profile_training()
+    random.seed(0)
+    for d in (data, interned):
+        profiling.reset()
+        hypotheses.create_hypothesis("A", grammar, 0.0, 0.0, all_contexts).compute_likelihood(d)
+        phases = profiling.summary()['phases']
+        assert sum(phase['evaluations'] for phase in phases.values()) == len(data)
+
+def test_adaptive_sampling_stops_on_converged_chain(tmp_path, monkeypatch):
+    import random
+    import data_handling
+    import grammars
+    import hypotheses
+    import primitives
+
+    grammar = grammars.create_grammar("quant")
+    all_contexts = data_handling.generate_possible_contexts(['red','blue'], [3.0, 100.0], 3, cache_dir=str(tmp_path) + "/")
+    data = data_handling.make_contexts(all_contexts.counts[:20], [True, False] * 10, 0.9)
+    random.seed(0)
+    h0 = hypotheses.create_hypothesis("A", grammar, 1.0, 1.0, all_contexts)
+
+    def converged(h, data, steps):
+        # A chain that has converged: it stays in the same state
+        h.compute_posterior(data)
+        for _ in range(steps):
+            yield h
+    monkeypatch.setattr(run_experiment, "MetropolisHastingsSampler", converged)
+
+    fixed_h_space = {}
+    h, steps = run_experiment.mcmc(data, None, "test", h0, grammar, 1000, 1, fixed_h_space, adaptive=(100, 1000, 50))
+    assert steps == 100
+    assert list(fixed_h_space) == [h0.signature()] and np.isfinite(fixed_h_space[h0.signature()].posterior_score)
+
+    # Not before min_steps, and every step without adaptive sampling
+    assert run_experiment.mcmc(data, None, "test", h0, grammar, 1000, 1, {}, adaptive=(300, 1000, 50))[1] == 300
+    assert run_experiment.mcmc(data, None, "test", h0, grammar, 1000, 1, {})[1] == 1000
+
+def test_swap_acceptance():
+    from types import SimpleNamespace
+
+    temperatures = [1.0, 2.0]
+    # A hotter chain in a more likely state always swaps with the colder one
+    hs = [SimpleNamespace(likelihood=-10.0), SimpleNamespace(likelihood=-4.0)]
+    cold, hot = hs
+    assert run_experiment.swap_states(hs, temperatures, np.random.RandomState(0)) == [True]
+    assert hs == [hot, cold]
+
+    # Otherwise the swap is accepted with probability exp((1/T_k - 1/T_k+1) (L_k+1 - L_k)), decided by the random state
+    hs = [SimpleNamespace(likelihood=-4.0), SimpleNamespace(likelihood=-6.0)]
+    accept = np.exp(0.5 * -2.0)
+    draws = np.random.RandomState(1).random_sample(500)
+    rng = np.random.RandomState(1)
+    swapped = [run_experiment.swap_states(list(hs), temperatures, rng)[0] for _ in range(500)]
+    assert swapped == list(draws < accept)
+    assert abs(np.mean(swapped) - accept) < 0.05
+
+    # Every adjacent pair is proposed in turn, from the coldest chain
+    hs = [SimpleNamespace(likelihood=-9.0), SimpleNamespace(likelihood=-5.0), SimpleNamespace(likelihood=-1.0)]
+    states = list(hs)
+    assert run_experiment.swap_states(hs, [1.0, 2.0, 4.0], np.random.RandomState(0)) == [True, True]
+    assert hs == [states[1], states[2], states[0]]
@@ -0,0 +1,35 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("LOTlib3")
+
+import sweep
+import synthetic_data
+
+
+def test_sweep_runs_every_config(tmp_path):
+    # A tiny sweep end to end: every run must complete (failed runs are only recorded in the manifest)
+    synthetic_data.generate("card_gteq(cardinality_(intersection_(A, B)), 3)", 2, 4, str(tmp_path / "data" / "synthetic"), seed=0)
+    out = str(tmp_path / "results") + "/"
+    args = sweep.parse_args(["-exp_type", "synthetic", "-lam_1", "0.0", "0.5", "-data_dir", str(tmp_path / "data"),
+                             "-out", out, "-sample_steps", "5", "-seed", "0", "-no_plot"])
+    sweep.sweep(args)
+
+    with open(out + sweep.MANIFEST, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 2
+    assert all(record['status'] == "done" for record in records), records
+    assert set(sweep.read_manifest(out)) == set(record['exp_id'] for record in records)
+    assert os.path.exists(out + sweep.PRIOR_CACHE)
+
+def test_config_id_depends_on_every_option():
+    args = sweep.parse_args(["-exp_type", "synthetic"])
+    config = {'exp_type': "synthetic", 'lam_1': 0.0, 'lam_2': 0.0, 'alpha': 0.99}
+    exp_id = sweep.config_id(sweep.run_arguments(args, config))
+    assert exp_id == sweep.config_id(sweep.run_arguments(args, config))
+    assert exp_id != sweep.config_id(sweep.run_arguments(sweep.parse_args(["-exp_type", "synthetic", "-sample_steps", "50"]), config))
+    assert exp_id != sweep.config_id(sweep.run_arguments(args, dict(config, alpha=0.9)))
+    # Where caches are does not change results
+    assert exp_id == sweep.config_id(sweep.run_arguments(sweep.parse_args(["-exp_type", "synthetic", "-prior_cache", "other.sqlite"]), config))